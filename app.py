@@ -1,20 +1,40 @@
+import asyncio
+import atexit
+import hashlib
+import heapq
+import itertools
 import json
 import logging
 import os
+import random
 import re
+import sqlite3
 import threading
+import time
 import uuid
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
 from json import JSONDecodeError
+
+try:
+    import fcntl
+except ImportError:  # Windows: tidak ada flock, proses tunggal selalu jadi leader.
+    fcntl = None
+import httplib2
 import requests
+from apscheduler.jobstores.base import JobLookupError
 from apscheduler.schedulers.background import BackgroundScheduler
 from dotenv import load_dotenv
 from duckduckgo_search import DDGS
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest, MediaFileUpload
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
@@ -27,6 +47,10 @@ BLACKBOX_API_KEY = os.getenv("BLACKBOX_API_KEY", "").strip()
 PARENT_FOLDER_ID = os.getenv("PARENT_FOLDER_ID", "").strip()
 ID_KALENDER_KAMU = os.getenv("ID_KALENDER_KAMU", "primary").strip()
 DB_FILE = "jadwal_meeting.json"
+WIB = timezone(timedelta(hours=7))
+MEETING_STORAGE_BACKEND = os.getenv("MEETING_STORAGE_BACKEND", "sqlite").strip().lower()
+MEETING_WRITE_COALESCE_MS = float(os.getenv("MEETING_WRITE_COALESCE_MS", "0"))
+MEETING_JOURNAL_COMPACT_OPS = int(os.getenv("MEETING_JOURNAL_COMPACT_OPS", "500"))
 
 BOT_TRIGGERS = [
     "hunky",
@@ -45,11 +69,73 @@ SCOPES = [
 MEETING_RETENTION_DAYS = int(os.getenv("MEETING_RETENTION_DAYS", "30"))
 MEETING_AUTO_DELETE_AFTER_HOURS = float(os.getenv("MEETING_AUTO_DELETE_AFTER_HOURS", "3"))
 WEB_SEARCH_MAX_RESULTS = int(os.getenv("WEB_SEARCH_MAX_RESULTS", "3"))
+WEB_SEARCH_PROVIDER = os.getenv("WEB_SEARCH_PROVIDER", "ddg").strip().lower()
+WEB_SEARCH_FIXTURE_FILE = os.getenv("WEB_SEARCH_FIXTURE_FILE", "")
+WEB_SEARCH_STUB_LATENCY_MS = float(os.getenv("WEB_SEARCH_STUB_LATENCY_MS", "300"))
+WEB_SEARCH_STUB_JITTER_MS = float(os.getenv("WEB_SEARCH_STUB_JITTER_MS", "100"))
+WEB_SEARCH_STUB_EMPTY_RATE = float(os.getenv("WEB_SEARCH_STUB_EMPTY_RATE", "0"))
+WEB_SEARCH_CACHE_SIZE = int(os.getenv("WEB_SEARCH_CACHE_SIZE", "512"))
+WEB_SEARCH_CACHE_TTL_SECONDS = float(os.getenv("WEB_SEARCH_CACHE_TTL_SECONDS", "1800"))
+WEB_SEARCH_CACHE_TTL_REALTIME_SECONDS = float(os.getenv("WEB_SEARCH_CACHE_TTL_REALTIME_SECONDS", "60"))
+WEB_SEARCH_MAX_WORKERS = int(os.getenv("WEB_SEARCH_MAX_WORKERS", "8"))
+WEB_SEARCH_HEDGE_DELAY_MS = float(os.getenv("WEB_SEARCH_HEDGE_DELAY_MS", "400"))
+WEB_SEARCH_DEADLINE_SECONDS = float(os.getenv("WEB_SEARCH_DEADLINE_SECONDS", "10"))
+DRIVE_SEARCH_CACHE_SIZE = int(os.getenv("DRIVE_SEARCH_CACHE_SIZE", "256"))
+DRIVE_SEARCH_CACHE_TTL_SECONDS = float(os.getenv("DRIVE_SEARCH_CACHE_TTL_SECONDS", "120"))
+DRIVE_INDEX_ENABLED = os.getenv("DRIVE_INDEX_ENABLED", "true").lower() in {"1", "true", "yes", "on"}
+DRIVE_INDEX_DB_FILE = os.getenv("DRIVE_INDEX_DB_FILE", "drive_index.sqlite3")
+DRIVE_INDEX_SYNC_INTERVAL_SECONDS = float(os.getenv("DRIVE_INDEX_SYNC_INTERVAL_SECONDS", "60"))
+DRIVE_INDEX_FUZZY_MIN_OVERLAP = float(os.getenv("DRIVE_INDEX_FUZZY_MIN_OVERLAP", "0.6"))
+DRIVE_UPLOAD_CHUNK_MB = float(os.getenv("DRIVE_UPLOAD_CHUNK_MB", "5"))
+DRIVE_UPLOAD_ASYNC_THRESHOLD_MB = float(os.getenv("DRIVE_UPLOAD_ASYNC_THRESHOLD_MB", "5"))
+DRIVE_UPLOAD_MAX_WORKERS = int(os.getenv("DRIVE_UPLOAD_MAX_WORKERS", "2"))
+DRIVE_UPLOAD_MAX_RETRIES = int(os.getenv("DRIVE_UPLOAD_MAX_RETRIES", "5"))
+DRIVE_UPLOAD_DEDUP_ENABLED = os.getenv("DRIVE_UPLOAD_DEDUP_ENABLED", "true").lower() in {"1", "true", "yes", "on"}
 BLACKBOX_TIMEOUT_SECONDS = float(os.getenv("BLACKBOX_TIMEOUT_SECONDS", "20"))
+BLACKBOX_MAX_IN_FLIGHT = int(os.getenv("BLACKBOX_MAX_IN_FLIGHT", "8"))
+BLACKBOX_QUEUE_TIMEOUT_SECONDS = float(os.getenv("BLACKBOX_QUEUE_TIMEOUT_SECONDS", "10"))
+CHAT_STREAM_MIN_CHUNK_CHARS = int(os.getenv("CHAT_STREAM_MIN_CHUNK_CHARS", "40"))
+CONTEXT_MAX_SENDERS = int(os.getenv("CONTEXT_MAX_SENDERS", "20000"))
+CONTEXT_TTL_SECONDS = float(os.getenv("CONTEXT_TTL_SECONDS", "1800"))
+CONTEXT_MAX_TURNS = int(os.getenv("CONTEXT_MAX_TURNS", "6"))
+CONTEXT_MAX_BYTES = int(os.getenv("CONTEXT_MAX_BYTES", "2048"))
+CONTEXT_TURN_MAX_CHARS = int(os.getenv("CONTEXT_TURN_MAX_CHARS", "400"))
+CHAT_ASYNC_MODE = os.getenv("CHAT_ASYNC_MODE", "false").lower() in {"1", "true", "yes", "on"}
+CHAT_ASYNC_WORKERS = int(os.getenv("CHAT_ASYNC_WORKERS", "4"))
+CHAT_ASYNC_QUEUE_SIZE = int(os.getenv("CHAT_ASYNC_QUEUE_SIZE", "64"))
+CHAT_ASYNC_JOB_TTL_SECONDS = int(os.getenv("CHAT_ASYNC_JOB_TTL_SECONDS", "86400"))
+BLACKBOX_MODEL = os.getenv("BLACKBOX_MODEL", "blackboxai/deepseek/deepseek-chat-v3.1").strip()
+LLM_ANSWER_CACHE_SIZE = int(os.getenv("LLM_ANSWER_CACHE_SIZE", "256"))
+LLM_ANSWER_CACHE_TTL_SECONDS = float(os.getenv("LLM_ANSWER_CACHE_TTL_SECONDS", "21600"))
+LLM_ANSWER_CACHE_NEAR_DUP = os.getenv("LLM_ANSWER_CACHE_NEAR_DUP", "false").lower() in {"1", "true", "yes", "on"}
+LLM_ANSWER_CACHE_MIN_SIMILARITY = float(os.getenv("LLM_ANSWER_CACHE_MIN_SIMILARITY", "0.85"))
+BLACKBOX_STRUCTURED_OUTPUT = os.getenv("BLACKBOX_STRUCTURED_OUTPUT", "false").lower() in {"1", "true", "yes", "on"}
+LLM_REWRITE_BUDGET_PER_MINUTE = float(os.getenv("LLM_REWRITE_BUDGET_PER_MINUTE", "6"))
 REMINDER_TIMEOUT_SECONDS = float(os.getenv("REMINDER_TIMEOUT_SECONDS", "8"))
+REMINDER_LEAD_MINUTES = float(os.getenv("REMINDER_LEAD_MINUTES", "5"))
+REMINDER_JOB_PREFIX = "reminder:"
 WA_PUSH_URL = os.getenv("WA_PUSH_URL", "http://127.0.0.1:3000/send-message")
+WA_PUSH_MAX_WORKERS = int(os.getenv("WA_PUSH_MAX_WORKERS", "4"))
+WA_PUSH_RATE_PER_SECOND = float(os.getenv("WA_PUSH_RATE_PER_SECOND", "5"))
+WA_OUTBOX_DB_FILE = os.getenv("WA_OUTBOX_DB_FILE", "wa_outbox.sqlite3")
+WA_OUTBOX_MAX_ATTEMPTS = int(os.getenv("WA_OUTBOX_MAX_ATTEMPTS", "8"))
+WA_OUTBOX_BACKOFF_SECONDS = float(os.getenv("WA_OUTBOX_BACKOFF_SECONDS", "5"))
+WA_OUTBOX_MAX_BACKOFF_SECONDS = float(os.getenv("WA_OUTBOX_MAX_BACKOFF_SECONDS", "600"))
+WA_OUTBOX_SENT_RETENTION_DAYS = float(os.getenv("WA_OUTBOX_SENT_RETENTION_DAYS", "7"))
+
+GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS = float(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+GOOGLE_HTTP_TIMEOUT_SECONDS = float(os.getenv("GOOGLE_HTTP_TIMEOUT_SECONDS", "60"))
 
 FLASK_DEBUG = os.getenv("FLASK_DEBUG", "false").lower() in {"1", "true", "yes", "on"}
+# memory (satu proses) | sqlite (cache & konteks dibagi antar-worker gunicorn lewat SHARED_STATE_DB_FILE)
+SHARED_STATE_BACKEND = os.getenv("SHARED_STATE_BACKEND", "memory").strip().lower()
+SHARED_STATE_DB_FILE = os.getenv("SHARED_STATE_DB_FILE", "shared_state.sqlite3")
+LEADER_LOCK_FILE = os.getenv("LEADER_LOCK_FILE", "hunky_leader.lock")
+LEADER_RETRY_SECONDS = float(os.getenv("LEADER_RETRY_SECONDS", "15"))
+MEETING_REFRESH_INTERVAL_SECONDS = float(os.getenv("MEETING_REFRESH_INTERVAL_SECONDS", "30"))
+
+# Naikkan setiap kali aturan di build_ai_system_instruction berubah; cache jawaban LLM ikut basi.
+AI_PROMPT_VERSION = 3
 
 ACTION_SAVE_MEETING = "save_meeting"
 ACTION_SEARCH_MEETING = "search_meeting"
@@ -67,6 +153,28 @@ ALLOWED_ACTIONS = {
 
 REQUIRED_ENV_VARS = ["BLACKBOX_API_URL", "BLACKBOX_API_KEY", "PARENT_FOLDER_ID"]
 
+# Kata kunci untuk melewati dedup dan tetap mengunggah salinan baru.
+DRIVE_UPLOAD_FORCE_NEW_PATTERN = re.compile(r"\b(salinan baru|copy baru|upload ulang|unggah ulang)\b", re.IGNORECASE)
+# Query yang jawabannya cepat basi (skor, hasil, harga, ...) memakai TTL cache pendek.
+WEB_SEARCH_REALTIME_PATTERN = re.compile(
+    r"\b(skor|score|hasil|live|klasemen|cuaca|harga|kurs|saham|terkini|terbaru|hari ini|sekarang|berita)\b",
+    re.IGNORECASE,
+)
+# Chat umum yang menyinggung data grup atau waktu relatif tidak boleh dilayani dari cache jawaban.
+LLM_ANSWER_CACHE_BYPASS_PATTERN = re.compile(
+    r"\b(jadwal|meeting|rapat|grup|group|reminder|besok|kemarin|lusa|tadi|nanti|minggu ini|bulan ini"
+    r"|jam|pukul|tanggal|hari)\b",
+    re.IGNORECASE,
+)
+# Pesan yang merujuk ke percakapan sebelumnya ("rangkum dong", "contohnya?", "kenapa?") butuh riwayat.
+# "itu"/"ini"/"kenapa" hanya dihitung bila tidak diikuti kata lain, supaya "apa itu scrum" tetap pesan mandiri.
+CONVERSATION_REFERENCE_PATTERN = re.compile(
+    r"\b(tadi|barusan|tersebut|sebelumnya|di atas|lanjut\w*|rangkum\w*|ringkas\w*|terjemah\w*|contohnya|maksudnya"
+    r"|jelaskan lagi|yang (pertama|kedua|ketiga|terakhir)|dia|mereka)\b"
+    r"|\b(itu|ini|kenapa|mengapa|gimana|bagaimana)\b(?!\s+\w)",
+    re.IGNORECASE,
+)
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s %(levelname)s %(name)s [corr_id=%(corr_id)s] %(message)s",
@@ -85,10 +193,8 @@ for handler in logging.getLogger().handlers:
     handler.addFilter(DefaultCorrelationFilter())
 
 app = Flask(__name__)
-_scheduler = BackgroundScheduler()
+_scheduler = BackgroundScheduler(timezone=WIB)
 _scheduler_started = False
-_last_web_query_by_sender = {}
-_last_web_query_lock = threading.RLock()
 
 
 class CorrelationAdapter(logging.LoggerAdapter):
@@ -110,7 +216,7 @@ def validate_required_env():
         raise RuntimeError(f"Missing required env vars: {missing_joined}")
 
 
-def create_retry_session():
+def create_retry_session(pool_maxsize=10):
     retry = Retry(
         total=2,
         connect=2,
@@ -120,144 +226,664 @@ def create_retry_session():
         allowed_methods=frozenset(["GET", "POST"]),
     )
     session = requests.Session()
-    adapter = HTTPAdapter(max_retries=retry)
+    adapter = HTTPAdapter(max_retries=retry, pool_maxsize=pool_maxsize)
     session.mount("http://", adapter)
     session.mount("https://", adapter)
     return session
 
 
-HTTP = create_retry_session()
+WA_HTTP = create_retry_session(pool_maxsize=WA_PUSH_MAX_WORKERS)
 
 
-class MeetingRepository:
-    def __init__(self, db_path, retention_days=30, auto_delete_after_hours=3):
-        self.db_path = db_path
-        self.retention_days = retention_days
-        self.auto_delete_after_hours = auto_delete_after_hours
+def parse_meeting_datetime(date_str, time_str):
+    try:
+        return datetime.strptime(f"{date_str} {str(time_str).replace('.', ':')}", "%Y-%m-%d %H:%M")
+    except ValueError:
+        return None
+
+
+def legacy_meeting_id(item):
+    seed = "|".join(str(item.get(key, "")) for key in ("group_id", "date", "time", "topic", "location", "link"))
+    return hashlib.sha1(seed.encode("utf-8")).hexdigest()[:16]
+
+
+def normalize_meeting_item(raw_item):
+    if not isinstance(raw_item, dict):
+        return None
+
+    mapped = {
+        "group_id": raw_item.get("group_id") or raw_item.get("GroupId") or "",
+        "date": raw_item.get("date") or raw_item.get("Date") or "",
+        "time": raw_item.get("time") or raw_item.get("Time") or "",
+        "topic": raw_item.get("topic") or raw_item.get("Topic") or "",
+        "location": raw_item.get("location") or raw_item.get("Location") or "-",
+        "link": raw_item.get("link") or raw_item.get("Link") or "",
+        "people_to_meet": raw_item.get("people_to_meet") or raw_item.get("People to Meet") or "",
+        "pic_partner": raw_item.get("pic_partner") or raw_item.get("PIC Partner") or "",
+        "reminded": bool(raw_item.get("reminded", False)),
+    }
+
+    if not mapped["group_id"] or not mapped["date"] or not mapped["time"]:
+        return None
+
+    # Item lama (format JSON legacy) belum punya id; pakai hash isi supaya stabil antar-load.
+    mapped["id"] = str(raw_item.get("id") or "") or legacy_meeting_id(mapped)
+    return mapped
+
+
+def meeting_to_legacy_shape(item):
+    return {
+        "id": item["id"],
+        "Date": item["date"],
+        "Time": item["time"],
+        "People to Meet": item.get("people_to_meet", ""),
+        "PIC Partner": item.get("pic_partner", ""),
+        "Topic": item.get("topic", ""),
+        "Location": item.get("location", "-"),
+        "Link": item.get("link", ""),
+        "GroupId": item["group_id"],
+        "reminded": item.get("reminded", False),
+        "group_id": item["group_id"],
+        "date": item["date"],
+        "time": item["time"],
+        "topic": item.get("topic", ""),
+        "location": item.get("location", "-"),
+        "link": item.get("link", ""),
+        "people_to_meet": item.get("people_to_meet", ""),
+        "pic_partner": item.get("pic_partner", ""),
+    }
+
+
+def sort_meeting_items(items):
+    items.sort(key=lambda x: (x["group_id"], x["date"], x["time"], x.get("topic", "")))
+    return items
+
+
+def is_meeting_expired(item, cutoff_date, auto_delete_cutoff):
+    dt = parse_meeting_datetime(item["date"], item["time"])
+    if not dt:
+        return False
+    return dt.date() < cutoff_date or dt <= auto_delete_cutoff
+
+
+def apply_meeting_ops(items_by_id, ops):
+    for op in ops:
+        kind = op.get("op")
+        if kind == "add":
+            items_by_id[op["item"]["id"]] = op["item"]
+        elif kind == "reset":
+            items_by_id = {k: v for k, v in items_by_id.items() if v["group_id"] != op["group_id"]}
+        elif kind == "reminded":
+            for item_id in op["ids"]:
+                if item_id in items_by_id:
+                    items_by_id[item_id]["reminded"] = True
+        elif kind == "delete":
+            for item_id in op["ids"]:
+                items_by_id.pop(item_id, None)
+        elif kind == "replace":
+            items_by_id = {item["id"]: item for item in op["items"]}
+    return items_by_id
+
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class JsonMeetingStore:
+    def __init__(self, path, compact_after_ops=None):
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.rotated_journal_path = f"{path}.journal.compacting"
+        self.compact_after_ops = MEETING_JOURNAL_COMPACT_OPS if compact_after_ops is None else compact_after_ops
         self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._items = {}
+        self._journal_ops = 0
+        self._disk_signature = None
         self._ensure_file()
 
     def _ensure_file(self):
-        if not os.path.exists(self.db_path):
-            with open(self.db_path, "w", encoding="utf-8") as f:
-                json.dump([], f)
+        if not os.path.exists(self.path):
+            self._write_snapshot([])
+
+    def _write_snapshot(self, items):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump([meeting_to_legacy_shape(item) for item in items], f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _read_snapshot(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return []
+        except JSONDecodeError as exc:
+            corrupt_path = f"{self.path}.corrupt"
+            os.replace(self.path, corrupt_path)
+            get_logger("meeting-store").error(
+                "Meeting snapshot %s is corrupt, moved to %s: %s", self.path, corrupt_path, exc
+            )
+            return []
+        return [item for item in map(normalize_meeting_item, data if isinstance(data, list) else []) if item]
 
-    def _read_raw(self):
-        self._ensure_file()
-        with open(self.db_path, "r", encoding="utf-8") as f:
+    def _read_journal(self):
+        ops = []
+        for path in (self.rotated_journal_path, self.journal_path):
+            if not os.path.exists(path):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line_no, line in enumerate(f, start=1):
+                    if not line.strip():
+                        continue
+                    try:
+                        ops.append(json.loads(line))
+                    except JSONDecodeError:
+                        # Record terakhir bisa terpotong kalau proses mati saat append.
+                        get_logger("meeting-store").warning("Skipping torn journal record %s:%s", path, line_no)
+        return ops
+
+    @staticmethod
+    def _newline_prefix(path):
+        # Sisa record terpotong (crash saat append) tidak diakhiri "\n"; tanpa pemisah, record baru ikut
+        # menempel di baris itu dan ikut dibuang sebagai torn saat replay.
+        try:
+            with open(path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    return ""
+                f.seek(-1, os.SEEK_END)
+                return "" if f.read(1) == b"\n" else "\n"
+        except FileNotFoundError:
+            return ""
+
+    def signature(self):
+        return (
+            file_signature(self.path),
+            file_signature(self.journal_path),
+            file_signature(self.rotated_journal_path),
+        )
+
+    def _refresh_locked(self):
+        signature = self.signature()
+        if signature == self._disk_signature:
+            return
+        ops = self._read_journal()
+        self._items = apply_meeting_ops({item["id"]: item for item in self._read_snapshot()}, ops)
+        self._journal_ops = len(ops)
+        self._disk_signature = self.signature()
+
+    def load_items(self, cutoffs):
+        with self._lock:
+            self._refresh_locked()
+            expired_ids = [k for k, v in self._items.items() if is_meeting_expired(v, *cutoffs)]
+            if expired_ids:
+                self.apply([{"op": "delete", "ids": expired_ids}])
+            return sort_meeting_items([dict(item) for item in self._items.values()])
+
+    def apply(self, ops):
+        with self._lock:
+            self._refresh_locked()
+            records = "".join(json.dumps(op, ensure_ascii=False, separators=(",", ":")) + "\n" for op in ops)
+            records = self._newline_prefix(self.journal_path) + records
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(records)
+                f.flush()
+                os.fsync(f.fileno())
+            self._items = apply_meeting_ops(self._items, ops)
+            self._journal_ops += len(ops)
+            self._disk_signature = self.signature()
+            should_compact = self.compact_after_ops > 0 and self._journal_ops >= self.compact_after_ops
+        if should_compact and not self._compact_lock.locked():
+            threading.Thread(target=self._compact_in_background, daemon=True).start()
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except Exception as exc:
+            get_logger("meeting-store").exception("Meeting journal compaction failed: %s", exc)
+
+    def _rotate_journal(self):
+        if not os.path.exists(self.rotated_journal_path):
+            os.replace(self.journal_path, self.rotated_journal_path)
+            return
+        # Sisa compaction yang gagal sebelumnya: gabungkan, jangan ditimpa.
+        with open(self.journal_path, "r", encoding="utf-8") as src:
+            pending = src.read()
+        pending = self._newline_prefix(self.rotated_journal_path) + pending
+        with open(self.rotated_journal_path, "a", encoding="utf-8") as dst:
+            dst.write(pending)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.remove(self.journal_path)
+
+    def compact(self):
+        # Semua op journal idempoten, jadi crash di tengah compaction aman di-replay ulang.
+        with self._compact_lock:
+            with self._lock:
+                self._refresh_locked()
+                if self._journal_ops == 0:
+                    return
+                if os.path.exists(self.journal_path):
+                    self._rotate_journal()
+                items = sort_meeting_items([dict(item) for item in self._items.values()])
+                self._journal_ops = 0
+            self._write_snapshot(items)
+            with self._lock:
+                if os.path.exists(self.rotated_journal_path):
+                    os.remove(self.rotated_journal_path)
+                self._disk_signature = self.signature()
+
+
+class SqliteMeetingStore:
+    SCHEMA = """
+CREATE TABLE IF NOT EXISTS meetings (
+    id TEXT PRIMARY KEY,
+    group_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    starts_at TEXT,
+    topic TEXT NOT NULL DEFAULT '',
+    location TEXT NOT NULL DEFAULT '-',
+    link TEXT NOT NULL DEFAULT '',
+    people_to_meet TEXT NOT NULL DEFAULT '',
+    pic_partner TEXT NOT NULL DEFAULT '',
+    reminded INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_meetings_group_slot ON meetings (group_id, date, time);
+CREATE INDEX IF NOT EXISTS idx_meetings_reminder ON meetings (reminded, starts_at);
+CREATE INDEX IF NOT EXISTS idx_meetings_starts_at ON meetings (starts_at);
+"""
+    COLUMNS = (
+        "id",
+        "group_id",
+        "date",
+        "time",
+        "topic",
+        "location",
+        "link",
+        "people_to_meet",
+        "pic_partner",
+        "reminded",
+    )
+
+    def __init__(self, path, legacy_json_path=None):
+        self.path = path
+        self.legacy_json_path = legacy_json_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(self.SCHEMA)
+
+    @contextmanager
+    def _write_txn(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
             try:
-                data = json.load(f)
-                return data if isinstance(data, list) else []
-            except JSONDecodeError:
-                return []
+                yield self._conn
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _row_to_item(self, row):
+        item = {key: row[key] for key in self.COLUMNS}
+        item["reminded"] = bool(item["reminded"])
+        return item
+
+    def _insert(self, conn, item):
+        dt = parse_meeting_datetime(item["date"], item["time"])
+        conn.execute(
+            "INSERT OR REPLACE INTO meetings "
+            "(id, group_id, date, time, starts_at, topic, location, link, people_to_meet, pic_partner, reminded) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                item["id"],
+                item["group_id"],
+                item["date"],
+                item["time"],
+                dt.strftime("%Y-%m-%d %H:%M") if dt else None,
+                item.get("topic", ""),
+                item.get("location", "-"),
+                item.get("link", ""),
+                item.get("people_to_meet", ""),
+                item.get("pic_partner", ""),
+                int(bool(item.get("reminded", False))),
+            ),
+        )
 
-    def _write_raw(self, items):
-        with open(self.db_path, "w", encoding="utf-8") as f:
-            json.dump(items, f, indent=2, ensure_ascii=False)
+    def _import_legacy_json(self):
+        path = self.legacy_json_path
+        if not path or not os.path.exists(path):
+            return
+        log = get_logger("meeting-store")
+        if os.path.exists(f"{path}.journal"):
+            JsonMeetingStore(path).compact()
+        raw_items = []
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                raw_items = json.load(f)
+        except (OSError, JSONDecodeError) as exc:
+            log.warning("Legacy meeting file %s unreadable, importing nothing: %s", path, exc)
+        items = [x for x in map(normalize_meeting_item, raw_items if isinstance(raw_items, list) else []) if x]
+        with self._write_txn() as conn:
+            for item in items:
+                self._insert(conn, item)
+        os.replace(path, f"{path}.imported")
+        log.info("Imported %s meeting(s) from legacy file %s", len(items), path)
+
+    def _purge(self, cutoffs):
+        cutoff_date, auto_delete_cutoff = cutoffs
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM meetings WHERE starts_at IS NOT NULL AND (starts_at < ? OR starts_at <= ?)",
+                (cutoff_date.strftime("%Y-%m-%d"), auto_delete_cutoff.strftime("%Y-%m-%d %H:%M")),
+            )
 
-    def _normalize_item(self, raw_item):
-        if not isinstance(raw_item, dict):
-            return None
+    def load_items(self, cutoffs):
+        with self._lock:
+            self._import_legacy_json()
+            self._purge(cutoffs)
+            rows = self._conn.execute("SELECT * FROM meetings ORDER BY group_id, date, time, topic").fetchall()
+        return [self._row_to_item(row) for row in rows]
 
-        mapped = {
-            "group_id": raw_item.get("group_id") or raw_item.get("GroupId") or "",
-            "date": raw_item.get("date") or raw_item.get("Date") or "",
-            "time": raw_item.get("time") or raw_item.get("Time") or "",
-            "topic": raw_item.get("topic") or raw_item.get("Topic") or "",
-            "location": raw_item.get("location") or raw_item.get("Location") or "-",
-            "link": raw_item.get("link") or raw_item.get("Link") or "",
-            "people_to_meet": raw_item.get("people_to_meet")
-            or raw_item.get("People to Meet")
-            or "",
-            "pic_partner": raw_item.get("pic_partner") or raw_item.get("PIC Partner") or "",
-            "reminded": bool(raw_item.get("reminded", False)),
-        }
+    def signature(self):
+        legacy_pending = bool(self.legacy_json_path) and os.path.exists(self.legacy_json_path)
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            inode = None
+        with self._lock:
+            # data_version hanya berubah bila ada commit dari koneksi/proses lain.
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        return (legacy_pending, inode, data_version)
 
-        if not mapped["group_id"] or not mapped["date"] or not mapped["time"]:
-            return None
+    def apply(self, ops):
+        with self._lock:
+            self._import_legacy_json()
+            with self._write_txn() as conn:
+                for op in ops:
+                    kind = op.get("op")
+                    if kind == "add":
+                        self._insert(conn, op["item"])
+                    elif kind == "reset":
+                        conn.execute("DELETE FROM meetings WHERE group_id = ?", (op["group_id"],))
+                    elif kind == "reminded":
+                        conn.executemany("UPDATE meetings SET reminded = 1 WHERE id = ?", [(x,) for x in op["ids"]])
+                    elif kind == "delete":
+                        conn.executemany("DELETE FROM meetings WHERE id = ?", [(x,) for x in op["ids"]])
+                    elif kind == "replace":
+                        conn.execute("DELETE FROM meetings")
+                        for item in op["items"]:
+                            self._insert(conn, item)
 
-        return mapped
 
-    def _to_legacy_shape(self, item):
-        return {
-            "Date": item["date"],
-            "Time": item["time"],
-            "People to Meet": item.get("people_to_meet", ""),
-            "PIC Partner": item.get("pic_partner", ""),
-            "Topic": item.get("topic", ""),
-            "Location": item.get("location", "-"),
-            "Link": item.get("link", ""),
-            "GroupId": item["group_id"],
-            "reminded": item.get("reminded", False),
-            "group_id": item["group_id"],
-            "date": item["date"],
-            "time": item["time"],
-            "topic": item.get("topic", ""),
-            "location": item.get("location", "-"),
-            "link": item.get("link", ""),
-            "people_to_meet": item.get("people_to_meet", ""),
-            "pic_partner": item.get("pic_partner", ""),
-        }
+class MeetingRepository:
+    def __init__(
+        self,
+        db_path,
+        retention_days=30,
+        auto_delete_after_hours=3,
+        backend=None,
+        write_coalesce_seconds=None,
+    ):
+        self.db_path = db_path
+        self.retention_days = retention_days
+        self.auto_delete_after_hours = auto_delete_after_hours
+        self.backend = (backend or MEETING_STORAGE_BACKEND).strip().lower()
+        self.write_coalesce_seconds = (
+            MEETING_WRITE_COALESCE_MS / 1000 if write_coalesce_seconds is None else write_coalesce_seconds
+        )
+        self._lock = threading.RLock()
+        self._store = self._create_store()
+        # Salinan kanonis per group; disk hanya dibaca ulang saat signature store berubah.
+        self._groups = None
+        self._by_id = {}
+        self._signature = None
+        # Heap (waktu, id) dengan lazy deletion; entri basi dibuang saat di-pop.
+        self._reminder_heap = []
+        self._expiry_heap = []
+        self._pending_ops = []
+        self._flush_timer = None
+        self._listeners = []
+        if self.write_coalesce_seconds > 0:
+            atexit.register(self.flush)
+
+    def _create_store(self):
+        if self.backend == "sqlite":
+            sqlite_path = os.path.splitext(self.db_path)[0] + ".sqlite3"
+            return SqliteMeetingStore(sqlite_path, legacy_json_path=self.db_path)
+        if self.backend == "json":
+            return JsonMeetingStore(self.db_path)
+        raise ValueError(f"Unknown meeting storage backend: {self.backend}")
 
     def _safe_datetime(self, date_str, time_str):
-        try:
-            return datetime.strptime(f"{date_str} {time_str.replace('.', ':')}", "%Y-%m-%d %H:%M")
-        except ValueError:
-            return None
+        return parse_meeting_datetime(date_str, time_str)
+
+    def _now(self):
+        return (datetime.now(timezone.utc) + timedelta(hours=7)).replace(tzinfo=None)
 
-    def _purge_expired(self, items):
-        now_wib = (datetime.now(timezone.utc) + timedelta(hours=7)).replace(tzinfo=None)
+    def _purge_cutoffs(self):
+        now_wib = self._now()
         cutoff_date = now_wib.date() - timedelta(days=self.retention_days)
         auto_delete_cutoff = now_wib - timedelta(hours=max(self.auto_delete_after_hours, 0))
-        fresh_items = []
-        purged_count = 0
+        return cutoff_date, auto_delete_cutoff
+
+    def _expiry_at(self, item):
+        dt = parse_meeting_datetime(item["date"], item["time"])
+        if not dt:
+            return None
+        by_retention = datetime.combine(dt.date() + timedelta(days=self.retention_days + 1), datetime.min.time())
+        by_auto_delete = dt + timedelta(hours=max(self.auto_delete_after_hours, 0))
+        return min(by_retention, by_auto_delete)
+
+    def _track(self, item):
+        starts_at = parse_meeting_datetime(item["date"], item["time"])
+        if not starts_at:
+            return
+        heapq.heappush(self._expiry_heap, (self._expiry_at(item), item["id"]))
+        if not item["reminded"]:
+            heapq.heappush(self._reminder_heap, (starts_at, item["id"]))
+
+    def _index(self, items):
+        self._groups = {}
+        self._by_id = {}
+        self._reminder_heap = []
+        self._expiry_heap = []
         for item in items:
-            dt = self._safe_datetime(item["date"], item["time"])
-            if dt and dt.date() < cutoff_date:
-                purged_count += 1
-                continue
-            if dt and dt <= auto_delete_cutoff:
-                purged_count += 1
+            self._groups.setdefault(item["group_id"], []).append(item)
+            self._by_id[item["id"]] = item
+            self._track(item)
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def _notify(self, event, items):
+        for listener in self._listeners:
+            try:
+                listener(event, [dict(item) for item in items])
+            except Exception as exc:
+                get_logger("meeting-store").exception("Meeting listener failed on %s: %s", event, exc)
+
+    def _reload(self):
+        self._flush_locked()
+        items = self._store.load_items(self._purge_cutoffs())
+        self._signature = self._store.signature()
+        self._index(items)
+        self._notify("reload", items)
+
+    def _ensure_fresh(self):
+        if self._groups is None or self._store.signature() != self._signature:
+            self._reload()
+        elif self._expiry_heap and self._now() >= self._expiry_heap[0][0]:
+            self._purge_cached()
+
+    def _purge_cached(self):
+        now = self._now()
+        expired_ids = []
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expiry, item_id = heapq.heappop(self._expiry_heap)
+            item = self._by_id.get(item_id)
+            if item and self._expiry_at(item) == expiry:
+                expired_ids.append(item_id)
+        if expired_ids:
+            expired_items = self._drop_cached(expired_ids)
+            self._queue_op({"op": "delete", "ids": expired_ids})
+            self._notify("remove", expired_items)
+
+    def _drop_cached(self, meeting_ids):
+        dropped = []
+        for item_id in meeting_ids:
+            item = self._by_id.pop(item_id, None)
+            if not item:
                 continue
-            fresh_items.append(item)
-        return fresh_items, purged_count
+            dropped.append(item)
+            group = [x for x in self._groups.get(item["group_id"], []) if x["id"] != item_id]
+            if group:
+                self._groups[item["group_id"]] = group
+            else:
+                self._groups.pop(item["group_id"], None)
+        return dropped
+
+    def _queue_op(self, op):
+        self._pending_ops.append(op)
+        if self.write_coalesce_seconds <= 0:
+            self._flush_locked()
+        else:
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._pending_ops and self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.write_coalesce_seconds, self._flush_in_background)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _flush_locked(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if not self._pending_ops:
+            return
+        ops, self._pending_ops = self._pending_ops, []
+        try:
+            self._store.apply(ops)
+        except Exception:
+            if self.write_coalesce_seconds > 0:
+                self._pending_ops = ops + self._pending_ops
+            else:
+                self._groups = None
+            raise
+        self._signature = self._store.signature()
+
+    def _flush_in_background(self):
+        with self._lock:
+            self._flush_timer = None
+            try:
+                self._flush_locked()
+            except Exception as exc:
+                get_logger("meeting-store").exception("Deferred meeting flush failed: %s", exc)
+                self._schedule_flush()
 
-    def _normalize_and_sort(self, raw_items):
-        normalized = []
-        for raw_item in raw_items:
-            item = self._normalize_item(raw_item)
-            if item:
-                normalized.append(item)
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
 
-        normalized.sort(key=lambda x: (x["group_id"], x["date"], x["time"], x.get("topic", "")))
-        return normalized
+    def refresh(self):
+        # Murah bila tidak ada perubahan: cukup cek signature store, listener dipanggil kalau ada reload.
+        with self._lock:
+            self._ensure_fresh()
 
     def load_all(self):
         with self._lock:
-            normalized = self._normalize_and_sort(self._read_raw())
-            purged, purged_count = self._purge_expired(normalized)
-            if purged_count > 0 or purged != normalized:
-                self._write_raw([self._to_legacy_shape(item) for item in purged])
-            return purged
+            self._ensure_fresh()
+            return [dict(item) for group_id in sorted(self._groups) for item in self._groups[group_id]]
 
     def save_all(self, canonical_items):
         with self._lock:
-            normalized = self._normalize_and_sort(canonical_items)
-            purged, _ = self._purge_expired(normalized)
-            self._write_raw([self._to_legacy_shape(item) for item in purged])
+            cutoffs = self._purge_cutoffs()
+            items = [
+                item
+                for item in map(normalize_meeting_item, canonical_items)
+                if item and not is_meeting_expired(item, *cutoffs)
+            ]
+            self._index(sort_meeting_items(items))
+            self._queue_op({"op": "replace", "items": [dict(item) for item in items]})
+            self._notify("reload", items)
 
     def add(self, canonical_item):
+        if isinstance(canonical_item, dict) and not canonical_item.get("id"):
+            canonical_item = {**canonical_item, "id": uuid.uuid4().hex}
+        item = normalize_meeting_item(canonical_item)
+        if not item:
+            return
         with self._lock:
-            items = self.load_all()
-            items.append(canonical_item)
-            self.save_all(items)
+            self._ensure_fresh()
+            self._drop_cached([item["id"]])
+            group = self._groups.setdefault(item["group_id"], [])
+            group.append(item)
+            group.sort(key=lambda x: (x["date"], x["time"], x.get("topic", "")))
+            self._by_id[item["id"]] = item
+            self._track(item)
+            self._queue_op({"op": "add", "item": dict(item)})
+            self._notify("upsert", [item])
 
     def list_by_group(self, group_id):
-        return [x for x in self.load_all() if x["group_id"] == group_id]
+        with self._lock:
+            self._ensure_fresh()
+            return [dict(item) for item in self._groups.get(group_id, [])]
 
     def reset_group(self, group_id):
-        items = [x for x in self.load_all() if x["group_id"] != group_id]
-        self.save_all(items)
+        with self._lock:
+            self._ensure_fresh()
+            removed = self._groups.pop(group_id, [])
+            for item in removed:
+                self._by_id.pop(item["id"], None)
+            self._queue_op({"op": "reset", "group_id": group_id})
+            self._notify("remove", removed)
+
+    def due_reminders(self, now, lead_minutes):
+        # Entri basi (dihapus, sudah reminded, dijadwal ulang, lewat) dibuang dari heap; entri yang due
+        # dikembalikan ke heap dan baru hilang setelah mark_reminded, jadi kegagalan di tengah kirim tidak
+        # menghilangkan reminder-nya.
+        horizon = now + timedelta(minutes=lead_minutes)
+        due = []
+        pending = []
+        with self._lock:
+            self._ensure_fresh()
+            while self._reminder_heap and self._reminder_heap[0][0] <= horizon:
+                starts_at, item_id = heapq.heappop(self._reminder_heap)
+                item = self._by_id.get(item_id)
+                if not item or item["reminded"] or parse_meeting_datetime(item["date"], item["time"]) != starts_at:
+                    continue
+                if starts_at > now:
+                    due.append(dict(item))
+                    pending.append((starts_at, item_id))
+            for entry in pending:
+                heapq.heappush(self._reminder_heap, entry)
+        return due
+
+    def mark_reminded(self, meeting_ids):
+        ids = [x for x in meeting_ids if x]
+        if not ids:
+            return
+        with self._lock:
+            self._ensure_fresh()
+            updated = []
+            for item_id in ids:
+                if item_id in self._by_id:
+                    self._by_id[item_id]["reminded"] = True
+                    updated.append(self._by_id[item_id])
+            self._queue_op({"op": "reminded", "ids": ids})
+            self._notify("upsert", updated)
 
 
 meeting_repo = MeetingRepository(
@@ -313,54 +939,660 @@ def is_valid_time(time_str):
         return False
 
 
+class TTLCache:
+    def __init__(self, maxsize, ttl_seconds):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return default
+            self._data.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl_seconds=None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._evictions += 1
+
+    def update(self, key, fn, ttl_seconds=None):
+        # Read-modify-write atomik: fn menerima nilai lama (None bila tidak ada/kedaluwarsa), hasilnya disimpan.
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            entry = self._data.get(key)
+            current = entry[1] if entry is not None and entry[0] > time.monotonic() else None
+            value = fn(current)
+            if ttl <= 0 or self.maxsize <= 0:
+                return value
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._evictions += 1
+        return value
+
+    def invalidate(self, predicate=None):
+        with self._lock:
+            keys = [key for key in self._data if predicate is None or predicate(key)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def clear(self):
+        self.invalidate()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+class SharedStateStore:
+    SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    touched_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS idx_kv_touched ON kv (namespace, touched_at);
+"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(self.SCHEMA)
+
+    @contextmanager
+    def _write_txn(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def get(self, namespace, key, touch_after=0.0):
+        # Baca tanpa lock tulis (WAL: pembaca tidak saling menunggu). Entri kedaluwarsa dibiarkan,
+        # disapu oleh set(). touched_at untuk LRU hanya diperbarui bila sudah lebih tua dari touch_after.
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at, touched_at FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                return None
+            if now - row[2] > touch_after:
+                self._conn.execute(
+                    "UPDATE kv SET touched_at = ? WHERE namespace = ? AND key = ?", (now, namespace, key)
+                )
+        return row[0]
+
+    @staticmethod
+    def _put(conn, namespace, key, value, ttl_seconds, maxsize, now):
+        conn.execute(
+            "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at, touched_at) VALUES (?, ?, ?, ?, ?)",
+            (namespace, key, value, now + ttl_seconds, now),
+        )
+        conn.execute("DELETE FROM kv WHERE namespace = ? AND expires_at <= ?", (namespace, now))
+        # LRU lintas proses: buang entri yang paling lama tidak disentuh bila melebihi maxsize.
+        return conn.execute(
+            "DELETE FROM kv WHERE namespace = ? AND key IN ("
+            "SELECT key FROM kv WHERE namespace = ? ORDER BY touched_at DESC LIMIT -1 OFFSET ?)",
+            (namespace, namespace, maxsize),
+        ).rowcount
+
+    def set(self, namespace, key, value, ttl_seconds, maxsize):
+        now = time.time()
+        with self._write_txn() as conn:
+            return self._put(conn, namespace, key, value, ttl_seconds, maxsize, now)
+
+    def update(self, namespace, key, fn, ttl_seconds, maxsize):
+        # Baca + tulis dalam satu transaksi BEGIN IMMEDIATE, jadi worker lain tidak bisa menyisip di tengah.
+        now = time.time()
+        with self._write_txn() as conn:
+            row = conn.execute(
+                "SELECT value FROM kv WHERE namespace = ? AND key = ? AND expires_at > ?", (namespace, key, now)
+            ).fetchone()
+            value = fn(row[0] if row else None)
+            evicted = self._put(conn, namespace, key, value, ttl_seconds, maxsize, now)
+        return value, evicted
+
+    def keys(self, namespace):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT key FROM kv WHERE namespace = ?", (namespace,))]
+
+    def delete(self, namespace, keys):
+        with self._write_txn() as conn:
+            conn.executemany("DELETE FROM kv WHERE namespace = ? AND key = ?", [(namespace, key) for key in keys])
+
+    def count(self, namespace):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM kv WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+
+# Antarmuka sama dengan TTLCache, tapi isinya di SQLite: semua worker melihat entri & invalidasi yang sama.
+class SharedTTLCache:
+    def __init__(self, store, namespace, maxsize, ttl_seconds):
+        self.store = store
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def _encode_key(key):
+        return json.dumps(key, ensure_ascii=False, separators=(",", ":"))
+
+    @staticmethod
+    def _decode_key(raw):
+        key = json.loads(raw)
+        return tuple(key) if isinstance(key, list) else key
+
+    def get(self, key, default=None):
+        # LRU longgar: touched_at ditulis paling sering sekali per ttl/10, bukan di setiap baca.
+        raw = self.store.get(self.namespace, self._encode_key(key), touch_after=self.ttl_seconds / 10)
+        with self._lock:
+            if raw is None:
+                self._misses += 1
+                return default
+            self._hits += 1
+        return json.loads(raw)
+
+    def set(self, key, value, ttl_seconds=None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        evicted = self.store.set(
+            self.namespace, self._encode_key(key), json.dumps(value, ensure_ascii=False), ttl, self.maxsize
+        )
+        with self._lock:
+            self._evictions += evicted
+
+    def update(self, key, fn, ttl_seconds=None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        if ttl <= 0 or self.maxsize <= 0:
+            return fn(None)
+
+        def apply(raw):
+            return json.dumps(fn(json.loads(raw) if raw is not None else None), ensure_ascii=False)
+
+        raw, evicted = self.store.update(self.namespace, self._encode_key(key), apply, ttl, self.maxsize)
+        with self._lock:
+            self._evictions += evicted
+        return json.loads(raw)
+
+    def invalidate(self, predicate=None):
+        keys = [raw for raw in self.store.keys(self.namespace) if predicate is None or predicate(self._decode_key(raw))]
+        if keys:
+            self.store.delete(self.namespace, keys)
+        return len(keys)
+
+    def clear(self):
+        self.invalidate()
+
+    def stats(self):
+        size = self.store.count(self.namespace)
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": size,
+                "maxsize": self.maxsize,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "shared": True,
+            }
+
+
+shared_state = SharedStateStore(SHARED_STATE_DB_FILE) if SHARED_STATE_BACKEND == "sqlite" else None
+
+
+def make_cache(namespace, maxsize, ttl_seconds):
+    if shared_state is not None:
+        return SharedTTLCache(shared_state, namespace, maxsize, ttl_seconds)
+    return TTLCache(maxsize, ttl_seconds)
+
+
 def sanitize_drive_keyword(keyword):
     cleaned = re.sub(r"[\x00-\x1f\x7f]", "", str(keyword or "")).strip()
     return cleaned.replace("'", "\\'")[:100]
 
 
+class GoogleServiceCache:
+    def __init__(self, token_path="token.json", scopes=None, refresh_margin_seconds=None):
+        self.token_path = token_path
+        self.scopes = scopes or SCOPES
+        self.refresh_margin_seconds = (
+            GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS if refresh_margin_seconds is None else refresh_margin_seconds
+        )
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._creds = None
+        self._generation = 0
+        self._token_signature = None
+        self._services = {}
+        self._stats = {"hits": 0, "builds": 0, "refreshes": 0, "token_reloads": 0}
+
+    def _reload_token_if_changed(self):
+        signature = file_signature(self.token_path)
+        if signature == self._token_signature:
+            return
+        self._creds = None
+        if signature is not None:
+            self._creds = Credentials.from_authorized_user_file(self.token_path, self.scopes)
+        self._token_signature = signature
+        self._generation += 1
+        self._services = {}
+        self._stats["token_reloads"] += 1
+
+    def _needs_refresh(self):
+        if not self._creds.valid:
+            return True
+        if not self._creds.expiry:
+            return False
+        remaining = self._creds.expiry - datetime.now(timezone.utc).replace(tzinfo=None)
+        return remaining.total_seconds() < self.refresh_margin_seconds
+
+    def _refresh(self):
+        self._creds.refresh(Request())
+        self._stats["refreshes"] += 1
+        tmp_path = f"{self.token_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self._creds.to_json())
+        os.replace(tmp_path, self.token_path)
+        self._token_signature = file_signature(self.token_path)
+
+    def _thread_http(self):
+        # httplib2 tidak thread-safe: tiap worker thread pegang transport sendiri.
+        local = self._local
+        if getattr(local, "generation", None) != self._generation:
+            local.http = AuthorizedHttp(self._creds, http=httplib2.Http(timeout=GOOGLE_HTTP_TIMEOUT_SECONDS))
+            local.generation = self._generation
+        return local.http
+
+    def _build_request(self, _http, *args, **kwargs):
+        return HttpRequest(self._thread_http(), *args, **kwargs)
+
+    def get(self, service_name, version):
+        with self._lock:
+            self._reload_token_if_changed()
+            if not self._creds:
+                return None
+            if self._needs_refresh():
+                if not self._creds.refresh_token:
+                    return None
+                self._refresh()
+            key = (service_name, version)
+            service = self._services.get(key)
+            if service is not None:
+                self._stats["hits"] += 1
+                return service
+            service = build(
+                service_name,
+                version,
+                http=self._thread_http(),
+                requestBuilder=self._build_request,
+                cache_discovery=False,
+            )
+            self._services[key] = service
+            self._stats["builds"] += 1
+            return service
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+google_services = GoogleServiceCache()
+
+
 def get_google_service(service_name, version, corr_id="-"):
     log = get_logger(corr_id)
-    creds = None
     try:
-        if os.path.exists("token.json"):
-            creds = Credentials.from_authorized_user_file("token.json", SCOPES)
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                log.warning("Google token missing or invalid")
-                return None
-        return build(service_name, version, credentials=creds)
+        service = google_services.get(service_name, version)
+        if service is None:
+            log.warning("Google token missing or invalid")
+        return service
     except Exception as exc:
         log.exception("Failed to create Google service: %s", exc)
         return None
 
 
+# Normalisasi teks lookup: satu tokenisasi menghasilkan query web sekaligus keyword Drive.
+# Token kata dibandingkan ke set stopword (setara `\b(...)\b` per kelompok), tanda baca selain - dan . jadi spasi.
+WEB_QUERY_STOPWORDS = frozenset(
+    {
+        *("tolong", "please", "dong", "ya", "kak", "bang", "bot", "hunky"),
+        *("cari", "search", "cek", "lihat", "temukan", "carikan"),
+        *("info", "informasi", "berita", "jadwal"),
+        *("di", "dari", "tentang"),
+        *("internet", "online", "web"),
+    }
+)
+DRIVE_KEYWORD_STOPWORDS = frozenset(
+    {
+        *("tolong", "please", "dong", "ya", "kak", "bang", "bot", "hunky"),
+        *("google", "drive", "folder", "ambil", "cari", "buka", "download", "unduh"),
+        *("file", "dokumen", "document", "dari", "di", "ke"),
+    }
+)
+# "@hunky" jadi token sendiri (sisa kata setelahnya ikut ditangkap) karena keyword Drive membuangnya
+# sebagai substring, mis. "@hunkylaporan" -> "laporan".
+LOOKUP_TOKEN_PATTERN = re.compile(r"(@\d{6,})|(?i:@hunky)(\w*)|(\w+)|([^\w\s\-\.])")
+# Dicocokkan ke pesan yang sudah di-lower(); tanpa re.IGNORECASE karena flag itu memperlambat scan.
+BOT_TRIGGER_PATTERN = re.compile("|".join(re.escape(trigger.lower()) for trigger in BOT_TRIGGERS))
+
+
+def normalize_lookup_text(message):
+    text = str(message or "").strip()
+    web_parts = []
+    drive_parts = []
+    last = 0
+    for match in LOOKUP_TOKEN_PATTERN.finditer(text):
+        # Celah antar token hanya berisi spasi, "-" atau "." dan dipertahankan apa adanya.
+        gap = text[last : match.start()]
+        mention, after_bot, word, _ = match.groups()
+        if after_bot is not None:
+            # Query web melihat "hunky<sisa>" sebagai satu kata; keyword Drive hanya menyisakan <sisa>.
+            bot_word = match.group(0)[1:].lower()
+            web_parts.append(gap + " " + ("" if bot_word in WEB_QUERY_STOPWORDS else bot_word))
+            drive_parts.append(gap + " " + ("" if after_bot.lower() in DRIVE_KEYWORD_STOPWORDS else after_bot))
+        elif word is not None:
+            lowered = word.lower()
+            web_parts.append(gap + (" " if lowered in WEB_QUERY_STOPWORDS else lowered))
+            drive_parts.append(gap + (" " if lowered in DRIVE_KEYWORD_STOPWORDS else word))
+        elif mention is not None:
+            # Query web hanya membuang "@"; keyword Drive membuang mention nomor utuh.
+            web_parts.append(gap + " " + mention[1:])
+            drive_parts.append(gap + " ")
+        else:
+            web_parts.append(gap + " ")
+            drive_parts.append(gap + " ")
+        last = match.end()
+    tail = text[last:]
+    web_query = " ".join(("".join(web_parts) + tail).lower().split())
+    drive_keyword = " ".join(("".join(drive_parts) + tail).split())
+    return web_query or text, drive_keyword or text
+
+
 def normalize_web_query(query):
-    text = str(query or "").strip()
-    if not text:
-        return ""
-    lowered = text.lower()
-    lowered = re.sub(r"\b(tolong|please|dong|ya|kak|bang|bot|hunky)\b", " ", lowered)
-    lowered = re.sub(r"\b(cari|search|cek|lihat|temukan|carikan)\b", " ", lowered)
-    lowered = re.sub(r"\b(info|informasi|berita|jadwal)\b", " ", lowered)
-    lowered = re.sub(r"\b(di|dari|tentang)\b", " ", lowered)
-    lowered = re.sub(r"\b(internet|online|web)\b", " ", lowered)
-    lowered = re.sub(r"[^\w\s\-\.]", " ", lowered, flags=re.UNICODE)
-    lowered = re.sub(r"\s+", " ", lowered).strip()
-    return lowered or text
+    return normalize_lookup_text(query)[0]
+
+
+# Panggilan serentak dengan key sama digabung: satu jalan, sisanya menunggu hasilnya.
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._shared = 0
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"done": threading.Event(), "result": None, "error": None}
+                self._calls[key] = call
+            else:
+                self._shared += 1
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+        try:
+            call["result"] = func()
+        except Exception as exc:
+            call["error"] = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call["done"].set()
+        return call["result"]
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._calls), "shared": self._shared}
+
+
+web_search_cache = make_cache("web_search", WEB_SEARCH_CACHE_SIZE, WEB_SEARCH_CACHE_TTL_SECONDS)
+web_search_flight = SingleFlight()
+
+
+def web_search_cache_key(query):
+    normalized = normalize_web_query(query).lower()
+    return " ".join(normalized.split())
+
+
+def web_search_ttl(query):
+    if WEB_SEARCH_REALTIME_PATTERN.search(str(query or "")):
+        return WEB_SEARCH_CACHE_TTL_REALTIME_SECONDS
+    return WEB_SEARCH_CACHE_TTL_SECONDS
+
+
+class DdgSearchProvider:
+    name = "ddg"
+
+    def text(self, query, max_results):
+        return DDGS().text(query, max_results=max_results)
+
+
+class FixtureSearchProvider:
+    name = "fixture"
+
+    def __init__(self, fixture_path=None):
+        self.fixtures = {}
+        if fixture_path:
+            with open(fixture_path, "r", encoding="utf-8") as handle:
+                raw = json.load(handle)
+            self.fixtures = {web_search_cache_key(query): results for query, results in raw.items()}
+
+    def text(self, query, max_results):
+        key = web_search_cache_key(query)
+        if key in self.fixtures:
+            return self.fixtures[key][:max_results]
+        # Tanpa fixture: hasil sintetis yang deterministik per query.
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return [
+            {
+                "title": f"{key} #{index + 1}",
+                "body": f"Ringkasan lokal untuk '{key}' ({digest[index * 8 : index * 8 + 8]}).",
+                "href": f"https://fixture.local/{digest[:12]}/{index + 1}",
+            }
+            for index in range(max_results)
+        ]
+
+
+class LatencyStubSearchProvider(FixtureSearchProvider):
+    name = "stub"
+
+    def __init__(self, latency_ms, jitter_ms=0.0, empty_rate=0.0, fixture_path=None):
+        super().__init__(fixture_path)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.empty_rate = empty_rate
+
+    def text(self, query, max_results):
+        # Seed dari query: latensi & hasil kosong bisa direproduksi antar-run benchmark.
+        rng = random.Random(hashlib.sha256(str(query).encode("utf-8")).digest())
+        time.sleep(max(self.latency_ms + rng.uniform(-self.jitter_ms, self.jitter_ms), 0) / 1000)
+        if rng.random() < self.empty_rate:
+            return []
+        return super().text(query, max_results)
+
+
+def build_search_provider(name):
+    name = str(name or "").strip().lower()
+    if name == "ddg":
+        return DdgSearchProvider()
+    if name == "fixture":
+        return FixtureSearchProvider(WEB_SEARCH_FIXTURE_FILE or None)
+    if name == "stub":
+        return LatencyStubSearchProvider(
+            WEB_SEARCH_STUB_LATENCY_MS,
+            jitter_ms=WEB_SEARCH_STUB_JITTER_MS,
+            empty_rate=WEB_SEARCH_STUB_EMPTY_RATE,
+            fixture_path=WEB_SEARCH_FIXTURE_FILE or None,
+        )
+    raise ValueError(f"Unknown web search provider: {name}")
+
+
+web_search_provider = build_search_provider(WEB_SEARCH_PROVIDER)
 
 
 def cari_di_internet(query, corr_id="-"):
+    key = web_search_cache_key(query)
+    if not key:
+        return search_web_live(query, corr_id=corr_id)
+    cached = web_search_cache.get(key)
+    if cached is not None:
+        get_logger(corr_id).info("Web search cache hit: %s", key)
+        return cached
+
+    def run():
+        result = search_web_live(query, corr_id=corr_id)
+        if not result.startswith("Gagal searching:"):
+            web_search_cache.set(key, result, ttl_seconds=web_search_ttl(query))
+        return result
+
+    return web_search_flight.do(key, run)
+
+
+class WebSearchExecutor:
+    def __init__(self, max_workers, hedge_delay_seconds, deadline_seconds):
+        self._executor = ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix="web-search")
+        self.hedge_delay_seconds = hedge_delay_seconds
+        self.deadline_seconds = deadline_seconds
+        self._lock = threading.Lock()
+        self._stats = {"searches": 0, "fallback_launched": 0, "fallback_wins": 0, "timeouts": 0, "last": None}
+
+    @staticmethod
+    def _timed(search_func, query, started):
+        results = search_func(query)
+        return results, (time.monotonic() - started) * 1000
+
+    def search(self, search_func, primary, fallback=None):
+        started = time.monotonic()
+        deadline = started + self.deadline_seconds
+        hedge_at = started + max(self.hedge_delay_seconds, 0)
+        timing = {"primary_ms": None, "fallback_ms": None, "fallback_started_ms": None, "winner": None}
+        futures = {self._executor.submit(self._timed, search_func, primary, started): "primary"}
+        fallback_pending = bool(fallback) and fallback != primary
+        winner_results = []
+        errors = []
+        timed_out = False
+
+        while futures or fallback_pending:
+            now = time.monotonic()
+            # Fallback di-hedge: jalan setelah delay, atau lebih cepat kalau primary sudah kosong/gagal.
+            if fallback_pending and (not futures or now >= hedge_at):
+                timing["fallback_started_ms"] = round((now - started) * 1000, 1)
+                futures[self._executor.submit(self._timed, search_func, fallback, started)] = "fallback"
+                fallback_pending = False
+            if now >= deadline:
+                timed_out = True
+                break
+            wait_until = min(deadline, hedge_at) if fallback_pending else deadline
+            done, _ = wait(list(futures), timeout=max(wait_until - now, 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                label = futures.pop(future)
+                try:
+                    results, finished_ms = future.result()
+                except Exception as exc:
+                    errors.append(exc)
+                    finished_ms = (time.monotonic() - started) * 1000
+                    results = []
+                timing[f"{label}_ms"] = round(finished_ms, 1)
+                if results and timing["winner"] is None:
+                    timing["winner"] = label
+                    winner_results = results
+            if timing["winner"]:
+                break
+
+        # Pencarian yang sudah berjalan tidak bisa diinterupsi; hasilnya diabaikan.
+        for future in futures:
+            future.cancel()
+        timing["total_ms"] = round((time.monotonic() - started) * 1000, 1)
+        timing["timed_out"] = timed_out and not timing["winner"]
+        with self._lock:
+            self._stats["searches"] += 1
+            self._stats["fallback_launched"] += timing["fallback_started_ms"] is not None
+            self._stats["fallback_wins"] += timing["winner"] == "fallback"
+            self._stats["timeouts"] += timing["timed_out"]
+            self._stats["last"] = timing
+        if not timing["winner"]:
+            if timing["timed_out"]:
+                raise TimeoutError(f"web search melebihi {self.deadline_seconds:g} detik")
+            if errors:
+                raise errors[0]
+        return winner_results, timing
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+web_search_executor = WebSearchExecutor(
+    WEB_SEARCH_MAX_WORKERS, WEB_SEARCH_HEDGE_DELAY_MS / 1000, WEB_SEARCH_DEADLINE_SECONDS
+)
+
+
+def search_web_live(query, corr_id="-"):
     log = get_logger(corr_id)
     main_query = str(query or "").strip()
     fallback_query = normalize_web_query(main_query)
-    log.info("Searching web: %s", main_query)
+    log.info("Searching web via %s: %s (fallback: %s)", web_search_provider.name, main_query, fallback_query)
     try:
-        results = DDGS().text(main_query, max_results=WEB_SEARCH_MAX_RESULTS)
-        if not results and fallback_query and fallback_query != main_query:
-            log.info("Searching web fallback query: %s", fallback_query)
-            results = DDGS().text(fallback_query, max_results=WEB_SEARCH_MAX_RESULTS)
+        results, timing = web_search_executor.search(
+            lambda text: web_search_provider.text(text, max_results=WEB_SEARCH_MAX_RESULTS), main_query, fallback_query
+        )
+        log.info(
+            "Web search timing winner=%s total_ms=%s primary_ms=%s fallback_ms=%s fallback_started_ms=%s",
+            timing["winner"],
+            timing["total_ms"],
+            timing["primary_ms"],
+            timing["fallback_ms"],
+            timing["fallback_started_ms"],
+        )
         if not results:
             return "Tidak ada info terkini."
         summary = ""
@@ -375,13 +1607,87 @@ def cari_di_internet(query, corr_id="-"):
         return f"Gagal searching: {exc}"
 
 
-def upload_ke_drive(file_path, mime_type, custom_name=None, corr_id="-"):
-    log = get_logger(corr_id)
-    service = get_google_service("drive", "v3", corr_id=corr_id)
-    if not service:
-        return "❌ Gagal koneksi Drive."
+def drive_upload_chunk_bytes():
+    # Ukuran chunk resumable wajib kelipatan 256 KiB.
+    unit = 256 * 1024
+    return max(int(DRIVE_UPLOAD_CHUNK_MB * 1024 * 1024) // unit, 1) * unit
+
+
+def is_retryable_upload_error(exc):
+    if isinstance(exc, HttpError):
+        return exc.resp.status == 429 or exc.resp.status >= 500
+    return isinstance(exc, (OSError, httplib2.HttpLib2Error))
 
+
+def upload_media_resumable(upload_request, log, progress=None):
+    retries = 0
+    response = None
+    while response is None:
+        try:
+            status, response = upload_request.next_chunk(num_retries=2)
+        except Exception as exc:
+            if not is_retryable_upload_error(exc) or retries >= DRIVE_UPLOAD_MAX_RETRIES:
+                raise
+            retries += 1
+            # HttpRequest menyimpan resumable_uri & offset; panggilan berikutnya lanjut dari byte terakhir.
+            delay = min(2**retries, 30) + random.random()
+            log.warning(
+                "Drive chunk failed offset=%s retry=%s/%s in %.1fs: %s",
+                getattr(upload_request, "resumable_progress", 0),
+                retries,
+                DRIVE_UPLOAD_MAX_RETRIES,
+                delay,
+                exc,
+            )
+            if progress:
+                progress(getattr(upload_request, "resumable_progress", 0), None, retries)
+            time.sleep(delay)
+            continue
+        if status is not None and progress:
+            progress(status.resumable_progress, status.total_size, retries)
+    return response
+
+
+def file_sha256(file_path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as handle:
+        for block in iter(lambda: handle.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def find_duplicate_upload(file_path, force_new=False):
+    if not DRIVE_UPLOAD_DEDUP_ENABLED:
+        return None, None
+    content_hash = file_sha256(file_path)
+    if force_new:
+        return content_hash, None
+    return content_hash, drive_index.find_by_hash(content_hash, PARENT_FOLDER_ID)
+
+
+def format_duplicate_upload_reply(existing):
+    return (
+        f"✅ **File sudah ada di Drive**\n📂 {existing['name']}\n🔗 {existing['webViewLink']}\n"
+        "Ketik 'salinan baru' kalau tetap mau diunggah ulang."
+    )
+
+
+def upload_ke_drive(
+    file_path, mime_type, custom_name=None, corr_id="-", progress=None, force_new=False, content_hash=None
+):
+    log = get_logger(corr_id)
     try:
+        existing = None
+        if content_hash is None:
+            content_hash, existing = find_duplicate_upload(file_path, force_new=force_new)
+        if existing:
+            log.info("Skipping duplicate upload sha256=%s file_id=%s", content_hash, existing["id"])
+            return format_duplicate_upload_reply(existing)
+
+        service = get_google_service("drive", "v3", corr_id=corr_id)
+        if not service:
+            return "❌ Gagal koneksi Drive."
+
         final_name = os.path.basename(file_path)
         if custom_name:
             clean_name = "".join([c for c in custom_name if c.isalnum() or c in (" ", "-", "_")]).strip()
@@ -392,12 +1698,21 @@ def upload_ke_drive(file_path, mime_type, custom_name=None, corr_id="-"):
                 final_name = clean_name
 
         file_metadata = {"name": final_name, "parents": [PARENT_FOLDER_ID]}
-        media = MediaFileUpload(file_path, mimetype=mime_type)
-        file = (
-            service.files()
-            .create(body=file_metadata, media_body=media, fields="id, webViewLink")
-            .execute(num_retries=2)
+        chunk_bytes = drive_upload_chunk_bytes()
+        resumable = os.path.getsize(file_path) > chunk_bytes
+        media = MediaFileUpload(file_path, mimetype=mime_type, chunksize=chunk_bytes, resumable=resumable)
+        upload_request = service.files().create(
+            body=file_metadata, media_body=media, fields="id, name, mimeType, createdTime, webViewLink"
         )
+        if resumable:
+            file = upload_media_resumable(upload_request, log, progress=progress)
+        else:
+            file = upload_request.execute(num_retries=2)
+        if DRIVE_INDEX_ENABLED and file.get("id"):
+            drive_index.upsert_file({"name": final_name, **file}, PARENT_FOLDER_ID)
+        if content_hash and file.get("id"):
+            drive_index.record_hash(content_hash, PARENT_FOLDER_ID, {"name": final_name, **file})
+        invalidate_drive_search_cache()
         return f"✅ **File Disimpan!**\n📂 {final_name}\n🔗 {file.get('webViewLink')}"
     except Exception as exc:
         log.exception("Drive upload failed: %s", exc)
@@ -410,16 +1725,437 @@ def upload_ke_drive(file_path, mime_type, custom_name=None, corr_id="-"):
                 log.warning("Failed cleanup temp file %s: %s", file_path, exc)
 
 
+class DriveUploadWorker:
+    def __init__(self, max_workers, history_size=100):
+        self._executor = ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix="drive-upload")
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._history_size = history_size
+        self._stats = {"queued": 0, "completed": 0, "failed": 0, "bytes_uploaded": 0, "chunk_retries": 0}
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def _progress(self, job_id):
+        def report(bytes_sent, total_bytes, retries):
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    return
+                elapsed = max(time.monotonic() - job["_started"], 1e-6)
+                job["bytes_sent"] = bytes_sent
+                job["retries"] = retries
+                job["throughput_kbps"] = round(bytes_sent / 1024 / elapsed, 1)
+                if total_bytes:
+                    job["total_bytes"] = total_bytes
+
+        return report
+
+    def _run(self, job_id, sender, file_path, mime_type, custom_name, corr_id, force_new, content_hash):
+        log = get_logger(corr_id)
+        self._update(job_id, state="uploading", _started=time.monotonic())
+        progress = self._progress(job_id)
+        result = upload_ke_drive(
+            file_path,
+            mime_type,
+            custom_name=custom_name,
+            corr_id=corr_id,
+            progress=progress,
+            force_new=force_new,
+            content_hash=content_hash,
+        )
+        ok = result.startswith("✅")
+        with self._lock:
+            job = self._jobs.get(job_id, {})
+            job["state"] = "done" if ok else "failed"
+            job["duration_s"] = round(time.monotonic() - job.get("_started", time.monotonic()), 2)
+            self._stats["completed" if ok else "failed"] += 1
+            self._stats["chunk_retries"] += job.get("retries", 0)
+            if ok:
+                job["bytes_sent"] = job.get("total_bytes", job.get("bytes_sent", 0))
+                self._stats["bytes_uploaded"] += job["bytes_sent"]
+        log.info("Background upload %s finished state=%s", job_id, "done" if ok else "failed")
+        wa_outbox.enqueue(sender, result, idempotency_key=f"upload:{job_id}")
+        return result
+
+    def submit(self, sender, file_path, mime_type, custom_name=None, corr_id="-", force_new=False, content_hash=None):
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._jobs[job_id] = {
+                "state": "queued",
+                "name": custom_name or os.path.basename(file_path),
+                "total_bytes": os.path.getsize(file_path),
+                "bytes_sent": 0,
+                "retries": 0,
+            }
+            while len(self._jobs) > self._history_size:
+                self._jobs.popitem(last=False)
+            self._stats["queued"] += 1
+        future = self._executor.submit(
+            self._run, job_id, sender, file_path, mime_type, custom_name, corr_id, force_new, content_hash
+        )
+        return job_id, future
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["active"] = [
+                {key: value for key, value in dict(job, id=job_id).items() if not key.startswith("_")}
+                for job_id, job in self._jobs.items()
+                if job["state"] in {"queued", "uploading"}
+            ]
+        return stats
+
+
+drive_uploader = DriveUploadWorker(DRIVE_UPLOAD_MAX_WORKERS)
+
+
+drive_search_cache = make_cache("drive_search", DRIVE_SEARCH_CACHE_SIZE, DRIVE_SEARCH_CACHE_TTL_SECONDS)
+
+
+def drive_search_cache_key(safe_keyword):
+    return (PARENT_FOLDER_ID, " ".join(safe_keyword.lower().split()))
+
+
+def invalidate_drive_search_cache(folder_id=None):
+    folder_id = folder_id or PARENT_FOLDER_ID
+    return drive_search_cache.invalidate(lambda key: key[0] == folder_id)
+
+
+def format_drive_search_result(safe_keyword, items):
+    if not items:
+        return f"⚠️ File *'{safe_keyword}'* tidak ditemukan di dalam Folder Kerja Hunky."
+
+    balasan = f"📂 **Hasil Pencarian '{safe_keyword}':**\n"
+    for item in items:
+        balasan += f"\n📄 {item.get('name', '-')}\n🔗 {item.get('webViewLink', '-')}\n"
+    return balasan
+
+
+class DriveIndex:
+    SCHEMA = """
+CREATE TABLE IF NOT EXISTS drive_files (
+    id TEXT PRIMARY KEY,
+    folder_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    mime_type TEXT NOT NULL DEFAULT '',
+    created_time TEXT NOT NULL DEFAULT '',
+    web_view_link TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_drive_files_folder ON drive_files (folder_id, created_time);
+CREATE VIRTUAL TABLE IF NOT EXISTS drive_files_fts USING fts5(
+    name, content='drive_files', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS drive_files_ai AFTER INSERT ON drive_files BEGIN
+    INSERT INTO drive_files_fts (rowid, name) VALUES (new.rowid, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS drive_files_ad AFTER DELETE ON drive_files BEGIN
+    INSERT INTO drive_files_fts (drive_files_fts, rowid, name) VALUES ('delete', old.rowid, old.name);
+END;
+CREATE TRIGGER IF NOT EXISTS drive_files_au AFTER UPDATE ON drive_files BEGIN
+    INSERT INTO drive_files_fts (drive_files_fts, rowid, name) VALUES ('delete', old.rowid, old.name);
+    INSERT INTO drive_files_fts (rowid, name) VALUES (new.rowid, new.name);
+END;
+CREATE TABLE IF NOT EXISTS drive_sync_state (
+    folder_id TEXT PRIMARY KEY,
+    page_token TEXT NOT NULL,
+    synced_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS drive_content_hashes (
+    sha256 TEXT NOT NULL,
+    folder_id TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    web_view_link TEXT NOT NULL,
+    uploaded_at REAL NOT NULL,
+    PRIMARY KEY (sha256, folder_id)
+);
+"""
+    # Trigram butuh SQLite >= 3.34; tanpa itu pencarian substring/fuzzy dilewati.
+    TRIGRAM_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS drive_files_trigram USING fts5(
+    name, content='drive_files', content_rowid='rowid', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS drive_files_trigram_ai AFTER INSERT ON drive_files BEGIN
+    INSERT INTO drive_files_trigram (rowid, name) VALUES (new.rowid, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS drive_files_trigram_ad AFTER DELETE ON drive_files BEGIN
+    INSERT INTO drive_files_trigram (drive_files_trigram, rowid, name) VALUES ('delete', old.rowid, old.name);
+END;
+CREATE TRIGGER IF NOT EXISTS drive_files_trigram_au AFTER UPDATE ON drive_files BEGIN
+    INSERT INTO drive_files_trigram (drive_files_trigram, rowid, name) VALUES ('delete', old.rowid, old.name);
+    INSERT INTO drive_files_trigram (rowid, name) VALUES (new.rowid, new.name);
+END;
+"""
+    FILE_FIELDS = "id, name, mimeType, createdTime, webViewLink, parents, trashed"
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._thread = None
+        self._stopped = threading.Event()
+        self._stats = {"local_hits": 0, "fuzzy_hits": 0, "syncs": 0, "sync_errors": 0, "dedup_hits": 0}
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(self.SCHEMA)
+        try:
+            self._conn.executescript(self.TRIGRAM_SCHEMA)
+            self.has_trigram = True
+        except sqlite3.OperationalError:
+            self.has_trigram = False
+
+    @contextmanager
+    def _write_txn(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _upsert(self, conn, file, folder_id):
+        conn.execute(
+            "INSERT INTO drive_files (id, folder_id, name, mime_type, created_time, web_view_link) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET folder_id = excluded.folder_id, name = excluded.name, "
+            "mime_type = excluded.mime_type, created_time = excluded.created_time, "
+            "web_view_link = excluded.web_view_link",
+            (
+                file["id"],
+                folder_id,
+                file.get("name", ""),
+                file.get("mimeType", ""),
+                file.get("createdTime", ""),
+                file.get("webViewLink", ""),
+            ),
+        )
+
+    def upsert_file(self, file, folder_id):
+        with self._write_txn() as conn:
+            self._upsert(conn, file, folder_id)
+
+    def record_hash(self, sha256, folder_id, file):
+        with self._write_txn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO drive_content_hashes "
+                "(sha256, folder_id, file_id, name, web_view_link, uploaded_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (sha256, folder_id, file["id"], file.get("name", ""), file.get("webViewLink", ""), time.time()),
+            )
+
+    def find_by_hash(self, sha256, folder_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT file_id, name, web_view_link FROM drive_content_hashes WHERE sha256 = ? AND folder_id = ?",
+                (sha256, folder_id),
+            ).fetchone()
+            if row is None:
+                return None
+            # Kalau mirror sudah sinkron, file yang dihapus/dipindah dari folder tidak boleh dipakai lagi.
+            if self.is_warm(folder_id) and not self._conn.execute(
+                "SELECT 1 FROM drive_files WHERE id = ? AND folder_id = ?", (row["file_id"], folder_id)
+            ).fetchone():
+                self._conn.execute(
+                    "DELETE FROM drive_content_hashes WHERE sha256 = ? AND folder_id = ?", (sha256, folder_id)
+                )
+                return None
+            self._stats["dedup_hits"] += 1
+        return {"id": row["file_id"], "name": row["name"], "webViewLink": row["web_view_link"]}
+
+    def is_warm(self, folder_id):
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM drive_sync_state WHERE folder_id = ?", (folder_id,)).fetchone()
+        return row is not None
+
+    def _full_sync(self, service, folder_id):
+        # Token diambil sebelum listing supaya perubahan selama listing tetap terbawa.
+        start_token = service.changes().getStartPageToken().execute(num_retries=2)["startPageToken"]
+        files = []
+        page_token = None
+        while True:
+            response = (
+                service.files()
+                .list(
+                    q=f"'{folder_id}' in parents and trashed = false",
+                    pageSize=1000,
+                    pageToken=page_token,
+                    fields=f"nextPageToken, files({self.FILE_FIELDS})",
+                )
+                .execute(num_retries=2)
+            )
+            files.extend(response.get("files", []))
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+        with self._write_txn() as conn:
+            conn.execute("DELETE FROM drive_files WHERE folder_id = ?", (folder_id,))
+            for file in files:
+                self._upsert(conn, file, folder_id)
+            conn.execute(
+                "INSERT OR REPLACE INTO drive_sync_state (folder_id, page_token, synced_at) VALUES (?, ?, ?)",
+                (folder_id, start_token, time.time()),
+            )
+        return len(files)
+
+    def _incremental_sync(self, service, folder_id, page_token):
+        changed = 0
+        while page_token:
+            response = (
+                service.changes()
+                .list(
+                    pageToken=page_token,
+                    pageSize=1000,
+                    spaces="drive",
+                    includeRemoved=True,
+                    fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({self.FILE_FIELDS}))",
+                )
+                .execute(num_retries=2)
+            )
+            with self._write_txn() as conn:
+                for change in response.get("changes", []):
+                    file = change.get("file") or {}
+                    in_folder = folder_id in (file.get("parents") or [])
+                    if change.get("removed") or file.get("trashed") or not in_folder:
+                        conn.execute(
+                            "DELETE FROM drive_files WHERE id = ? AND folder_id = ?",
+                            (change.get("fileId"), folder_id),
+                        )
+                    else:
+                        self._upsert(conn, file, folder_id)
+                    changed += 1
+                next_token = response.get("nextPageToken") or response.get("newStartPageToken")
+                conn.execute(
+                    "UPDATE drive_sync_state SET page_token = ?, synced_at = ? WHERE folder_id = ?",
+                    (next_token, time.time(), folder_id),
+                )
+            page_token = response.get("nextPageToken")
+        return changed
+
+    def sync(self, service, folder_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page_token FROM drive_sync_state WHERE folder_id = ?", (folder_id,)
+            ).fetchone()
+        if row is None:
+            changed = self._full_sync(service, folder_id)
+        else:
+            changed = self._incremental_sync(service, folder_id, row["page_token"])
+        with self._lock:
+            self._stats["syncs"] += 1
+        return changed
+
+    def _rows_to_items(self, rows):
+        return [{"name": row["name"], "webViewLink": row["web_view_link"]} for row in rows]
+
+    def _match(self, table, match_query, folder_id, limit):
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT f.name, f.web_view_link FROM {table} "
+                f"JOIN drive_files f ON f.rowid = {table}.rowid "
+                f"WHERE {table} MATCH ? AND f.folder_id = ? "
+                f"ORDER BY bm25({table}), f.created_time DESC LIMIT ?",
+                (match_query, folder_id, limit),
+            ).fetchall()
+
+    def _fuzzy(self, keyword, folder_id, limit):
+        grams = {keyword[i : i + 3] for i in range(len(keyword) - 2)}
+        if not self.has_trigram or not grams:
+            return []
+        match_query = " OR ".join('"' + gram.replace('"', '""') + '"' for gram in grams)
+        candidates = self._match("drive_files_trigram", match_query, folder_id, 50)
+        scored = []
+        for row in candidates:
+            name = row["name"].lower()
+            overlap = sum(1 for gram in grams if gram in name) / len(grams)
+            if overlap >= DRIVE_INDEX_FUZZY_MIN_OVERLAP:
+                scored.append((overlap, row))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return [row for _, row in scored[:limit]]
+
+    def search(self, keyword, folder_id, limit=5):
+        text = str(keyword or "").lower().strip()
+        tokens = re.findall(r"\w+", text, flags=re.UNICODE)
+        if not tokens:
+            return []
+        prefix_query = " AND ".join('"' + token.replace('"', '""') + '"*' for token in tokens)
+        rows = self._match("drive_files_fts", prefix_query, folder_id, limit)
+        if not rows and self.has_trigram and len(text) >= 3:
+            rows = self._match("drive_files_trigram", '"' + text.replace('"', '""') + '"', folder_id, limit)
+        fuzzy = False
+        if not rows:
+            rows = self._fuzzy(text, folder_id, limit)
+            fuzzy = bool(rows)
+        with self._lock:
+            self._stats["local_hits"] += 1
+            if fuzzy:
+                self._stats["fuzzy_hits"] += 1
+        return self._rows_to_items(rows)
+
+    def _run(self, folder_id):
+        log = get_logger("drive-index")
+        while not self._stopped.is_set():
+            service = get_google_service("drive", "v3", corr_id="drive-index")
+            if service:
+                try:
+                    changed = self.sync(service, folder_id)
+                    if changed:
+                        log.info("Drive index synced folder=%s changes=%s", folder_id, changed)
+                        invalidate_drive_search_cache(folder_id)
+                except Exception as exc:
+                    with self._lock:
+                        self._stats["sync_errors"] += 1
+                    log.exception("Drive index sync failed: %s", exc)
+            self._stopped.wait(DRIVE_INDEX_SYNC_INTERVAL_SECONDS)
+
+    def start(self, folder_id):
+        if not folder_id or (self._thread and self._thread.is_alive()):
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, args=(folder_id,), name="drive-index", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["files"] = self._conn.execute("SELECT COUNT(*) FROM drive_files").fetchone()[0]
+        return stats
+
+
+drive_index = DriveIndex(DRIVE_INDEX_DB_FILE)
+
+
 def cari_file_di_drive(keyword, corr_id="-"):
     log = get_logger(corr_id)
-    service = get_google_service("drive", "v3", corr_id=corr_id)
-    if not service:
-        return "❌ Gagal koneksi Drive."
-
     safe_keyword = sanitize_drive_keyword(keyword)
     if not safe_keyword:
         return "⚠️ Keyword file tidak valid."
 
+    cache_key = drive_search_cache_key(safe_keyword)
+    cached_items = drive_search_cache.get(cache_key)
+    if cached_items is not None:
+        return format_drive_search_result(safe_keyword, cached_items)
+
+    if DRIVE_INDEX_ENABLED and drive_index.is_warm(PARENT_FOLDER_ID):
+        try:
+            items = drive_index.search(safe_keyword.replace("\\'", "'"), PARENT_FOLDER_ID)
+            drive_search_cache.set(cache_key, items)
+            return format_drive_search_result(safe_keyword, items)
+        except sqlite3.Error as exc:
+            log.warning("Local Drive index search failed, falling back to API: %s", exc)
+
+    service = get_google_service("drive", "v3", corr_id=corr_id)
+    if not service:
+        return "❌ Gagal koneksi Drive."
+
     try:
         query = f"name contains '{safe_keyword}' and '{PARENT_FOLDER_ID}' in parents and trashed = false"
         results = (
@@ -433,73 +2169,562 @@ def cari_file_di_drive(keyword, corr_id="-"):
             .execute(num_retries=2)
         )
         items = results.get("files", [])
+        drive_search_cache.set(cache_key, items)
+        return format_drive_search_result(safe_keyword, items)
+    except Exception as exc:
+        log.exception("Drive search failed: %s", exc)
+        return f"❌ Error cari file: {exc}"
+
+
+SCHEDULE_PROMPT_PATTERN = re.compile(r"\b(jadwal|meeting|rapat|agenda|reminder|ingatkan)\b", re.IGNORECASE)
+
+
+def format_schedule_for_prompt(items):
+    # Satu baris per meeting, field kosong dibuang: jauh lebih hemat token daripada json.dumps(indent=2).
+    if not items:
+        return "(kosong)"
+    lines = []
+    for item in items:
+        parts = [f"{item['date']} {item['time']}", item.get("topic") or "-"]
+        for label, key in (("lokasi", "location"), ("link", "link"), ("dengan", "people_to_meet"), ("pic", "pic_partner")):
+            value = str(item.get(key) or "").strip()
+            if value and value != "-":
+                parts.append(f"{label}: {value}")
+        if item.get("reminded"):
+            parts.append("sudah diingatkan")
+        lines.append("- " + " | ".join(parts))
+    return "\n".join(lines)
+
+
+def estimate_prompt_tokens(text):
+    # Tanpa tokenizer resmi: ~4 karakter per token cukup untuk memantau tren ukuran prompt.
+    return (len(text) + 3) // 4
+
+
+class SystemPromptBuilder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._repo = None
+        self._blocks = {}
+        self._generation = 0
+        self._stats = {
+            "prompts": 0,
+            "with_schedule": 0,
+            "block_hits": 0,
+            "block_renders": 0,
+            "tokens_total": 0,
+            "tokens_max": 0,
+            "schedule_tokens_max": 0,
+        }
+
+    def _on_meeting_change(self, event, items):
+        with self._lock:
+            self._generation += 1
+            if event == "reload":
+                self._blocks.clear()
+            else:
+                for item in items:
+                    self._blocks.pop(item["group_id"], None)
+
+    def _bind(self, repo):
+        with self._lock:
+            if self._repo is repo:
+                return
+            self._repo = repo
+            self._blocks.clear()
+        repo.subscribe(self._on_meeting_change)
+
+    def schedule_block(self, group_id):
+        repo = meeting_repo
+        self._bind(repo)
+        repo.refresh()
+        with self._lock:
+            block = self._blocks.get(group_id)
+            if block is not None:
+                self._stats["block_hits"] += 1
+                return block
+            generation = self._generation
+        block = format_schedule_for_prompt(repo.list_by_group(group_id))
+        with self._lock:
+            # Jangan simpan blok yang dirender sebelum ada write di tengah jalan.
+            if generation == self._generation:
+                self._blocks[group_id] = block
+            self._stats["block_renders"] += 1
+            self._stats["schedule_tokens_max"] = max(self._stats["schedule_tokens_max"], estimate_prompt_tokens(block))
+        return block
+
+    def build(self, group_id, konteks_tambahan="", include_schedule=True):
+        waktu_sekarang = now_wib_naive().strftime("%A, %Y-%m-%d Jam %H:%M WIB")
+        jadwal_line = ""
+        if include_schedule:
+            jadwal_line = f"DATABASE MEETING GROUP:\n{self.schedule_block(group_id)}\n"
+        prompt = f"""
+Kamu adalah HUNKY, asisten AI.
+INFO: Waktu {waktu_sekarang}.
+GROUP_ID: {group_id}
+{jadwal_line}KONTEKS TAMBAHAN: {konteks_tambahan}
+
+ATURAN:
+1. Jika ingin menjalankan aksi, output HARUS JSON valid object tunggal.
+2. Gunakan hanya action ini: save_meeting, search_file, web_search, search_meeting, reset_schedule.
+3. save_meeting.data wajib punya date(YYYY-MM-DD), time(HH:MM), topic, location, link.
+4. Jika bukan aksi, jawab sebagai asisten AI biasa: natural, ringkas, dan langsung.
+5. Hindari JSON bila tidak menjalankan action. Jika terpaksa JSON tanpa action, pakai {{"action": null, "text": "..."}}.
+6. Untuk pertanyaan kemampuan bot, penjelasan, atau percakapan umum, WAJIB jawab teks biasa (bukan action JSON).
+7. Kamu punya akses pencarian file Google Drive Folder Kerja Hunky lewat action search_file.
+8. Jika user minta ambil/cari file dari Google Drive, gunakan action search_file dan isi keyword yang relevan.
+9. Untuk pertanyaan umum non-berita, jawab dari pengetahuan umum; jangan bilang tidak ada data terbaru atau menyuruh mencari sumber resmi.
+""".strip()
+        tokens = estimate_prompt_tokens(prompt)
+        with self._lock:
+            self._stats["prompts"] += 1
+            self._stats["with_schedule"] += include_schedule
+            self._stats["tokens_total"] += tokens
+            self._stats["tokens_max"] = max(self._stats["tokens_max"], tokens)
+        return prompt
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, cached_groups=len(self._blocks))
+        tokens_total = stats.pop("tokens_total")
+        stats["avg_tokens"] = round(tokens_total / stats["prompts"], 1) if stats["prompts"] else 0.0
+        return stats
+
+
+prompt_builder = SystemPromptBuilder()
+
+
+def build_ai_system_instruction(group_id, konteks_tambahan="", include_schedule=True):
+    return prompt_builder.build(group_id, konteks_tambahan, include_schedule=include_schedule)
+
+
+def needs_schedule_context(message, routed=None):
+    return (routed or {}).get("intent") == "meeting_flow" or bool(SCHEDULE_PROMPT_PATTERN.search(message or ""))
+
+
+class BlackboxClient:
+    def __init__(self, url, api_key, timeout_seconds, max_in_flight, acquire_timeout_seconds):
+        self.url = url
+        self.api_key = api_key
+        self.timeout_seconds = timeout_seconds
+        self.max_in_flight = max(max_in_flight, 1)
+        self.acquire_timeout_seconds = acquire_timeout_seconds
+        # Pool koneksi = batas in-flight, jadi request yang lolos semaphore tidak antre lagi di urllib3.
+        self.session = create_retry_session(pool_maxsize=self.max_in_flight)
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._async_executor = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "errors": 0,
+            "rejected": 0,
+            "in_flight": 0,
+            "peak_in_flight": 0,
+            "queue_wait_ms_total": 0.0,
+            "queue_wait_ms_max": 0.0,
+            "latency_ms_total": 0.0,
+            "latency_ms_max": 0.0,
+            "stream_requests": 0,
+            "ttfb_ms_total": 0.0,
+            "ttfb_ms_max": 0.0,
+        }
+
+    def _headers(self):
+        return {"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}"}
+
+    @contextmanager
+    def _slot(self):
+        queued = time.monotonic()
+        if not self._slots.acquire(timeout=self.acquire_timeout_seconds):
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise TimeoutError(f"Blackbox sibuk: {self.max_in_flight} request masih berjalan")
+        waited_ms = (time.monotonic() - queued) * 1000
+        with self._lock:
+            self._stats["in_flight"] += 1
+            self._stats["peak_in_flight"] = max(self._stats["peak_in_flight"], self._stats["in_flight"])
+            self._stats["queue_wait_ms_total"] += waited_ms
+            self._stats["queue_wait_ms_max"] = max(self._stats["queue_wait_ms_max"], waited_ms)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._stats["in_flight"] -= 1
+            self._slots.release()
+
+    def _record(self, started, ok, ttfb_ms=None):
+        latency_ms = (time.monotonic() - started) * 1000
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["errors"] += not ok
+            self._stats["latency_ms_total"] += latency_ms
+            self._stats["latency_ms_max"] = max(self._stats["latency_ms_max"], latency_ms)
+            if ttfb_ms is not None:
+                self._stats["stream_requests"] += 1
+                self._stats["ttfb_ms_total"] += ttfb_ms
+                self._stats["ttfb_ms_max"] = max(self._stats["ttfb_ms_max"], ttfb_ms)
+
+    def post(self, payload, **kwargs):
+        with self._slot():
+            started = time.monotonic()
+            ok = False
+            try:
+                response = self.session.post(
+                    self.url, headers=self._headers(), json=payload, timeout=self.timeout_seconds, **kwargs
+                )
+                ok = response.status_code == 200
+                return response
+            finally:
+                self._record(started, ok)
+
+    def stream(self, payload):
+        # Generator: slot in-flight dipegang sampai stream habis atau ditutup pemanggil.
+        with self._slot():
+            started = time.monotonic()
+            ok = False
+            ttfb_ms = None
+            response = None
+            try:
+                response = self.session.post(
+                    self.url,
+                    headers=self._headers(),
+                    json={**payload, "stream": True},
+                    timeout=self.timeout_seconds,
+                    stream=True,
+                )
+                if response.status_code != 200:
+                    yield parse_blackbox_response(response)
+                    return
+                ok = True
+                if "text/event-stream" not in response.headers.get("Content-Type", ""):
+                    # API membalas non-streaming: teruskan jawaban utuh sebagai satu chunk.
+                    ttfb_ms = (time.monotonic() - started) * 1000
+                    yield parse_blackbox_response(response)
+                    return
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        event = json.loads(data)
+                    except JSONDecodeError:
+                        continue
+                    choice = (event.get("choices") or [{}])[0]
+                    text = (choice.get("delta") or {}).get("content") or (choice.get("message") or {}).get("content")
+                    if text:
+                        if ttfb_ms is None:
+                            ttfb_ms = (time.monotonic() - started) * 1000
+                        yield text
+            finally:
+                if response is not None:
+                    response.close()
+                self._record(started, ok, ttfb_ms=ttfb_ms)
+
+    async def apost(self, payload):
+        # Varian asyncio: I/O tetap lewat session yang sama di executor sebesar batas in-flight.
+        with self._lock:
+            if self._async_executor is None:
+                self._async_executor = ThreadPoolExecutor(
+                    max_workers=self.max_in_flight, thread_name_prefix="blackbox-async"
+                )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._async_executor, self.post, payload)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        requests_done = stats["requests"] + stats["in_flight"]
+        stats["avg_queue_wait_ms"] = round(stats.pop("queue_wait_ms_total") / requests_done, 1) if requests_done else 0.0
+        stats["avg_latency_ms"] = round(stats.pop("latency_ms_total") / stats["requests"], 1) if stats["requests"] else 0.0
+        stats["queue_wait_ms_max"] = round(stats["queue_wait_ms_max"], 1)
+        stats["latency_ms_max"] = round(stats["latency_ms_max"], 1)
+        ttfb_total = stats.pop("ttfb_ms_total")
+        stats["avg_ttfb_ms"] = round(ttfb_total / stats["stream_requests"], 1) if stats["stream_requests"] else 0.0
+        stats["ttfb_ms_max"] = round(stats["ttfb_ms_max"], 1)
+        stats["max_in_flight"] = self.max_in_flight
+        return stats
+
+
+blackbox_client = BlackboxClient(
+    BLACKBOX_API_URL,
+    BLACKBOX_API_KEY,
+    BLACKBOX_TIMEOUT_SECONDS,
+    BLACKBOX_MAX_IN_FLIGHT,
+    BLACKBOX_QUEUE_TIMEOUT_SECONDS,
+)
+
+
+# Satu panggilan, satu bentuk: teks di "text" atau aksi di "action" (+ field aksi), tidak perlu rewrite ulang.
+REPLY_JSON_SCHEMA = {
+    "name": "hunky_reply",
+    "schema": {
+        "type": "object",
+        "properties": {
+            "action": {"type": ["string", "null"], "enum": sorted(ALLOWED_ACTIONS) + [None]},
+            "text": {"type": "string"},
+            "keyword": {"type": "string"},
+            "date": {"type": "string"},
+            "data": {"type": "object"},
+        },
+        "required": ["action"],
+    },
+}
+
+
+def build_blackbox_payload(pesan_user, group_id, konteks_tambahan="", include_schedule=True, history=None):
+    system_instruction = build_ai_system_instruction(group_id, konteks_tambahan, include_schedule=include_schedule)
+    payload = {
+        "messages": [
+            {"role": "system", "content": system_instruction},
+            *(history or []),
+            {"role": "user", "content": pesan_user},
+        ],
+        "model": BLACKBOX_MODEL,
+        "clickedAnswer2": False,
+        "clickedAnswer3": False,
+    }
+    if BLACKBOX_STRUCTURED_OUTPUT:
+        payload["response_format"] = {"type": "json_schema", "json_schema": REPLY_JSON_SCHEMA}
+    return payload
+
+
+def parse_blackbox_response(response):
+    if response.status_code != 200:
+        return f"Error API Blackbox: {response.status_code} - {response.text}"
+
+    hasil = response.json()
+    return (
+        hasil.get("choices", [{}])[0].get("message", {}).get("content", "")
+        or hasil.get("response", "")
+        or str(hasil)
+    )
+
+
+def tanya_blackbox(
+    pesan_user, group_id, konteks_tambahan="", corr_id="-", include_schedule=True, history=None
+):
+    log = get_logger(corr_id)
+    payload = build_blackbox_payload(
+        pesan_user, group_id, konteks_tambahan, include_schedule=include_schedule, history=history
+    )
+    try:
+        return parse_blackbox_response(blackbox_client.post(payload))
+    except Exception as exc:
+        log.exception("Blackbox request failed: %s", exc)
+        return f"Error Koneksi: {exc}"
+
+
+async def tanya_blackbox_async(
+    pesan_user, group_id, konteks_tambahan="", corr_id="-", include_schedule=True, history=None
+):
+    log = get_logger(corr_id)
+    payload = build_blackbox_payload(
+        pesan_user, group_id, konteks_tambahan, include_schedule=include_schedule, history=history
+    )
+    try:
+        return parse_blackbox_response(await blackbox_client.apost(payload))
+    except Exception as exc:
+        log.exception("Blackbox request failed: %s", exc)
+        return f"Error Koneksi: {exc}"
+
+
+def tanya_blackbox_stream(
+    pesan_user, group_id, konteks_tambahan="", corr_id="-", include_schedule=True, history=None
+):
+    log = get_logger(corr_id)
+    payload = build_blackbox_payload(
+        pesan_user, group_id, konteks_tambahan, include_schedule=include_schedule, history=history
+    )
+    # Error tidak disisipkan ke teks: pemanggil harus tahu stream gagal agar jawaban parsial tidak di-cache.
+    try:
+        yield from blackbox_client.stream(payload)
+    except Exception as exc:
+        log.exception("Blackbox stream failed: %s", exc)
+        raise
+
+
+def normalize_chat_cache_text(message):
+    lowered = re.sub(r"@\d{6,}|@?hunky\b", " ", str(message or "").lower())
+    lowered = re.sub(r"[^\w\s]", " ", lowered, flags=re.UNICODE)
+    return " ".join(lowered.split())
+
+
+class LlmAnswerCache:
+    # MinHash 8 band x 4 baris: pesan dengan Jaccard trigram ~0.85 hampir pasti jatuh di bucket yang sama.
+    BANDS = 8
+    ROWS = 4
+    PRIME = (1 << 61) - 1
+
+    def __init__(self, maxsize, ttl_seconds, near_duplicates=True, min_similarity=0.85):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.near_duplicates = near_duplicates
+        self.min_similarity = min_similarity
+        rng = random.Random(0x48554E4B)
+        self._perms = [(rng.randrange(1, self.PRIME), rng.randrange(self.PRIME)) for _ in range(self.BANDS * self.ROWS)]
+        self._data = OrderedDict()
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "near_hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def _shingles(text):
+        if len(text) < 3:
+            return frozenset([text])
+        return frozenset(text[i : i + 3] for i in range(len(text) - 2))
+
+    def _bands(self, scope, shingles):
+        hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingles]
+        signature = [min((a * h + b) % self.PRIME for h in hashes) for a, b in self._perms]
+        return [
+            (scope, band, tuple(signature[band * self.ROWS : (band + 1) * self.ROWS])) for band in range(self.BANDS)
+        ]
+
+    def _drop(self, key):
+        entry = self._data.pop(key, None)
+        for bucket_key in (entry or {}).get("bands", ()):
+            bucket = self._buckets.get(bucket_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[bucket_key]
+
+    def _live(self, key, now):
+        entry = self._data.get(key)
+        if entry is not None and entry["expires_at"] <= now:
+            self._drop(key)
+            entry = None
+        return entry
+
+    @staticmethod
+    def _numbers(text):
+        return tuple(re.findall(r"\d+", text))
+
+    def _nearest(self, scope, text, now):
+        # Angka harus sama persis: "1234 x 5678" vs "1234 x 5679" atau "http 1.1" vs "http 2" mirip secara
+        # trigram tapi jawabannya berbeda.
+        shingles = self._shingles(text)
+        numbers = self._numbers(text)
+        candidates = set()
+        for bucket_key in self._bands(scope, shingles):
+            candidates.update(self._buckets.get(bucket_key, ()))
+        best_key, best_score = None, self.min_similarity
+        for key in candidates:
+            entry = self._live(key, now)
+            if entry is None or entry["numbers"] != numbers:
+                continue
+            score = len(shingles & entry["shingles"]) / len(shingles | entry["shingles"])
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def get(self, scope, text):
+        if not text:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            key = (scope, text)
+            entry = self._live(key, now)
+            if entry is None and self.near_duplicates:
+                key = self._nearest(scope, text, now)
+                entry = self._data.get(key) if key else None
+                if entry is not None:
+                    self._stats["near_hits"] += 1
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry["value"]
+
+    def set(self, scope, text, value):
+        if not text or self.ttl_seconds <= 0 or self.maxsize <= 0:
+            return
+        key = (scope, text)
+        shingles = self._shingles(text)
+        bands = self._bands(scope, shingles) if self.near_duplicates else []
+        with self._lock:
+            self._drop(key)
+            self._data[key] = {
+                "expires_at": time.monotonic() + self.ttl_seconds,
+                "value": value,
+                "shingles": shingles,
+                "numbers": self._numbers(text),
+                "bands": bands,
+            }
+            for bucket_key in bands:
+                self._buckets.setdefault(bucket_key, set()).add(key)
+            while len(self._data) > self.maxsize:
+                self._drop(next(iter(self._data)))
+                self._stats["evictions"] += 1
 
-        if not items:
-            return f"⚠️ File *'{safe_keyword}'* tidak ditemukan di dalam Folder Kerja Hunky."
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._buckets.clear()
 
-        balasan = f"📂 **Hasil Pencarian '{safe_keyword}':**\n"
-        for item in items:
-            balasan += f"\n📄 {item.get('name', '-')}\n🔗 {item.get('webViewLink', '-')}\n"
-        return balasan
-    except Exception as exc:
-        log.exception("Drive search failed: %s", exc)
-        return f"❌ Error cari file: {exc}"
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, size=len(self._data), maxsize=self.maxsize)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
 
 
-def build_ai_system_instruction(group_id, konteks_tambahan=""):
-    waktu_sekarang = now_wib_naive().strftime("%A, %Y-%m-%d Jam %H:%M WIB")
-    jadwal_str = json.dumps(meeting_repo.list_by_group(group_id), indent=2, ensure_ascii=False)
-    return f"""
-Kamu adalah HUNKY, asisten AI.
-INFO: Waktu {waktu_sekarang}.
-GROUP_ID: {group_id}
-DATABASE MEETING GROUP: {jadwal_str}
-KONTEKS TAMBAHAN: {konteks_tambahan}
+llm_answer_cache = LlmAnswerCache(
+    LLM_ANSWER_CACHE_SIZE,
+    LLM_ANSWER_CACHE_TTL_SECONDS,
+    near_duplicates=LLM_ANSWER_CACHE_NEAR_DUP,
+    min_similarity=LLM_ANSWER_CACHE_MIN_SIMILARITY,
+)
 
-ATURAN:
-1. Jika ingin menjalankan aksi, output HARUS JSON valid object tunggal.
-2. Gunakan hanya action ini: save_meeting, search_file, web_search, search_meeting, reset_schedule.
-3. save_meeting.data wajib punya date(YYYY-MM-DD), time(HH:MM), topic, location, link.
-4. Jika bukan aksi, jawab sebagai asisten AI biasa: natural, ringkas, dan langsung.
-5. Hindari JSON bila tidak menjalankan action.
-6. Untuk pertanyaan kemampuan bot, penjelasan, atau percakapan umum, WAJIB jawab teks biasa (bukan action JSON).
-7. Kamu punya akses pencarian file Google Drive Folder Kerja Hunky lewat action search_file.
-8. Jika user minta ambil/cari file dari Google Drive, gunakan action search_file dan isi keyword yang relevan.
-""".strip()
 
+def llm_answer_cache_scope():
+    return f"{BLACKBOX_MODEL}|prompt-v{AI_PROMPT_VERSION}"
 
-def tanya_blackbox(pesan_user, group_id, konteks_tambahan="", corr_id="-"):
-    log = get_logger(corr_id)
-    system_instruction = build_ai_system_instruction(group_id, konteks_tambahan)
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {BLACKBOX_API_KEY}",
-    }
-    payload = {
-        "messages": [
-            {"role": "system", "content": system_instruction},
-            {"role": "user", "content": pesan_user},
-        ],
-        "model": "blackboxai/deepseek/deepseek-chat-v3.1",
-        "clickedAnswer2": False,
-        "clickedAnswer3": False,
-    }
+def chat_cache_text(message):
+    # Hanya chat umum yang jawabannya tidak bergantung pada data grup atau waktu.
+    if LLM_ANSWER_CACHE_BYPASS_PATTERN.search(message or "") or WEB_SEARCH_REALTIME_PATTERN.search(message or ""):
+        return ""
+    return normalize_chat_cache_text(message)
 
-    try:
-        response = HTTP.post(BLACKBOX_API_URL, headers=headers, json=payload, timeout=BLACKBOX_TIMEOUT_SECONDS)
-        if response.status_code != 200:
-            return f"Error API Blackbox: {response.status_code} - {response.text}"
 
-        hasil = response.json()
-        return (
-            hasil.get("choices", [{}])[0].get("message", {}).get("content", "")
-            or hasil.get("response", "")
-            or str(hasil)
-        )
-    except Exception as exc:
-        log.exception("Blackbox request failed: %s", exc)
-        return f"Error Koneksi: {exc}"
+def is_standalone_chat(message):
+    # Pesan mandiri dikirim tanpa riwayat percakapan, jadi jawabannya boleh dibagi lewat cache jawaban.
+    return bool(chat_cache_text(message)) and not CONVERSATION_REFERENCE_PATTERN.search(message or "")
+
+
+def get_cached_chat_answer(message):
+    return llm_answer_cache.get(llm_answer_cache_scope(), chat_cache_text(message))
+
+
+def remember_chat_answer(message, raw_answer, reply):
+    if not isinstance(raw_answer, str) or raw_answer.startswith(("Error API Blackbox:", "Error Koneksi:")):
+        return
+    # Jawaban berisi action JSON menjalankan efek samping, jadi tidak pernah di-cache.
+    parsed = extract_first_json_object(raw_answer) or repair_action_json(raw_answer)
+    if (parsed and parsed.get("action")) or not isinstance(reply, str) or not reply.strip():
+        return
+    llm_answer_cache.set(llm_answer_cache_scope(), chat_cache_text(message), reply)
+
+
+def iter_sentence_chunks(deltas, min_chars=None):
+    min_chars = CHAT_STREAM_MIN_CHUNK_CHARS if min_chars is None else min_chars
+    buffer = ""
+    for delta in deltas:
+        buffer += delta
+        if len(buffer) < min_chars:
+            continue
+        boundaries = list(re.finditer(r"[.!?…]\s|\n", buffer))
+        if boundaries:
+            cut = boundaries[-1].end()
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+    if buffer.strip():
+        yield buffer
 
 
 def extract_first_json_object(text):
@@ -541,6 +2766,70 @@ def normalize_text_reply_if_json(raw_reply):
     return fallback_text or raw_reply
 
 
+def close_json_brackets(text):
+    stack = []
+    in_string = escaped = False
+    for ch in text:
+        if in_string:
+            escaped = ch == "\\" and not escaped
+            if ch == '"' and not escaped:
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+    return text + ('"' if in_string else "") + "".join(reversed(stack))
+
+
+def repair_action_json(text):
+    # Perbaikan lokal untuk action JSON yang rusak (kutip tunggal, trailing comma, kurung tidak ditutup).
+    match = re.search(r"\{\s*['\"]?action['\"]?\s*:", str(text or ""))
+    if not match:
+        return None
+    candidate = text[match.start() :]
+    candidate = re.sub(r"```.*", "", candidate, flags=re.DOTALL).strip()
+    candidate = candidate.translate(str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"}))
+    if '"' not in candidate:
+        candidate = candidate.replace("'", '"')
+    candidate = re.sub(r"([{,]\s*)([A-Za-z_]\w*)\s*:", r'\1"\2":', candidate)
+    candidate = re.sub(r"\bTrue\b", "true", re.sub(r"\bFalse\b", "false", re.sub(r"\bNone\b", "null", candidate)))
+    candidate = re.sub(r",\s*([}\]])", r"\1", candidate)
+    end = candidate.rfind("}")
+    attempts = [candidate[: end + 1]] if end >= 0 else []
+    attempts.append(close_json_brackets(re.sub(r",\s*$", "", candidate)))
+    for attempt in attempts:
+        parsed = extract_first_json_object(attempt)
+        if isinstance(parsed, dict) and "action" in parsed:
+            return parsed
+    return None
+
+
+def normalize_action_name(data_json):
+    action = data_json.get("action")
+    if isinstance(action, str):
+        data_json = {**data_json, "action": action.strip().lower().replace("-", "_").replace(" ", "_")}
+    return data_json
+
+
+def strip_json_from_reply(text):
+    # Sisa prosa di luar blok JSON, dipakai sebagai jawaban teks tanpa panggilan LLM ulang.
+    text = re.sub(r"```(?:json)?\s*\{[\s\S]*?\}\s*```", " ", str(text or ""), flags=re.IGNORECASE)
+    decoder = json.JSONDecoder()
+    idx = text.find("{")
+    while idx >= 0:
+        try:
+            _, end = decoder.raw_decode(text[idx:])
+        except JSONDecodeError:
+            idx = text.find("{", idx + 1)
+            continue
+        text = text[:idx] + " " + text[idx + end :]
+        idx = text.find("{", idx)
+    return " ".join(text.split())
+
+
 def extract_action_keyword(data_json):
     if not isinstance(data_json, dict):
         return ""
@@ -556,85 +2845,92 @@ def extract_action_keyword(data_json):
     return ""
 
 
-def is_drive_lookup_intent(message):
-    lowered = (message or "").lower()
-    if not lowered:
-        return False
-    has_file_word = any(word in lowered for word in ["file", "dokumen", "document"])
-    has_lookup_word = any(word in lowered for word in ["ambil", "cari", "buka", "download", "unduh"])
-    return ("drive" in lowered and has_file_word) or (has_file_word and has_lookup_word)
+# Kata kunci per fitur intent. Semua dicocokkan sebagai substring (sama seperti `word in lowered`)
+# lewat satu regex gabungan, jadi pesan cukup di-scan sekali untuk semua aturan routing.
+INTENT_KEYWORDS = {
+    "file": ("file", "dokumen", "document"),
+    "drive": ("drive",),
+    "drive_verb": ("ambil", "cari", "buka", "download", "unduh"),
+    "web_blocker": ("meeting", "jadwal meeting", "drive"),
+    "web_topic": ("jadwal", "berita", "update", "terbaru", "hasil", "final", "skor", "info", "kabar", "internet"),
+    "web_verb": ("cari", "search", "cek", "lihat", "temukan", "carikan"),
+    "meeting_blocker": ("internet", "berita", "news", "web search"),
+    "meeting": ("meeting", "jadwal meeting", "catat meeting", "ingatkan meeting", "reset jadwal", "search_meeting"),
+    "lookup_verb": ("cari", "carikan", "search", "lookup"),
+    "lookup_target": ("file", "info", "informasi", "jadwal", "data"),
+    "lookup_scope": ("drive", "google drive", "internet", "web", "meeting"),
+    "web_followup": (
+        "apakah sudah ada infonya",
+        "sudah ada infonya",
+        "gimana infonya",
+        "update nya",
+        "update-nya",
+        "ada update",
+    ),
+}
+QUESTION_STARTERS = frozenset({"kapan", "siapa", "berapa", "dimana", "bagaimana", "apa", "apakah"})
+
+
+def build_intent_matcher(keyword_map):
+    # Lookahead nol-lebar dicoba di setiap posisi dan memilih keyword terpanjang yang mulai di situ;
+    # fitur keyword yang menjadi prefiks-nya ("info" di "informasi") ikut disertakan,
+    # sehingga hasilnya sama dengan memeriksa tiap keyword dengan `in`.
+    features_by_word = {}
+    for feature, words in keyword_map.items():
+        for word in words:
+            features_by_word.setdefault(word, set()).add(feature)
+    closed = {
+        word: frozenset().union(*(features_by_word[prefix] for prefix in features_by_word if word.startswith(prefix)))
+        for word in features_by_word
+    }
+    alternation = "|".join(re.escape(word) for word in sorted(features_by_word, key=len, reverse=True))
+    return re.compile(f"(?=({alternation}))"), closed
 
 
-def extract_drive_lookup_keyword(message):
-    text = str(message or "")
-    cleaned = re.sub(r"@\d{6,}", " ", text)
-    cleaned = re.sub(r"@hunky", " ", cleaned, flags=re.IGNORECASE)
-    cleaned = re.sub(
-        r"\b(tolong|please|dong|ya|kak|bang|bot|hunky|google|drive|folder|ambil|cari|buka|download|unduh|file|dokumen|document|dari|di|ke)\b",
-        " ",
-        cleaned,
-        flags=re.IGNORECASE,
-    )
-    cleaned = re.sub(r"[^\w\s\-\.]", " ", cleaned, flags=re.UNICODE)
-    cleaned = re.sub(r"\s+", " ", cleaned).strip()
-    return cleaned or text.strip()
+INTENT_KEYWORD_PATTERN, INTENT_FEATURES_BY_KEYWORD = build_intent_matcher(INTENT_KEYWORDS)
 
 
-def is_web_lookup_intent(message):
+def extract_intent_features(message):
     lowered = (message or "").lower().strip()
     if not lowered:
-        return False
+        return frozenset()
+    features = set()
+    for word in set(INTENT_KEYWORD_PATTERN.findall(lowered)):
+        features |= INTENT_FEATURES_BY_KEYWORD[word]
+    if lowered.endswith("?") or (" " in lowered and lowered.split(" ", 1)[0] in QUESTION_STARTERS):
+        features.add("question")
+    return frozenset(features)
 
-    if any(word in lowered for word in ["meeting", "jadwal meeting", "drive"]):
-        return False
 
-    question_starters = ["kapan", "siapa", "berapa", "dimana", "bagaimana", "apa", "apakah"]
-    lookup_words = ["jadwal", "berita", "update", "terbaru", "hasil", "final", "skor", "info", "kabar", "internet"]
-    lookup_verbs = ["cari", "search", "cek", "lihat", "temukan", "carikan"]
-    has_question = lowered.endswith("?") or any(lowered.startswith(x + " ") for x in question_starters)
-    has_lookup_word = any(word in lowered for word in lookup_words)
-    has_lookup_verb = any(word in lowered for word in lookup_verbs)
-    return (has_question and has_lookup_word) or (has_lookup_verb and has_lookup_word)
+def is_drive_lookup_intent(message, features=None):
+    features = extract_intent_features(message) if features is None else features
+    return "file" in features and ("drive" in features or "drive_verb" in features)
 
 
-def is_meeting_work_intent(message):
-    lowered = (message or "").lower()
-    if not lowered:
-        return False
-    if any(word in lowered for word in ["internet", "berita", "news", "web search"]):
-        return False
-    work_markers = [
-        "meeting",
-        "jadwal meeting",
-        "catat meeting",
-        "ingatkan meeting",
-        "reset jadwal",
-        "search_meeting",
-    ]
-    return any(marker in lowered for marker in work_markers)
+def extract_drive_lookup_keyword(message):
+    return normalize_lookup_text(message)[1]
 
 
-def is_ambiguous_lookup_intent(message):
-    lowered = (message or "").lower().strip()
-    if not lowered:
+def is_web_lookup_intent(message, features=None):
+    features = extract_intent_features(message) if features is None else features
+    if "web_blocker" in features or "web_topic" not in features:
         return False
-    has_lookup_verb = any(word in lowered for word in ["cari", "carikan", "search", "lookup"])
-    has_target = any(word in lowered for word in ["file", "info", "informasi", "jadwal", "data"])
-    has_scope = any(word in lowered for word in ["drive", "google drive", "internet", "web", "meeting"])
-    return has_lookup_verb and has_target and not has_scope
+    return "question" in features or "web_verb" in features
 
 
-def is_followup_web_lookup(message):
-    lowered = (message or "").lower().strip()
-    followups = [
-        "apakah sudah ada infonya",
-        "sudah ada infonya",
-        "gimana infonya",
-        "update nya",
-        "update-nya",
-        "ada update",
-    ]
-    return any(x in lowered for x in followups)
+def is_meeting_work_intent(message, features=None):
+    features = extract_intent_features(message) if features is None else features
+    return "meeting" in features and "meeting_blocker" not in features
+
+
+def is_ambiguous_lookup_intent(message, features=None):
+    features = extract_intent_features(message) if features is None else features
+    return "lookup_verb" in features and "lookup_target" in features and "lookup_scope" not in features
+
+
+def is_followup_web_lookup(message, features=None):
+    features = extract_intent_features(message) if features is None else features
+    return "web_followup" in features
 
 
 def route_intent(message, sender, has_file=False, triggered=False, has_web_context=False):
@@ -644,36 +2940,120 @@ def route_intent(message, sender, has_file=False, triggered=False, has_web_conte
     if sender.endswith("@g.us") and not triggered:
         return {"mode": "ignored", "intent": "ignored_text", "confidence": 1.0}
 
-    if is_drive_lookup_intent(message):
-        return {"mode": "work", "intent": ACTION_SEARCH_FILE, "confidence": 0.98}
+    features = extract_intent_features(message)
+    if is_drive_lookup_intent(message, features):
+        return {"mode": "work", "intent": ACTION_SEARCH_FILE, "confidence": 0.98, "features": features}
+
+    if is_followup_web_lookup(message, features) and has_web_context:
+        return {"mode": "general", "intent": ACTION_WEB_SEARCH, "confidence": 0.95, "features": features}
+
+    if is_web_lookup_intent(message, features):
+        return {"mode": "general", "intent": ACTION_WEB_SEARCH, "confidence": 0.92, "features": features}
+
+    if is_meeting_work_intent(message, features):
+        return {"mode": "work", "intent": "meeting_flow", "confidence": 0.9, "features": features}
+
+    if is_ambiguous_lookup_intent(message, features):
+        return {"mode": "ambiguous", "intent": "clarify_lookup_scope", "confidence": 0.6, "features": features}
+
+    return {"mode": "general", "intent": "chat", "confidence": 0.7, "features": features}
+
+
+class ConversationContextStore:
+    # Konteks per sender disimpan sebagai satu string JSON ringkas di cache LRU+TTL:
+    # jumlah sender dibatasi cache, ukuran per sender dibatasi max_turns & max_bytes.
+    # Semua perubahan lewat cache.update, jadi read-modify-write tetap atomik walau cache dibagi antar worker.
+    def __init__(self, cache, max_turns, max_bytes, turn_max_chars):
+        self.cache = cache
+        self.max_turns = max_turns
+        self.max_bytes = max_bytes
+        self.turn_max_chars = turn_max_chars
+        self._lock = threading.Lock()
+        self._trimmed = 0
+
+    def _load(self, sender):
+        raw = self.cache.get(sender)
+        if not raw:
+            return {"q": "", "t": []}
+        return json.loads(raw)
+
+    def _update(self, sender, mutate):
+        trimmed = 0
+
+        def apply(raw):
+            nonlocal trimmed
+            context = json.loads(raw) if raw else {"q": "", "t": []}
+            mutate(context)
+            trimmed = 0
+            encoded = json.dumps(context, ensure_ascii=False, separators=(",", ":"))
+            while context["t"] and (len(context["t"]) > self.max_turns or len(encoded.encode("utf-8")) > self.max_bytes):
+                context["t"].pop(0)
+                trimmed += 1
+                encoded = json.dumps(context, ensure_ascii=False, separators=(",", ":"))
+            return encoded
+
+        self.cache.update(sender, apply)
+        if trimmed:
+            with self._lock:
+                self._trimmed += trimmed
+
+    def record(self, sender, *turns):
+        # turns: pasangan (role, text); satu update untuk satu pertukaran user-asisten.
+        compact = []
+        for role, text in turns:
+            text = " ".join(str(text or "").split())[: self.turn_max_chars] if isinstance(text, str) else ""
+            if text:
+                compact.append(["u" if role == "user" else "a", text])
+        if not sender or not compact:
+            return
+        self._update(sender, lambda context: context["t"].extend(compact))
+
+    def remember_web_query(self, sender, query):
+        if not sender or not query:
+            return
+        self._update(sender, lambda context: context.update(q=str(query)[: self.turn_max_chars]))
+
+    def last_web_query(self, sender):
+        if not sender:
+            return ""
+        return self._load(sender)["q"]
+
+    def history(self, sender):
+        if not sender:
+            return []
+        return [
+            {"role": "user" if role == "u" else "assistant", "content": text} for role, text in self._load(sender)["t"]
+        ]
 
-    if is_followup_web_lookup(message) and has_web_context:
-        return {"mode": "general", "intent": ACTION_WEB_SEARCH, "confidence": 0.95}
+    def stats(self):
+        with self._lock:
+            trimmed = self._trimmed
+        return {
+            **self.cache.stats(),
+            "max_turns": self.max_turns,
+            "max_bytes": self.max_bytes,
+            "trimmed_turns": trimmed,
+        }
 
-    if is_web_lookup_intent(message):
-        return {"mode": "general", "intent": ACTION_WEB_SEARCH, "confidence": 0.92}
 
-    if is_meeting_work_intent(message):
-        return {"mode": "work", "intent": "meeting_flow", "confidence": 0.9}
+conversation_context = ConversationContextStore(
+    make_cache("conversation", CONTEXT_MAX_SENDERS, CONTEXT_TTL_SECONDS),
+    max_turns=CONTEXT_MAX_TURNS,
+    max_bytes=CONTEXT_MAX_BYTES,
+    turn_max_chars=CONTEXT_TURN_MAX_CHARS,
+)
 
-    if is_ambiguous_lookup_intent(message):
-        return {"mode": "ambiguous", "intent": "clarify_lookup_scope", "confidence": 0.6}
 
-    return {"mode": "general", "intent": "chat", "confidence": 0.7}
+def record_exchange(sender, message, reply):
+    conversation_context.record(sender, ("user", message), ("assistant", reply))
 
 
 def remember_last_web_query(sender, query):
-    if not sender or not query:
-        return
-    with _last_web_query_lock:
-        _last_web_query_by_sender[sender] = query
+    conversation_context.remember_web_query(sender, query)
 
 
 def get_last_web_query(sender):
-    if not sender:
-        return ""
-    with _last_web_query_lock:
-        return _last_web_query_by_sender.get(sender, "")
+    return conversation_context.last_web_query(sender)
 
 
 def answer_from_web_lookup(message, sender, corr_id="-"):
@@ -696,7 +3076,13 @@ def answer_from_web_lookup(message, sender, corr_id="-"):
         f"Pertanyaan user: {message}\n"
         f"Ringkasan internet:\n{hasil_cari}"
     )
-    jawaban = tanya_blackbox(prompt, group_id=sender, konteks_tambahan="Mode jawaban web lookup teks-only.", corr_id=corr_id)
+    jawaban = tanya_blackbox(
+        prompt,
+        group_id=sender,
+        konteks_tambahan="Mode jawaban web lookup teks-only.",
+        corr_id=corr_id,
+        include_schedule=False,
+    )
     jawaban = normalize_text_reply_if_json(jawaban)
     if isinstance(jawaban, str):
         lowered = jawaban.lower()
@@ -737,7 +3123,13 @@ def rewrite_as_plain_text(user_message, raw_ai_output, sender, corr_id="-"):
         f"Pesan user: {user_message}\n"
         f"Output model sebelumnya: {raw_ai_output}"
     )
-    return tanya_blackbox(prompt, group_id=sender, konteks_tambahan="Mode teks-only tanpa JSON.", corr_id=corr_id)
+    return tanya_blackbox(
+        prompt,
+        group_id=sender,
+        konteks_tambahan="Mode teks-only tanpa JSON.",
+        corr_id=corr_id,
+        include_schedule=False,
+    )
 
 
 def should_rewrite_general_chat_reply(reply_text):
@@ -768,6 +3160,7 @@ def rewrite_as_general_assistant_answer(user_message, raw_ai_output, sender, cor
         group_id=sender,
         konteks_tambahan="Mode asisten umum non-aksi.",
         corr_id=corr_id,
+        include_schedule=False,
     )
 
 
@@ -814,8 +3207,7 @@ def is_triggered_message(sender, message):
     is_group = sender.endswith("@g.us")
     if not is_group:
         return True
-    lowered = (message or "").lower()
-    return any(trigger.lower() in lowered for trigger in BOT_TRIGGERS)
+    return bool(BOT_TRIGGER_PATTERN.search((message or "").lower()))
 
 
 def format_group_schedule(items):
@@ -836,60 +3228,542 @@ def format_group_schedule(items):
     return balasan
 
 
-def send_reminder_message(group_id, message, corr_id="scheduler"):
+class RateLimiter:
+    def __init__(self, rate_per_second, burst=1):
+        self.rate_per_second = rate_per_second
+        self.capacity = max(burst, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill_locked(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    def try_acquire(self):
+        if self.rate_per_second <= 0:
+            return True
+        with self._lock:
+            self._refill_locked()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self):
+        if self.rate_per_second <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill_locked()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate_per_second
+            time.sleep(delay)
+            waited += delay
+
+
+class WaPushDispatcher:
+    def __init__(self, max_workers, rate_per_second):
+        self._executor = ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix="wa-push")
+        self._limiter = RateLimiter(rate_per_second, burst=max_workers)
+        self._target_locks = {}
+        self._locks_guard = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "batches": 0,
+            "messages": 0,
+            "failures": 0,
+            "rate_limit_wait_ms": 0.0,
+            "max_batch_duration_ms": 0.0,
+            "last_batch": None,
+        }
+
+    def _target_lock(self, target_id):
+        with self._locks_guard:
+            return self._target_locks.setdefault(target_id, threading.Lock())
+
+    def _send_target(self, target_id, messages, send_func, batch_started):
+        results = []
+        # Satu task per target: urutan pesan ke target yang sama tetap terjaga antar-batch.
+        with self._target_lock(target_id):
+            for message in messages:
+                waited = self._limiter.acquire()
+                ok = bool(send_func(target_id, message))
+                lag_ms = (time.monotonic() - batch_started) * 1000
+                results.append((ok, lag_ms, waited * 1000))
+        return results
+
+    def dispatch(self, messages, send_func, corr_id="scheduler"):
+        by_target = {}
+        for target_id, message in messages:
+            by_target.setdefault(target_id, []).append(message)
+        if not by_target:
+            return 0
+
+        batch_started = time.monotonic()
+        futures = [
+            self._executor.submit(self._send_target, target_id, target_messages, send_func, batch_started)
+            for target_id, target_messages in by_target.items()
+        ]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+
+        duration_ms = (time.monotonic() - batch_started) * 1000
+        failures = sum(1 for ok, _, _ in results if not ok)
+        last_batch = {
+            "size": len(results),
+            "targets": len(by_target),
+            "failures": failures,
+            "duration_ms": round(duration_ms, 1),
+            "max_lag_ms": round(max(lag for _, lag, _ in results), 1),
+            "avg_lag_ms": round(sum(lag for _, lag, _ in results) / len(results), 1),
+        }
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            self._stats["messages"] += len(results)
+            self._stats["failures"] += failures
+            self._stats["rate_limit_wait_ms"] += sum(wait for _, _, wait in results)
+            self._stats["max_batch_duration_ms"] = max(self._stats["max_batch_duration_ms"], last_batch["duration_ms"])
+            self._stats["last_batch"] = last_batch
+        get_logger(corr_id).info(
+            "WA push batch size=%s targets=%s failures=%s duration_ms=%.1f max_lag_ms=%.1f",
+            last_batch["size"],
+            last_batch["targets"],
+            failures,
+            last_batch["duration_ms"],
+            last_batch["max_lag_ms"],
+        )
+        return len(results) - failures
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["rate_limit_wait_ms"] = round(stats["rate_limit_wait_ms"], 1)
+        return stats
+
+
+wa_push_dispatcher = WaPushDispatcher(max_workers=WA_PUSH_MAX_WORKERS, rate_per_second=WA_PUSH_RATE_PER_SECOND)
+
+
+def post_wa_message(target_id, message, corr_id="outbox"):
     log = get_logger(corr_id)
     try:
-        response = HTTP.post(
+        response = WA_HTTP.post(
             WA_PUSH_URL,
-            json={"target_id": group_id, "message": message},
+            json={"target_id": target_id, "message": message},
             timeout=REMINDER_TIMEOUT_SECONDS,
         )
         if response.status_code >= 300:
             log.warning("WA push failed status=%s body=%s", response.status_code, response.text)
+            return False, f"HTTP {response.status_code}: {response.text[:200]}"
+        return True, ""
     except Exception as exc:
         log.exception("WA push request failed: %s", exc)
+        return False, str(exc)
+
+
+class WaOutbox:
+    SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    target_id TEXT NOT NULL,
+    message TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    last_error TEXT NOT NULL DEFAULT '',
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (next_attempt_at);
+CREATE TABLE IF NOT EXISTS outbox_sent (
+    idempotency_key TEXT PRIMARY KEY,
+    sent_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_sent_at ON outbox_sent (sent_at);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    target_id TEXT NOT NULL,
+    message TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    last_error TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    dead_at REAL NOT NULL
+);
+"""
+
+    def __init__(
+        self,
+        path,
+        max_attempts=None,
+        backoff_seconds=None,
+        max_backoff_seconds=None,
+        claim_lease_seconds=60,
+    ):
+        self.path = path
+        self.max_attempts = WA_OUTBOX_MAX_ATTEMPTS if max_attempts is None else max_attempts
+        self.backoff_seconds = WA_OUTBOX_BACKOFF_SECONDS if backoff_seconds is None else backoff_seconds
+        self.max_backoff_seconds = WA_OUTBOX_MAX_BACKOFF_SECONDS if max_backoff_seconds is None else max_backoff_seconds
+        self.claim_lease_seconds = claim_lease_seconds
+        self._lock = threading.RLock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._last_prune = 0.0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(self.SCHEMA)
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+        if "expires_at" not in columns:
+            # File outbox lama dibuat sebelum kolom expires_at ada.
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN expires_at REAL")
+
+    @contextmanager
+    def _write_txn(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def enqueue(self, target_id, message, idempotency_key=None, expires_at=None):
+        key = idempotency_key or uuid.uuid4().hex
+        now = time.time()
+        with self._write_txn() as conn:
+            done = conn.execute(
+                "SELECT 1 FROM outbox_sent WHERE idempotency_key = ? "
+                "UNION ALL SELECT 1 FROM dead_letters WHERE idempotency_key = ?",
+                (key, key),
+            ).fetchone()
+            inserted = 0
+            if not done:
+                inserted = conn.execute(
+                    "INSERT OR IGNORE INTO outbox "
+                    "(idempotency_key, target_id, message, next_attempt_at, created_at, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, target_id, message, now, now, expires_at),
+                ).rowcount
+        self._wakeup.set()
+        return inserted > 0
+
+    def _claim_due(self, limit):
+        now = time.time()
+        with self._write_txn() as conn:
+            rows = conn.execute(
+                "SELECT * FROM outbox WHERE next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            # Pesan yang sudah kedaluwarsa (mis. reminder setelah meeting mulai) tidak dikirim lagi.
+            expired = [row for row in rows if row["expires_at"] is not None and row["expires_at"] <= now]
+            for row in expired:
+                self._dead_letter(conn, row, row["attempts"], row["last_error"] or "expired before delivery", now)
+            rows = [row for row in rows if row not in expired]
+            # Lease: kalau proses mati saat kirim, baris muncul lagi setelah lease habis.
+            conn.executemany(
+                "UPDATE outbox SET next_attempt_at = ? WHERE id = ?",
+                [(now + self.claim_lease_seconds, row["id"]) for row in rows],
+            )
+        return [dict(row) for row in rows]
+
+    def _backoff(self, attempts):
+        delay = min(self.backoff_seconds * (2 ** (attempts - 1)), self.max_backoff_seconds)
+        return delay * random.uniform(0.8, 1.2)
+
+    def _dead_letter(self, conn, row, attempts, error, now):
+        conn.execute("DELETE FROM outbox WHERE id = ?", (row["id"],))
+        conn.execute(
+            "INSERT OR REPLACE INTO dead_letters "
+            "(idempotency_key, target_id, message, attempts, last_error, created_at, dead_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (row["idempotency_key"], row["target_id"], row["message"], attempts, error, row["created_at"], now),
+        )
+        get_logger("outbox").error(
+            "WA push dead-lettered key=%s target=%s attempts=%s error=%s",
+            row["idempotency_key"],
+            row["target_id"],
+            attempts,
+            error,
+        )
+
+    def _record_results(self, rows, results):
+        now = time.time()
+        with self._write_txn() as conn:
+            for row in rows:
+                ok, error = results.get(row["id"], (False, "not attempted"))
+                if ok:
+                    conn.execute("DELETE FROM outbox WHERE id = ?", (row["id"],))
+                    conn.execute(
+                        "INSERT OR REPLACE INTO outbox_sent (idempotency_key, sent_at) VALUES (?, ?)",
+                        (row["idempotency_key"], now),
+                    )
+                    continue
+                attempts = row["attempts"] + 1
+                next_attempt_at = now + self._backoff(attempts)
+                if attempts >= self.max_attempts:
+                    self._dead_letter(conn, row, attempts, error, now)
+                    continue
+                if row["expires_at"] is not None and next_attempt_at >= row["expires_at"]:
+                    self._dead_letter(conn, row, attempts, f"expired before retry: {error}", now)
+                    continue
+                conn.execute(
+                    "UPDATE outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                    (attempts, next_attempt_at, error, row["id"]),
+                )
+            if now - self._last_prune > 3600:
+                conn.execute(
+                    "DELETE FROM outbox_sent WHERE sent_at < ?",
+                    (now - WA_OUTBOX_SENT_RETENTION_DAYS * 86400,),
+                )
+                self._last_prune = now
+
+    def drain_once(self, limit=100):
+        rows = self._claim_due(limit)
+        if not rows:
+            return 0
+        results = {}
+
+        def deliver(target_id, row):
+            results[row["id"]] = post_wa_message(target_id, row["message"])
+            return results[row["id"]][0]
+
+        wa_push_dispatcher.dispatch([(row["target_id"], row) for row in rows], deliver, corr_id="outbox")
+        self._record_results(rows, results)
+        return len(rows)
+
+    def _seconds_until_next_due(self):
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(next_attempt_at) FROM outbox").fetchone()
+        if row[0] is None:
+            return 30.0
+        return min(max(row[0] - time.time(), 0.0), 30.0)
+
+    def _run(self):
+        log = get_logger("outbox")
+        while not self._stopped.is_set():
+            try:
+                if self.drain_once():
+                    continue
+                timeout = self._seconds_until_next_due()
+            except Exception as exc:
+                log.exception("Outbox drain failed: %s", exc)
+                timeout = 5.0
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="wa-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def is_known(self, idempotency_key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM outbox WHERE idempotency_key = ? "
+                "UNION ALL SELECT 1 FROM outbox_sent WHERE idempotency_key = ? "
+                "UNION ALL SELECT 1 FROM dead_letters WHERE idempotency_key = ?",
+                (idempotency_key, idempotency_key, idempotency_key),
+            ).fetchone()
+        return row is not None
+
+    def dead_letters(self, limit=100):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT idempotency_key, target_id, message, attempts, last_error, created_at, dead_at "
+                "FROM dead_letters ORDER BY dead_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self):
+        with self._lock:
+            pending = self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+            dead = self._conn.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+            sent = self._conn.execute("SELECT COUNT(*) FROM outbox_sent").fetchone()[0]
+        return {"pending": pending, "dead_letters": dead, "sent_recent": sent}
+
+
+wa_outbox = WaOutbox(WA_OUTBOX_DB_FILE)
+
+
+def send_reminder_message(group_id, message, corr_id="scheduler", idempotency_key=None, expires_at=None):
+    queued = wa_outbox.enqueue(group_id, message, idempotency_key=idempotency_key, expires_at=expires_at)
+    if not queued:
+        get_logger(corr_id).info("WA push skipped, already handled key=%s", idempotency_key)
+    return queued
 
 
 def cek_reminder_otomatis():
     log = get_logger("scheduler")
     now = now_wib_naive()
-    meetings = meeting_repo.load_all()
-    changed = False
+    due_items = meeting_repo.due_reminders(now, REMINDER_LEAD_MINUTES)
+
+    for item in due_items:
+        meeting_dt = meeting_repo._safe_datetime(item["date"], item["time"])
+        diff_minutes = max(1, round((meeting_dt - now).total_seconds() / 60))
+        pesan = (
+            f"⏰ *REMINDER MEETING {diff_minutes} MENIT LAGI!*\n"
+            f"📝 {item.get('topic', '-')}\n"
+            f"🔗 {item.get('link', '-') }"
+        )
+        # Outbox durable, jadi aman ditandai reminded walau WA engine sedang reconnect.
+        # Reminder yang belum terkirim saat meeting mulai sudah tidak berguna, jadi kedaluwarsa di jam mulai.
+        send_reminder_message(
+            item["group_id"],
+            pesan,
+            idempotency_key=f"reminder:{item['id']}",
+            expires_at=meeting_dt.replace(tzinfo=WIB).timestamp(),
+        )
+        log.info("Reminder queued for group=%s topic=%s", item["group_id"], item.get("topic", "-"))
 
-    for item in meetings:
-        if item.get("reminded", False):
-            continue
-        meeting_dt = meeting_repo._safe_datetime(item.get("date", ""), item.get("time", ""))
-        if not meeting_dt:
-            continue
+    meeting_repo.mark_reminded([item["id"] for item in due_items])
+
+
+def schedule_meeting_reminder(item, now=None):
+    now = now or now_wib_naive()
+    starts_at = parse_meeting_datetime(item.get("date", ""), item.get("time", ""))
+    if item.get("reminded") or not starts_at or starts_at <= now:
+        unschedule_meeting_reminder(item["id"])
+        return
+    run_at = max(starts_at - timedelta(minutes=REMINDER_LEAD_MINUTES), now)
+    # Job hanya membangunkan cek_reminder_otomatis; meeting di slot yang sama terkirim sekali jalan.
+    _scheduler.add_job(
+        func=cek_reminder_otomatis,
+        trigger="date",
+        run_date=run_at.replace(tzinfo=WIB),
+        id=f"{REMINDER_JOB_PREFIX}{item['id']}",
+        replace_existing=True,
+        misfire_grace_time=int(REMINDER_LEAD_MINUTES * 60),
+    )
+
+
+def unschedule_meeting_reminder(meeting_id):
+    try:
+        _scheduler.remove_job(f"{REMINDER_JOB_PREFIX}{meeting_id}")
+    except JobLookupError:
+        pass
 
-        diff_minutes = (meeting_dt - now).total_seconds() / 60
-        if 0 < diff_minutes <= 5:
-            group_id = item.get("group_id")
-            if group_id:
-                pesan = (
-                    f"⏰ *REMINDER MEETING {int(diff_minutes)} MENIT LAGI!*\n"
-                    f"📝 {item.get('topic', '-')}\n"
-                    f"🔗 {item.get('link', '-') }"
-                )
-                send_reminder_message(group_id, pesan)
-                log.info("Reminder sent for group=%s topic=%s", group_id, item.get("topic", "-"))
-            item["reminded"] = True
-            changed = True
 
-    if changed:
-        meeting_repo.save_all(meetings)
+def sync_reminder_jobs(event, items):
+    if event == "reload":
+        keep = {f"{REMINDER_JOB_PREFIX}{item['id']}" for item in items}
+        for job in _scheduler.get_jobs():
+            if job.id.startswith(REMINDER_JOB_PREFIX) and job.id not in keep:
+                job.remove()
+    for item in items:
+        if event == "remove":
+            unschedule_meeting_reminder(item["id"])
+        else:
+            schedule_meeting_reminder(item)
 
 
 def start_scheduler():
     global _scheduler_started
     if _scheduler_started:
         return
-    _scheduler.add_job(func=cek_reminder_otomatis, trigger="interval", minutes=1)
+    meeting_repo.subscribe(sync_reminder_jobs)
+    sync_reminder_jobs("reload", meeting_repo.load_all())
+    # Meeting bisa ditulis worker lain; refresh berkala memicu reload -> reminder dijadwal ulang di leader.
+    _scheduler.add_job(
+        func=meeting_repo.refresh,
+        trigger="interval",
+        seconds=MEETING_REFRESH_INTERVAL_SECONDS,
+        id="meeting-refresh",
+        replace_existing=True,
+    )
     _scheduler.start()
     _scheduler_started = True
 
 
+class LeaderElection:
+    def __init__(self, lock_path, retry_seconds):
+        self.lock_path = lock_path
+        self.retry_seconds = retry_seconds
+        self._handle = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    @property
+    def is_leader(self):
+        return self._handle is not None
+
+    def try_acquire(self):
+        with self._lock:
+            if self._handle is not None:
+                return True
+            if fcntl is None:
+                self._handle = True
+                return True
+            handle = open(self.lock_path, "a+", encoding="utf-8")
+            try:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()
+                return False
+            # Lock ikut lepas otomatis saat proses mati, jadi worker lain bisa mengambil alih.
+            handle.seek(0)
+            handle.truncate()
+            handle.write(str(os.getpid()))
+            handle.flush()
+            self._handle = handle
+            return True
+
+    def release(self):
+        with self._lock:
+            handle, self._handle = self._handle, None
+        if handle not in (None, True):
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            handle.close()
+
+    def _campaign(self, on_elected):
+        while not self._stopped.wait(self.retry_seconds):
+            if self.try_acquire():
+                get_logger("leader").info("Worker pid=%s took over leader duties", os.getpid())
+                on_elected()
+                return
+
+    def start(self, on_elected):
+        if self.try_acquire():
+            on_elected()
+            return True
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._campaign, args=(on_elected,), name="leader", daemon=True)
+            self._thread.start()
+        return False
+
+    def stop(self):
+        self._stopped.set()
+
+
+leader = LeaderElection(LEADER_LOCK_FILE, LEADER_RETRY_SECONDS)
+
+
+def start_leader_services():
+    # Hanya satu proses yang menjalankan scheduler reminder & sinkronisasi index Drive.
+    if DRIVE_INDEX_ENABLED:
+        drive_index.start(PARENT_FOLDER_ID)
+    start_scheduler()
+
+
 def execute_action(data_json, sender, original_message, corr_id="-"):
     action = data_json.get("action")
 
@@ -937,6 +3811,7 @@ def execute_action(data_json, sender, original_message, corr_id="-"):
             group_id=sender,
             konteks_tambahan=f"Fakta Internet: {hasil_cari}",
             corr_id=corr_id,
+            include_schedule=False,
         )
 
     if action == ACTION_RESET_SCHEDULE:
@@ -946,6 +3821,148 @@ def execute_action(data_json, sender, original_message, corr_id="-"):
     return "Aksi tidak dikenali."
 
 
+class ChatJobQueue:
+    def __init__(self, max_workers, max_queued, history_size=500, registry=None):
+        self.max_workers = max(max_workers, 1)
+        self.max_queued = max(max_queued, 0)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="chat-job")
+        # Slot = worker + antrean; kalau habis, /chat menolak dengan 503 alih-alih menumpuk tanpa batas.
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queued)
+        self._lock = threading.Lock()
+        self._history_size = history_size
+        # Status job + kunci dedup. Dengan SHARED_STATE_BACKEND=sqlite isinya dibagi semua worker gunicorn,
+        # jadi GET /chat/jobs/<id> dan retry event WA yang mendarat di worker lain tetap melihat job yang sama.
+        self._registry = registry if registry is not None else make_cache(
+            "chat_jobs", history_size * 2 + 1, CHAT_ASYNC_JOB_TTL_SECONDS
+        )
+        self._stats = {
+            "submitted": 0,
+            "rejected": 0,
+            "duplicates": 0,
+            "completed": 0,
+            "failed": 0,
+            "delivered": 0,
+            "queue_wait_ms_max": 0.0,
+            "duration_ms_max": 0.0,
+        }
+
+    def _update(self, job_id, **fields):
+        return self._registry.update(("job", job_id), lambda job: dict(job or {}, **fields))
+
+    def _release(self, job_id, key):
+        self._registry.update(("active",), lambda ids: [active_id for active_id in ids or [] if active_id != job_id])
+        if key and key.startswith("text:"):
+            # Tanpa message_id, pesan yang sama boleh diproses lagi setelah job sebelumnya selesai.
+            self._registry.update(("key", key), lambda owner: None if owner == job_id else owner)
+
+    def _run(self, job_id, data):
+        log = get_logger(data.get("message_id") or job_id)
+        started = time.monotonic()
+        job = self._update(job_id, state="running")
+        # Waktu dinding, karena job bisa di-submit oleh proses lain dari yang mencatatnya.
+        waited_ms = max(time.time() - job.get("_queued_at", time.time()), 0.0) * 1000
+        state, delivered = "failed", False
+        try:
+            with app.app_context():
+                result = process_chat(data)
+            response, status = result if isinstance(result, tuple) else (result, result.status_code)
+            body = response.get_json() or {}
+            reply = body.get("reply")
+            if reply:
+                message_id = data.get("message_id") or job_id
+                wa_outbox.enqueue(data["sender"], reply, idempotency_key=f"chat:{message_id}")
+                delivered = True
+            state = "done" if status < 400 else "failed"
+            self._update(job_id, result_status=body.get("status") or ("replied" if reply else status))
+        except Exception as exc:
+            log.exception("Chat job %s failed: %s", job_id, exc)
+            self._update(job_id, error=str(exc))
+        finally:
+            self._slots.release()
+            duration_ms = (time.monotonic() - started) * 1000
+            self._update(job_id, state=state, queue_wait_ms=round(waited_ms, 1), duration_ms=round(duration_ms, 1))
+            self._release(job_id, job.get("_key"))
+            with self._lock:
+                self._stats["completed" if state == "done" else "failed"] += 1
+                self._stats["delivered"] += delivered
+                self._stats["queue_wait_ms_max"] = max(self._stats["queue_wait_ms_max"], round(waited_ms, 1))
+                self._stats["duration_ms_max"] = max(self._stats["duration_ms_max"], round(duration_ms, 1))
+            log.info("Chat job %s %s wait_ms=%.1f duration_ms=%.1f", job_id, state, waited_ms, duration_ms)
+
+    @staticmethod
+    def dedup_key(data):
+        # Event WA yang di-retry membawa message_id yang sama; tanpa message_id, pakai isi pesan.
+        if data.get("message_id"):
+            return f"id:{data['message_id']}"
+        digest = hashlib.sha1(str(data.get("message") or "").encode("utf-8")).hexdigest()[:16]
+        return f"text:{data.get('sender')}:{digest}"
+
+    def _duplicate(self, job_id):
+        with self._lock:
+            self._stats["duplicates"] += 1
+        return job_id, True
+
+    def submit(self, data):
+        # Return (job_id, duplicate). job_id None + duplicate False berarti antrean penuh.
+        key = self.dedup_key(data)
+        existing = self._registry.get(("key", key))
+        if existing:
+            return self._duplicate(existing)
+        if data.get("message_id") and wa_outbox.is_known(f"chat:{data['message_id']}"):
+            # Sudah dibalas (atau sedang dikirim) sebelum job-nya keluar dari registry.
+            return self._duplicate(None)
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats["rejected"] += 1
+            return None, False
+        job_id = uuid.uuid4().hex[:12]
+        # Klaim kunci secara atomik: dari dua retry yang lolos cek pertama (di worker mana pun), hanya satu menang.
+        owner = self._registry.update(("key", key), lambda current: current or job_id)
+        if owner != job_id:
+            self._slots.release()
+            return self._duplicate(owner)
+        self._registry.set(
+            ("job", job_id),
+            {
+                "state": "queued",
+                "sender": data.get("sender"),
+                "message_id": data.get("message_id"),
+                "_queued_at": time.time(),
+                "_key": key,
+            },
+        )
+        self._registry.update(("active",), lambda ids: ((ids or []) + [job_id])[-self._history_size:])
+        with self._lock:
+            self._stats["submitted"] += 1
+        self._executor.submit(self._run, job_id, data)
+        return job_id, False
+
+    @staticmethod
+    def _public(job_id, job):
+        return {key: value for key, value in dict(job, id=job_id).items() if not key.startswith("_")}
+
+    def get(self, job_id):
+        job = self._registry.get(("job", job_id))
+        return self._public(job_id, job) if job is not None else None
+
+    def active(self):
+        jobs = [(job_id, self._registry.get(("job", job_id))) for job_id in self._registry.get(("active",)) or []]
+        return [self._public(job_id, job) for job_id, job in jobs if job and job.get("state") in {"queued", "running"}]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        states = [job["state"] for job in self.active()]
+        stats["queued"] = states.count("queued")
+        stats["running"] = states.count("running")
+        stats["max_workers"] = self.max_workers
+        stats["max_queued"] = self.max_queued
+        return stats
+
+
+chat_jobs = ChatJobQueue(CHAT_ASYNC_WORKERS, CHAT_ASYNC_QUEUE_SIZE)
+
+
 # ================= ROUTES =================
 
 @app.route("/health", methods=["GET"])
@@ -960,24 +3977,87 @@ def health():
 
     google_ok = get_google_service("drive", "v3") is not None
     blackbox_ok = bool(BLACKBOX_API_URL and BLACKBOX_API_KEY)
-    scheduler_ok = _scheduler_started and _scheduler.running
+    standby = not leader.is_leader
+    scheduler_ok = standby or (_scheduler_started and _scheduler.running)
 
     payload = {
         "status": "ok" if all([db_ok, google_ok, blackbox_ok, scheduler_ok]) else "degraded",
         "blackbox": "ok" if blackbox_ok else "missing_config",
         "google_drive": "ok" if google_ok else "unavailable",
         "db": "ok" if db_ok else f"error: {db_msg}",
-        "scheduler": "running" if scheduler_ok else "stopped",
+        "scheduler": "standby" if standby else ("running" if scheduler_ok else "stopped"),
+        "pid": os.getpid(),
         "calendar_id": ID_KALENDER_KAMU,
     }
     code = 200 if payload["status"] == "ok" else 503
     return jsonify(payload), code
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return jsonify(
+        {
+            "wa_push": wa_push_dispatcher.stats(),
+            "wa_outbox": wa_outbox.stats(),
+            "google_services": google_services.stats(),
+            "drive_search_cache": drive_search_cache.stats(),
+            "drive_index": drive_index.stats(),
+            "drive_uploads": drive_uploader.stats(),
+            "web_search_cache": {**web_search_cache.stats(), **web_search_flight.stats()},
+            "web_search": {"provider": web_search_provider.name, **web_search_executor.stats()},
+            "blackbox": blackbox_client.stats(),
+            "llm_answer_cache": llm_answer_cache.stats(),
+            "conversation_context": conversation_context.stats(),
+            "llm_reply_fallbacks": reply_fallbacks.stats(),
+            "prompt_builder": prompt_builder.stats(),
+            "chat_jobs": chat_jobs.stats(),
+        }
+    )
+
+
+@app.route("/outbox/dead-letters", methods=["GET"])
+def outbox_dead_letters():
+    limit = min(max(request.args.get("limit", 100, type=int), 1), 500)
+    return jsonify({"dead_letters": wa_outbox.dead_letters(limit=limit)})
+
+
+@app.route("/chat/jobs", methods=["GET"])
+def chat_jobs_active():
+    return jsonify({"jobs": chat_jobs.active(), **chat_jobs.stats()})
+
+
+@app.route("/chat/jobs/<job_id>", methods=["GET"])
+def chat_job_status(job_id):
+    job = chat_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error_code": "NOT_FOUND", "error": "job tidak ditemukan"}), 404
+    return jsonify(job)
+
+
 @app.route("/chat", methods=["POST"])
 def chat():
     data = request.get_json(silent=True) or {}
+    if (CHAT_ASYNC_MODE or is_truthy(data.get("async"))) and not data.get("file_path"):
+        return enqueue_chat_job(data)
+    return process_chat(data)
 
+
+def enqueue_chat_job(data):
+    sender = str(data.get("sender") or "").strip()
+    message = str(data.get("message") or "")
+    if not sender or not is_triggered_message(sender, message):
+        # Validasi & pesan grup tanpa trigger murah: dijawab langsung tanpa makan slot antrean.
+        return process_chat(data)
+    job_id, duplicate = chat_jobs.submit(data)
+    if duplicate:
+        # Event yang di-retry tidak memanggil LLM/action lagi; balasan tetap datang dari job pertama.
+        return jsonify({"status": "duplicate", "job_id": job_id}), 202
+    if job_id is None:
+        return jsonify({"error_code": "QUEUE_FULL", "error": "antrean chat penuh, coba lagi"}), 503
+    return jsonify({"status": "queued", "job_id": job_id}), 202
+
+
+def process_chat(data):
     sender = str(data.get("sender") or "").strip()
     message = str(data.get("message") or "")
     file_path = data.get("file_path")
@@ -1026,8 +4106,33 @@ def chat():
             should_upload = triggered and keyword_simpan
 
         if should_upload:
-            nama_file = message.replace("@hunky", "").replace("simpan", "").strip() or "File Upload"
-            balasan = upload_ke_drive(file_path, mime_type, custom_name=nama_file, corr_id=message_id)
+            force_new = bool(DRIVE_UPLOAD_FORCE_NEW_PATTERN.search(message))
+            nama_file = DRIVE_UPLOAD_FORCE_NEW_PATTERN.sub(" ", message)
+            nama_file = nama_file.replace("@hunky", "").replace("simpan", "").strip() or "File Upload"
+            if os.path.getsize(file_path) > DRIVE_UPLOAD_ASYNC_THRESHOLD_MB * 1024 * 1024:
+                content_hash, existing = find_duplicate_upload(file_path, force_new=force_new)
+                if existing:
+                    os.remove(file_path)
+                    return jsonify({"reply": format_duplicate_upload_reply(existing)})
+                upload_id, _ = drive_uploader.submit(
+                    sender,
+                    file_path,
+                    mime_type,
+                    custom_name=nama_file,
+                    corr_id=message_id,
+                    force_new=force_new,
+                    content_hash=content_hash,
+                )
+                return jsonify(
+                    {
+                        "reply": "⏳ File sedang diunggah ke Drive... link akan dikirim setelah selesai.",
+                        "status": "upload_queued",
+                        "upload_id": upload_id,
+                    }
+                )
+            balasan = upload_ke_drive(
+                file_path, mime_type, custom_name=nama_file, corr_id=message_id, force_new=force_new
+            )
             return jsonify({"reply": balasan})
 
         if is_group and not bot_hit:
@@ -1069,29 +4174,114 @@ def chat():
 
     if routed.get("intent") == ACTION_WEB_SEARCH:
         balasan_web = answer_from_web_lookup(message, sender, corr_id=message_id)
+        record_exchange(sender, message, balasan_web)
         return jsonify({"reply": balasan_web})
 
-    jawaban_ai = tanya_blackbox(message, group_id=sender, corr_id=message_id)
+    # Prompt yang memuat jadwal grup atau riwayat percakapan menghasilkan jawaban spesifik sender, jadi tidak
+    # boleh lewat cache bersama. Pesan mandiri dijawab tanpa riwayat agar tetap bisa kena cache.
+    include_schedule = needs_schedule_context(message, routed)
+    use_answer_cache = routed.get("intent") == "chat" and not include_schedule and is_standalone_chat(message)
+    history = [] if use_answer_cache else conversation_context.history(sender)
+    if use_answer_cache:
+        cached_reply = get_cached_chat_answer(message)
+        if cached_reply is not None:
+            log.info("LLM answer cache hit")
+            record_exchange(sender, message, cached_reply)
+            return jsonify({"reply": cached_reply})
+
+    jawaban_ai = tanya_blackbox(
+        message,
+        group_id=sender,
+        corr_id=message_id,
+        include_schedule=include_schedule,
+        history=history,
+    )
+    balasan_final = finalize_ai_reply(jawaban_ai, message, sender, routed, message_id)
+    if use_answer_cache:
+        remember_chat_answer(message, jawaban_ai, balasan_final)
+    record_exchange(sender, message, balasan_final)
+    return jsonify({"reply": balasan_final})
+
+
+class ReplyFallbacks:
+    COUNTERS = (
+        "structured_text",
+        "json_repaired",
+        "text_field",
+        "prose_outside_json",
+        "rewrite_plain_text",
+        "rewrite_general_answer",
+        "rewrite_skipped_budget",
+    )
+
+    def __init__(self, rewrites_per_minute):
+        self.rewrites_per_minute = rewrites_per_minute
+        self._budget = RateLimiter(rewrites_per_minute / 60, burst=max(int(rewrites_per_minute), 1))
+        self._lock = threading.Lock()
+        self._stats = {name: 0 for name in self.COUNTERS}
+
+    def count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def allow_rewrite(self, name):
+        # Rewrite = panggilan LLM kedua; hanya jalan bila masih ada jatah per menit.
+        if self.rewrites_per_minute > 0 and self._budget.try_acquire():
+            self.count(name)
+            return True
+        self.count("rewrite_skipped_budget")
+        return False
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, rewrites_per_minute=self.rewrites_per_minute)
+
+
+reply_fallbacks = ReplyFallbacks(LLM_REWRITE_BUDGET_PER_MINUTE)
+
+
+def finalize_ai_reply(jawaban_ai, message, sender, routed, message_id):
+    log = get_logger(message_id)
     balasan_final = jawaban_ai
 
     try:
         data_json = extract_first_json_object(jawaban_ai)
+        if data_json is None:
+            data_json = repair_action_json(jawaban_ai)
+            if data_json is not None:
+                reply_fallbacks.count("json_repaired")
         if data_json:
+            data_json = normalize_action_name(data_json)
             valid, reason = validate_action_payload(data_json, sender)
+            fallback_text = extract_text_from_json_payload(data_json)
             if valid:
                 balasan_final = execute_action(data_json, sender, message, corr_id=message_id)
+            elif data_json.get("action") is None and fallback_text:
+                reply_fallbacks.count("structured_text")
+                balasan_final = fallback_text
             else:
-                fallback_text = extract_text_from_json_payload(data_json)
+                log.warning("Invalid action payload: %s", reason)
+                prose = strip_json_from_reply(jawaban_ai)
                 if fallback_text:
+                    reply_fallbacks.count("text_field")
                     balasan_final = fallback_text
-                else:
+                elif prose:
+                    reply_fallbacks.count("prose_outside_json")
+                    balasan_final = prose
+                elif reply_fallbacks.allow_rewrite("rewrite_plain_text"):
                     balasan_final = rewrite_as_plain_text(message, jawaban_ai, sender, corr_id=message_id)
-                log.warning("Invalid action payload: %s", reason)
+                else:
+                    balasan_final = "Maaf, permintaan itu belum bisa saya proses. Coba jelaskan dengan kalimat lain ya."
     except Exception as exc:
         log.exception("Error executing AI action: %s", exc)
 
+    return check_final_reply(balasan_final, message, sender, routed, message_id)
+
+
+def check_final_reply(balasan_final, message, sender, routed, message_id):
+    # Pemeriksaan akhir yang sama untuk /chat dan prosa hasil /chat/stream.
     balasan_final = normalize_text_reply_if_json(balasan_final)
-    if isinstance(balasan_final, str) and is_drive_lookup_intent(message):
+    if isinstance(balasan_final, str) and is_drive_lookup_intent(message, (routed or {}).get("features")):
         lowered_reply = balasan_final.lower()
         no_access_phrases = [
             "tidak memiliki akses",
@@ -1104,16 +4294,138 @@ def chat():
             keyword_drive = extract_drive_lookup_keyword(message)
             balasan_final = cari_file_di_drive(keyword_drive, corr_id=message_id)
 
-    if routed.get("intent") == "chat" and should_rewrite_general_chat_reply(balasan_final):
+    if (
+        routed.get("intent") == "chat"
+        and should_rewrite_general_chat_reply(balasan_final)
+        and reply_fallbacks.allow_rewrite("rewrite_general_answer")
+    ):
         rewritten = rewrite_as_general_assistant_answer(message, balasan_final, sender, corr_id=message_id)
         balasan_final = normalize_text_reply_if_json(rewritten)
 
-    return jsonify({"reply": balasan_final})
+    return balasan_final
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    data = request.get_json(silent=True) or {}
+    sender = str(data.get("sender") or "").strip()
+    message = str(data.get("message") or "")
+    message_id = str(data.get("message_id") or uuid.uuid4().hex[:12])
+    routed = None
+    if sender and not data.get("file_path"):
+        routed = route_intent(
+            message=message,
+            sender=sender,
+            has_file=False,
+            triggered=is_triggered_message(sender, message),
+            has_web_context=bool(get_last_web_query(sender)),
+        )
+
+    if not routed or routed.get("intent") != "chat":
+        # Hanya chat umum yang di-stream; intent lain lewat pipeline /chat biasa dalam satu event.
+        result = process_chat(data)
+        response, status = result if isinstance(result, tuple) else (result, result.status_code)
+        body = {**response.get_json(), "status_code": status}
+        return Response(sse_event("done", body), mimetype="text/event-stream")
+
+    log = get_logger(message_id)
+    include_schedule = needs_schedule_context(message, routed)
+    use_answer_cache = not include_schedule and is_standalone_chat(message)
+    history = [] if use_answer_cache else conversation_context.history(sender)
+    cached_reply = get_cached_chat_answer(message) if use_answer_cache else None
+    if cached_reply is not None:
+        log.info("LLM answer cache hit")
+        record_exchange(sender, message, cached_reply)
+        body = sse_event("chunk", {"text": cached_reply}) + sse_event(
+            "done", {"reply": cached_reply, "first_chunk_ms": 0.0, "total_ms": 0.0, "cached": True}
+        )
+        return Response(body, mimetype="text/event-stream")
+
+    def guarded(source, failures):
+        try:
+            yield from source
+        except Exception as exc:
+            failures.append(exc)
+
+    def generate():
+        started = time.monotonic()
+        corrected = False
+        failures = []
+        deltas = guarded(
+            tanya_blackbox_stream(
+                message,
+                group_id=sender,
+                corr_id=message_id,
+                include_schedule=include_schedule,
+                history=history,
+            ),
+            failures,
+        )
+        head = ""
+        for delta in deltas:
+            head += delta
+            if head.strip():
+                break
+        if head.lstrip().startswith(("{", "`")):
+            # Kemungkinan JSON action: kumpulkan utuh lalu proses seperti /chat.
+            jawaban_ai = head + "".join(deltas)
+            # JSON terpotong karena stream putus tidak boleh dieksekusi sebagai action.
+            reply = f"Error Koneksi: {failures[0]}" if failures else finalize_ai_reply(
+                jawaban_ai, message, sender, routed, message_id
+            )
+            yield sse_event("chunk", {"text": reply})
+            first_chunk_ms = (time.monotonic() - started) * 1000
+        else:
+            reply = ""
+            first_chunk_ms = None
+            for chunk in iter_sentence_chunks(itertools.chain([head], deltas)):
+                if first_chunk_ms is None:
+                    first_chunk_ms = (time.monotonic() - started) * 1000
+                reply += chunk
+                yield sse_event("chunk", {"text": chunk})
+            if failures:
+                # Jawaban parsial dilaporkan apa adanya, tapi tidak diperiksa ulang dan tidak di-cache.
+                if not reply.strip():
+                    reply = f"Error Koneksi: {failures[0]}"
+                    yield sse_event("chunk", {"text": reply})
+                    first_chunk_ms = (time.monotonic() - started) * 1000
+            else:
+                checked = check_final_reply(reply, message, sender, routed, message_id)
+                if checked != reply:
+                    # Chunk yang sudah terkirim tidak bisa ditarik; teks koreksi dikirim lewat event done dan tidak di-cache.
+                    log.info("Streamed reply corrected by final checks")
+                    reply, corrected = checked, True
+                elif use_answer_cache:
+                    remember_chat_answer(message, reply, reply)
+        if not failures:
+            record_exchange(sender, message, reply)
+        total_ms = (time.monotonic() - started) * 1000
+        log.info("Chat stream done first_chunk_ms=%.1f total_ms=%.1f", first_chunk_ms or total_ms, total_ms)
+        done = {"reply": reply, "first_chunk_ms": round(first_chunk_ms or total_ms, 1), "total_ms": round(total_ms, 1)}
+        if corrected:
+            done["corrected"] = True
+        if failures:
+            done["error"] = str(failures[0])
+        yield sse_event("done", done)
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream")
 
 
 def bootstrap():
     validate_required_env()
-    start_scheduler()
+    log = get_logger("bootstrap")
+    if SHARED_STATE_BACKEND == "sqlite" and MEETING_STORAGE_BACKEND == "json":
+        log.warning("MEETING_STORAGE_BACKEND=json is single-process only; use sqlite with multiple workers")
+    # Outbox aman dijalankan di semua worker: klaim baris memakai lease di transaksi SQLite.
+    wa_outbox.start()
+    if leader.start(start_leader_services):
+        log.info("Worker pid=%s is leader (scheduler, drive index)", os.getpid())
+    else:
+        log.info("Worker pid=%s is standby; leader lock held by another process", os.getpid())
 
 
 if __name__ == "__main__":
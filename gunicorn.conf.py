@@ -0,0 +1,16 @@
+import multiprocessing
+import os
+
+# Cache, konteks web & invalidasi dibagi antar-worker lewat SQLite, bukan dict per proses.
+os.environ.setdefault("SHARED_STATE_BACKEND", "sqlite")
+
+bind = os.getenv("HUNKY_BIND", "127.0.0.1:5000")
+workers = int(os.getenv("HUNKY_WORKERS", str(min(multiprocessing.cpu_count() * 2 + 1, 8))))
+# gthread: request lambat (LLM, web search) dan SSE /chat/stream tidak memblokir satu worker penuh.
+worker_class = "gthread"
+threads = int(os.getenv("HUNKY_THREADS", "8"))
+timeout = int(os.getenv("HUNKY_WORKER_TIMEOUT", "90"))
+graceful_timeout = 30
+# App di-import per worker setelah fork: koneksi SQLite & thread latar tidak ikut terwarisi dari master.
+preload_app = False
+accesslog = "-"
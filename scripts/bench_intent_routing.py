@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Microbenchmark route_intent per message over an Indonesian chat corpus.
+
+Contoh:
+    python3 scripts/bench_intent_routing.py --rounds 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_FILE = os.path.join(ROOT_DIR, "scripts", "chat_corpus_id.txt")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=2000, help="berapa kali seluruh korpus di-route")
+    parser.add_argument("--corpus", default=CORPUS_FILE)
+    return parser.parse_args()
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as handle:
+        return [line.strip() for line in handle if line.strip() and not line.startswith("#")]
+
+
+def per_message_us(fn, messages, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for message in messages:
+            fn(message)
+    return (time.perf_counter() - started) * 1e6 / (rounds * len(messages))
+
+
+def main():
+    args = parse_args()
+    messages = load_corpus(args.corpus)
+    # File SQLite app (outbox, index, jadwal) dibuat di direktori sementara, bukan di repo.
+    os.chdir(tempfile.mkdtemp(prefix="hunky-bench-"))
+    sys.path.insert(0, ROOT_DIR)
+    import app
+
+    app.logging.getLogger("hunky").setLevel(app.logging.WARNING)
+    route = lambda message: app.route_intent(message, "62812@s.whatsapp.net", has_web_context=True)
+    intents = {}
+    for message in messages:
+        intent = route(message)["intent"]
+        intents[intent] = intents.get(intent, 0) + 1
+
+    print(f"messages={len(messages)} rounds={args.rounds} intents={intents}")
+    print(f"extract_intent_features={per_message_us(app.extract_intent_features, messages, args.rounds):.2f} us/msg")
+    print(f"route_intent={per_message_us(route, messages, args.rounds):.2f} us/msg")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Benchmark lookup text normalization and trigger detection over an Indonesian chat corpus.
+
+Contoh:
+    python3 scripts/bench_text_normalize.py --rounds 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_FILE = os.path.join(ROOT_DIR, "scripts", "chat_corpus_id.txt")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=2000, help="berapa kali seluruh korpus diproses")
+    parser.add_argument("--corpus", default=CORPUS_FILE)
+    return parser.parse_args()
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as handle:
+        return [line.strip() for line in handle if line.strip() and not line.startswith("#")]
+
+
+def per_message_us(fn, messages, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for message in messages:
+            fn(message)
+    return (time.perf_counter() - started) * 1e6 / (rounds * len(messages))
+
+
+def main():
+    args = parse_args()
+    messages = load_corpus(args.corpus)
+    # File SQLite app (outbox, index, jadwal) dibuat di direktori sementara, bukan di repo.
+    os.chdir(tempfile.mkdtemp(prefix="hunky-bench-"))
+    sys.path.insert(0, ROOT_DIR)
+    import app
+
+    app.logging.getLogger("hunky").setLevel(app.logging.WARNING)
+    print(f"messages={len(messages)} rounds={args.rounds}")
+    print(f"normalize_lookup_text={per_message_us(app.normalize_lookup_text, messages, args.rounds):.2f} us/msg")
+    print(f"normalize_web_query={per_message_us(app.normalize_web_query, messages, args.rounds):.2f} us/msg")
+    print(
+        f"extract_drive_lookup_keyword={per_message_us(app.extract_drive_lookup_keyword, messages, args.rounds):.2f} us/msg"
+    )
+    trigger = lambda message: app.is_triggered_message("120363@g.us", message)
+    print(f"is_triggered_message={per_message_us(trigger, messages, args.rounds):.2f} us/msg")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Benchmark answer_from_web_lookup end-to-end without network access.
+
+Contoh:
+    python3 scripts/bench_web_lookup.py --requests 2000 --concurrency 32 --provider stub
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--provider", default="stub", choices=["stub", "fixture"])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--unique-queries", type=int, default=50)
+    parser.add_argument("--search-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-latency-ms", type=float, default=0)
+    parser.add_argument("--no-cache", action="store_true", help="matikan cache hasil web search")
+    return parser.parse_args()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def main():
+    args = parse_args()
+    os.environ["WEB_SEARCH_PROVIDER"] = args.provider
+    os.environ["WEB_SEARCH_STUB_LATENCY_MS"] = str(args.search_latency_ms)
+    if args.no_cache:
+        os.environ["WEB_SEARCH_CACHE_SIZE"] = "0"
+    # File SQLite app (outbox, index, jadwal) dibuat di direktori sementara, bukan di repo.
+    workdir = tempfile.mkdtemp(prefix="hunky-bench-")
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT_DIR)
+    import app
+
+    def fake_llm(prompt, group_id, konteks_tambahan="", corr_id="-", **kwargs):
+        time.sleep(args.llm_latency_ms / 1000)
+        return "Jawaban benchmark."
+
+    app.tanya_blackbox = fake_llm
+    app.logging.getLogger("hunky").setLevel(app.logging.WARNING)
+
+    queries = [f"berita terbaru topik {index}" for index in range(args.unique_queries)]
+    latencies = []
+    lock = threading.Lock()
+
+    def one(index):
+        started = time.perf_counter()
+        app.answer_from_web_lookup(queries[index % len(queries)], f"bench-{index % 64}@g.us", corr_id="bench")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed_ms)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(one, range(args.requests)))
+    wall = time.perf_counter() - started
+
+    print(f"provider={app.web_search_provider.name} requests={args.requests} concurrency={args.concurrency}")
+    print(f"throughput={args.requests / wall:.1f} req/s wall={wall:.2f}s")
+    print(
+        f"latency_ms p50={percentile(latencies, 50):.1f} p95={percentile(latencies, 95):.1f} "
+        f"p99={percentile(latencies, 99):.1f} mean={statistics.mean(latencies):.1f}"
+    )
+    print(f"web_search_cache={app.web_search_cache.stats()} flight={app.web_search_flight.stats()}")
+    print(f"web_search={app.web_search_executor.stats()}")
+
+
+if __name__ == "__main__":
+    main()
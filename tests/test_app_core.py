@@ -1,5 +1,9 @@
+import asyncio
 import json
-from datetime import timedelta
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 
 import app
 
@@ -106,6 +110,16 @@ def test_extract_drive_lookup_keyword_removes_filler_words():
     assert app.extract_drive_lookup_keyword(msg) == "mft arrehlah wisata"
 
 
+def test_normalize_lookup_text_returns_web_query_and_drive_keyword_in_one_pass():
+    web_query, drive_keyword = app.normalize_lookup_text("@6281234567890 Tolong cari file Laporan-Q3.pdf di drive!")
+    assert web_query == "6281234567890 file laporan-q3.pdf drive"
+    assert drive_keyword == "Laporan-Q3.pdf"
+    assert app.normalize_lookup_text("cari info") == ("cari info", "info")
+    assert app.extract_drive_lookup_keyword("@hunkylaporan") == "laporan"
+    assert app.normalize_lookup_text("@HUNKYlaporan di drive") == ("hunkylaporan drive", "laporan")
+    assert app.is_triggered_message("120363@g.us", "Halo @HUNKY") is True
+
+
 def test_is_web_lookup_intent_true_for_schedule_question():
     msg = "kapan final piala futsal asia?"
     assert app.is_web_lookup_intent(msg) is True
@@ -174,6 +188,24 @@ def test_route_intent_group_not_triggered_ignored():
     assert routed["intent"] == "ignored_text"
 
 
+def test_intent_features_keep_substring_semantics_from_one_scan():
+    features = app.extract_intent_features("Tolong carikan INFORMASI jadwal meeting")
+    # "cari" di dalam "carikan", "info" di dalam "informasi", "meeting" di dalam "jadwal meeting".
+    assert {"drive_verb", "web_verb", "lookup_verb", "lookup_target", "web_topic", "meeting", "web_blocker"} <= features
+    assert "question" not in features
+    assert "question" in app.extract_intent_features("apa kabar")
+    assert app.extract_intent_features("") == frozenset()
+
+
+def test_route_intent_scans_message_once(monkeypatch):
+    calls = []
+    original = app.extract_intent_features
+    monkeypatch.setattr(app, "extract_intent_features", lambda message: calls.append(message) or original(message))
+    routed = app.route_intent("diskusi santai saja", "628123@s.whatsapp.net", triggered=True)
+    assert routed["intent"] == "chat"
+    assert calls == ["diskusi santai saja"]
+
+
 def test_meeting_repo_auto_delete_after_hours(tmp_path):
     repo = make_repo(tmp_path, auto_delete_after_hours=3)
     now = app.now_wib_naive()
@@ -232,3 +264,1078 @@ def test_meeting_repo_zero_hours_purges_past_meeting_immediately(tmp_path):
 
     items = repo.list_by_group("120363@g.us")
     assert len(items) == 0
+
+
+def make_meeting(group_id, dt, topic):
+    return {
+        "group_id": group_id,
+        "date": dt.strftime("%Y-%m-%d"),
+        "time": dt.strftime("%H:%M"),
+        "topic": topic,
+        "location": "Online",
+        "link": "",
+        "people_to_meet": "",
+        "pic_partner": "",
+        "reminded": False,
+    }
+
+
+def test_sqlite_repo_imports_legacy_json_once(tmp_path):
+    repo = make_repo(tmp_path)
+    future = app.now_wib_naive() + timedelta(days=1)
+    with open(repo.db_path, "w", encoding="utf-8") as f:
+        json.dump([{"GroupId": "A@g.us", "Date": future.strftime("%Y-%m-%d"), "Time": "09:30", "Topic": "Legacy"}], f)
+
+    assert [x["topic"] for x in repo.list_by_group("A@g.us")] == ["Legacy"]
+    assert not (tmp_path / "jadwal_test.json").exists()
+    assert (tmp_path / "jadwal_test.json.imported").exists()
+
+    reopened = make_repo(tmp_path)
+    assert [x["topic"] for x in reopened.list_by_group("A@g.us")] == ["Legacy"]
+
+
+def test_json_backend_keeps_legacy_file_format(tmp_path):
+    repo = app.MeetingRepository(str(tmp_path / "jadwal_test.json"), backend="json")
+    future = app.now_wib_naive() + timedelta(days=1)
+    repo.add(make_meeting("A@g.us", future, "Json meeting"))
+    repo._store.compact()
+
+    with open(repo.db_path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    assert raw[0]["GroupId"] == "A@g.us"
+    assert raw[0]["Topic"] == "Json meeting"
+    assert repo.list_by_group("A@g.us")[0]["topic"] == "Json meeting"
+
+
+def test_meeting_repo_mark_reminded_and_reset(tmp_path):
+    repo = make_repo(tmp_path)
+    future = app.now_wib_naive() + timedelta(days=1)
+    repo.add(make_meeting("A@g.us", future, "A meeting"))
+    repo.add(make_meeting("B@g.us", future, "B meeting"))
+
+    a_item = repo.list_by_group("A@g.us")[0]
+    repo.mark_reminded([a_item["id"]])
+    assert repo.list_by_group("A@g.us")[0]["reminded"] is True
+
+    repo.reset_group("A@g.us")
+    assert repo.list_by_group("A@g.us") == []
+    assert len(repo.list_by_group("B@g.us")) == 1
+
+
+def test_meeting_repo_serves_reads_from_memory(tmp_path, monkeypatch):
+    repo = make_repo(tmp_path)
+    future = app.now_wib_naive() + timedelta(days=1)
+    repo.add(make_meeting("A@g.us", future, "A meeting"))
+
+    calls = {"count": 0}
+    original_load = repo._store.load_items
+
+    def counting_load(cutoffs):
+        calls["count"] += 1
+        return original_load(cutoffs)
+
+    monkeypatch.setattr(repo._store, "load_items", counting_load)
+    for _ in range(5):
+        assert len(repo.list_by_group("A@g.us")) == 1
+    repo.load_all()
+    assert calls["count"] == 0
+
+
+def test_meeting_repo_detects_external_file_change(tmp_path):
+    path = str(tmp_path / "jadwal_test.json")
+    repo = app.MeetingRepository(path, backend="json")
+    other_process = app.MeetingRepository(path, backend="json")
+    future = app.now_wib_naive() + timedelta(days=1)
+
+    assert repo.list_by_group("A@g.us") == []
+    other_process.add(make_meeting("A@g.us", future, "Dari proses lain"))
+    assert [x["topic"] for x in repo.list_by_group("A@g.us")] == ["Dari proses lain"]
+
+
+def test_meeting_repo_coalesces_deferred_writes(tmp_path, monkeypatch):
+    repo = app.MeetingRepository(str(tmp_path / "jadwal_test.json"), write_coalesce_seconds=60)
+    future = app.now_wib_naive() + timedelta(days=1)
+    batches = []
+    original_apply = repo._store.apply
+
+    def recording_apply(ops):
+        batches.append(len(ops))
+        return original_apply(ops)
+
+    monkeypatch.setattr(repo._store, "apply", recording_apply)
+    for idx in range(3):
+        repo.add(make_meeting("A@g.us", future + timedelta(minutes=idx), f"Meeting {idx}"))
+
+    assert batches == []
+    assert len(repo.list_by_group("A@g.us")) == 3
+    repo.flush()
+    assert batches == [3]
+    assert len(make_repo(tmp_path).list_by_group("A@g.us")) == 3
+
+
+def test_json_backend_replays_journal_and_skips_torn_record(tmp_path):
+    path = str(tmp_path / "jadwal_test.json")
+    repo = app.MeetingRepository(path, backend="json")
+    future = app.now_wib_naive() + timedelta(days=1)
+    repo.add(make_meeting("A@g.us", future, "Dari journal"))
+
+    with open(path, "r", encoding="utf-8") as f:
+        assert json.load(f) == []
+    with open(f"{path}.journal", "a", encoding="utf-8") as f:
+        f.write('{"op":"reset","gro')
+
+    reopened = app.MeetingRepository(path, backend="json")
+    assert [x["topic"] for x in reopened.list_by_group("A@g.us")] == ["Dari journal"]
+
+    # Record setelah crash tidak boleh menempel di baris terpotong dan ikut hilang saat replay.
+    reopened.add(make_meeting("A@g.us", future + timedelta(hours=1), "Setelah crash"))
+    reopened.flush()
+    replayed = app.MeetingRepository(path, backend="json")
+    assert [x["topic"] for x in replayed.list_by_group("A@g.us")] == ["Dari journal", "Setelah crash"]
+
+
+def test_json_backend_compaction_folds_journal_into_snapshot(tmp_path):
+    path = tmp_path / "jadwal_test.json"
+    store = app.JsonMeetingStore(str(path), compact_after_ops=0)
+    future = app.now_wib_naive() + timedelta(days=1)
+    item = app.normalize_meeting_item({**make_meeting("A@g.us", future, "Snapshot"), "id": "m1"})
+    store.apply([{"op": "add", "item": item}, {"op": "reminded", "ids": ["m1"]}])
+
+    store.compact()
+
+    assert not (tmp_path / "jadwal_test.json.journal").exists()
+    snapshot = json.loads(path.read_text(encoding="utf-8"))
+    assert snapshot[0]["id"] == "m1"
+    assert snapshot[0]["reminded"] is True
+
+
+def test_json_backend_moves_corrupt_snapshot_aside(tmp_path):
+    path = tmp_path / "jadwal_test.json"
+    path.write_text('[{"GroupId": "A@g.us", "Da', encoding="utf-8")
+
+    repo = app.MeetingRepository(str(path), backend="json")
+
+    assert repo.load_all() == []
+    assert (tmp_path / "jadwal_test.json.corrupt").read_text(encoding="utf-8").startswith("[{")
+
+
+def test_due_reminders_returns_only_pending_window(tmp_path):
+    repo = make_repo(tmp_path)
+    now = app.now_wib_naive().replace(second=0, microsecond=0)
+    repo.add(make_meeting("A@g.us", now + timedelta(minutes=3), "Soon"))
+    repo.add(make_meeting("A@g.us", now + timedelta(minutes=30), "Later"))
+    repo.add(make_meeting("A@g.us", now - timedelta(minutes=10), "Missed"))
+    repo.add(make_meeting("B@g.us", now + timedelta(minutes=4), "Reset before due"))
+    repo.reset_group("B@g.us")
+
+    due = repo.due_reminders(now, lead_minutes=5)
+
+    assert [x["topic"] for x in due] == ["Soon"]
+    # Belum ditandai reminded: tetap due sampai mark_reminded berhasil.
+    assert [x["topic"] for x in repo.due_reminders(now, lead_minutes=5)] == ["Soon"]
+    repo.mark_reminded([x["id"] for x in due])
+    assert repo.due_reminders(now, lead_minutes=5) == []
+    later = repo.due_reminders(now + timedelta(minutes=26), lead_minutes=5)
+    assert [x["topic"] for x in later] == ["Later"]
+
+
+def test_cek_reminder_otomatis_keeps_reminders_when_sending_fails(tmp_path, monkeypatch):
+    repo = make_repo(tmp_path)
+    monkeypatch.setattr(app, "meeting_repo", repo)
+    now = app.now_wib_naive()
+    repo.add(make_meeting("A@g.us", now + timedelta(minutes=3), "Standup"))
+    sent = []
+
+    def flaky_send(group_id, message, idempotency_key=None, expires_at=None):
+        if not sent:
+            sent.append(None)
+            raise app.sqlite3.OperationalError("database is locked")
+        sent.append(idempotency_key)
+
+    monkeypatch.setattr(app, "send_reminder_message", flaky_send)
+
+    try:
+        app.cek_reminder_otomatis()
+    except app.sqlite3.OperationalError:
+        pass
+    app.cek_reminder_otomatis()
+
+    assert len(sent) == 2 and sent[1].startswith("reminder:")
+    assert repo.list_by_group("A@g.us")[0]["reminded"] is True
+
+
+def test_cek_reminder_otomatis_sends_due_and_marks_reminded(tmp_path, monkeypatch):
+    repo = make_repo(tmp_path)
+    monkeypatch.setattr(app, "meeting_repo", repo)
+    now = app.now_wib_naive()
+    repo.add(make_meeting("A@g.us", now + timedelta(minutes=3), "Standup"))
+    repo.add(make_meeting("A@g.us", now + timedelta(hours=2), "Review"))
+    sent = []
+    monkeypatch.setattr(
+        app,
+        "send_reminder_message",
+        lambda group_id, message, idempotency_key=None, expires_at=None: sent.append((group_id, message, expires_at)),
+    )
+
+    app.cek_reminder_otomatis()
+    app.cek_reminder_otomatis()
+
+    assert len(sent) == 1
+    assert sent[0][0] == "A@g.us"
+    assert "Standup" in sent[0][1]
+    assert sent[0][2] == (now + timedelta(minutes=3)).replace(second=0, microsecond=0, tzinfo=app.WIB).timestamp()
+    reminded = {x["topic"]: x["reminded"] for x in repo.list_by_group("A@g.us")}
+    assert reminded == {"Standup": True, "Review": False}
+
+
+def test_saved_meeting_registers_one_shot_reminder_job(tmp_path, monkeypatch):
+    repo = make_repo(tmp_path)
+    scheduler = app.BackgroundScheduler(timezone=app.WIB)
+    monkeypatch.setattr(app, "_scheduler", scheduler)
+    monkeypatch.setattr(app, "meeting_repo", repo)
+    repo.subscribe(app.sync_reminder_jobs)
+    starts_at = (app.now_wib_naive() + timedelta(hours=1)).replace(second=0, microsecond=0)
+
+    repo.add(make_meeting("A@g.us", starts_at, "Kickoff"))
+
+    jobs = scheduler.get_jobs()
+    assert len(jobs) == 1
+    assert jobs[0].trigger.run_date.replace(tzinfo=None) == starts_at - timedelta(minutes=app.REMINDER_LEAD_MINUTES)
+
+    repo.reset_group("A@g.us")
+    assert scheduler.get_jobs() == []
+
+
+def test_reload_reschedules_pending_reminders_only(tmp_path, monkeypatch):
+    repo = make_repo(tmp_path)
+    scheduler = app.BackgroundScheduler(timezone=app.WIB)
+    monkeypatch.setattr(app, "_scheduler", scheduler)
+    future = app.now_wib_naive() + timedelta(hours=1)
+    repo.add(make_meeting("A@g.us", future, "Pending"))
+    repo.add(make_meeting("A@g.us", future + timedelta(minutes=30), "Already reminded"))
+    reminded_id = [x["id"] for x in repo.list_by_group("A@g.us") if x["topic"] == "Already reminded"]
+    repo.mark_reminded(reminded_id)
+
+    app.sync_reminder_jobs("reload", make_repo(tmp_path).load_all())
+
+    assert [job.id for job in scheduler.get_jobs()] == [
+        f"{app.REMINDER_JOB_PREFIX}{x['id']}" for x in repo.list_by_group("A@g.us") if x["topic"] == "Pending"
+    ]
+
+
+def test_wa_push_dispatcher_runs_targets_concurrently_in_order():
+    dispatcher = app.WaPushDispatcher(max_workers=4, rate_per_second=0)
+    sent = []
+    lock = threading.Lock()
+
+    def slow_send(target_id, message):
+        time.sleep(0.05)
+        with lock:
+            sent.append((target_id, message))
+        return message != "fail"
+
+    batch = [("A", "a1"), ("B", "b1"), ("A", "a2"), ("C", "fail"), ("B", "b2")]
+    started = time.monotonic()
+    delivered = dispatcher.dispatch(batch, slow_send)
+    elapsed = time.monotonic() - started
+
+    assert delivered == 4
+    assert elapsed < 0.2
+    assert [m for t, m in sent if t == "A"] == ["a1", "a2"]
+    assert [m for t, m in sent if t == "B"] == ["b1", "b2"]
+    stats = dispatcher.stats()
+    assert stats["last_batch"]["size"] == 5
+    assert stats["last_batch"]["targets"] == 3
+    assert stats["failures"] == 1
+
+
+def test_rate_limiter_spaces_out_acquires():
+    limiter = app.RateLimiter(rate_per_second=50, burst=1)
+    started = time.monotonic()
+    for _ in range(4):
+        limiter.acquire()
+    assert time.monotonic() - started >= 0.05
+
+
+def test_wa_outbox_is_idempotent_per_key(tmp_path, monkeypatch):
+    outbox = app.WaOutbox(str(tmp_path / "outbox.sqlite3"))
+    sent = []
+    monkeypatch.setattr(app, "post_wa_message", lambda target_id, message: sent.append(message) or (True, ""))
+
+    assert outbox.enqueue("A@g.us", "halo", idempotency_key="reminder:1") is True
+    assert outbox.enqueue("A@g.us", "halo", idempotency_key="reminder:1") is False
+    outbox.drain_once()
+    assert outbox.enqueue("A@g.us", "halo", idempotency_key="reminder:1") is False
+
+    assert sent == ["halo"]
+    assert outbox.stats() == {"pending": 0, "dead_letters": 0, "sent_recent": 1}
+
+
+def test_wa_outbox_dead_letters_expired_rows_instead_of_sending(tmp_path, monkeypatch):
+    outbox = app.WaOutbox(str(tmp_path / "outbox.sqlite3"), backoff_seconds=60, max_backoff_seconds=60)
+    attempts = []
+
+    def failing_post(target_id, message):
+        attempts.append(message)
+        return False, "HTTP 503: WA socket belum siap"
+
+    monkeypatch.setattr(app, "post_wa_message", failing_post)
+    outbox.enqueue("A@g.us", "telat", idempotency_key="reminder:old", expires_at=time.time() - 1)
+    outbox.enqueue("A@g.us", "mepet", idempotency_key="reminder:soon", expires_at=time.time() + 30)
+
+    outbox.drain_once()
+
+    # Baris kedaluwarsa tidak dikirim; baris yang retry-nya jatuh setelah expires_at tidak dijadwalkan ulang.
+    assert attempts == ["mepet"]
+    assert outbox.stats()["pending"] == 0
+    dead = {row["idempotency_key"]: row["last_error"] for row in outbox.dead_letters()}
+    assert dead["reminder:old"] == "expired before delivery"
+    assert dead["reminder:soon"].startswith("expired before retry")
+
+
+def test_wa_outbox_adds_expires_at_to_existing_database(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    conn = app.sqlite3.connect(path)
+    conn.executescript(app.WaOutbox.SCHEMA.replace(",\n    expires_at REAL", ""))
+    conn.close()
+
+    outbox = app.WaOutbox(path)
+
+    assert outbox.enqueue("A@g.us", "halo", idempotency_key="k", expires_at=time.time() + 60) is True
+
+
+def test_wa_outbox_retries_with_backoff_then_dead_letters(tmp_path, monkeypatch):
+    outbox = app.WaOutbox(str(tmp_path / "outbox.sqlite3"), max_attempts=3, backoff_seconds=0, max_backoff_seconds=0)
+    attempts = []
+
+    def failing_post(target_id, message):
+        attempts.append(target_id)
+        return False, "HTTP 503: WA socket belum siap"
+
+    monkeypatch.setattr(app, "post_wa_message", failing_post)
+    outbox.enqueue("A@g.us", "reminder", idempotency_key="reminder:2")
+
+    outbox.drain_once()
+    assert outbox.stats()["pending"] == 1
+    outbox.drain_once()
+    outbox.drain_once()
+
+    assert len(attempts) == 3
+    dead = outbox.dead_letters()
+    assert dead[0]["idempotency_key"] == "reminder:2"
+    assert dead[0]["attempts"] == 3
+    assert "503" in dead[0]["last_error"]
+    assert outbox.enqueue("A@g.us", "reminder", idempotency_key="reminder:2") is False
+
+
+def write_token(path, expiry):
+    path.write_text(
+        json.dumps(
+            {
+                "token": "access-token",
+                "refresh_token": "refresh-token",
+                "client_id": "client-id",
+                "client_secret": "client-secret",
+                "expiry": expiry.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            }
+        ),
+        encoding="utf-8",
+    )
+
+
+def test_google_service_cache_builds_once_until_token_changes(tmp_path, monkeypatch):
+    token_path = tmp_path / "token.json"
+    write_token(token_path, datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(hours=1))
+    builds = []
+    monkeypatch.setattr(app, "build", lambda name, version, **kwargs: builds.append((name, version)) or object())
+    cache = app.GoogleServiceCache(token_path=str(token_path))
+
+    first = cache.get("drive", "v3")
+    assert cache.get("drive", "v3") is first
+    assert builds == [("drive", "v3")]
+
+    write_token(token_path, datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(hours=2))
+    os.utime(token_path, ns=(time.time_ns(), time.time_ns() + 1_000_000))
+    assert cache.get("drive", "v3") is not first
+    assert len(builds) == 2
+
+
+def test_google_service_cache_refreshes_token_before_expiry(tmp_path, monkeypatch):
+    token_path = tmp_path / "token.json"
+    write_token(token_path, datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(seconds=30))
+    monkeypatch.setattr(app, "build", lambda name, version, **kwargs: object())
+    refreshed = []
+
+    def fake_refresh(creds, request):
+        refreshed.append(True)
+        creds.token = "new-token"
+        creds.expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(hours=1)
+
+    monkeypatch.setattr(app.Credentials, "refresh", fake_refresh)
+    cache = app.GoogleServiceCache(token_path=str(token_path), refresh_margin_seconds=300)
+
+    assert cache.get("drive", "v3") is not None
+    assert cache.get("drive", "v3") is not None
+    assert refreshed == [True]
+    assert json.loads(token_path.read_text(encoding="utf-8"))["token"] == "new-token"
+
+
+class FakeDriveRequest:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self, num_retries=0):
+        return self.result
+
+
+class FakeDriveFiles:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, **kwargs):
+        self.service.list_calls.append(kwargs)
+        return FakeDriveRequest({"files": list(self.service.files_in_folder)})
+
+    def create(self, body=None, media_body=None, fields=None):
+        self.service.files_in_folder.append({"name": body["name"], "webViewLink": "https://drive.example/new"})
+        return FakeDriveRequest({"id": "new-id", "webViewLink": "https://drive.example/new"})
+
+
+class FakeDriveService:
+    def __init__(self, files_in_folder=None):
+        self.files_in_folder = list(files_in_folder or [])
+        self.list_calls = []
+
+    def files(self):
+        return FakeDriveFiles(self)
+
+
+def test_drive_search_cache_hits_until_upload_invalidates(tmp_path, monkeypatch):
+    service = FakeDriveService([{"name": "proposal.pdf", "webViewLink": "https://drive.example/1"}])
+    monkeypatch.setattr(app, "get_google_service", lambda *args, **kwargs: service)
+    monkeypatch.setattr(app, "drive_search_cache", app.TTLCache(16, 60))
+    monkeypatch.setattr(app, "drive_index", app.DriveIndex(str(tmp_path / "drive_index.sqlite3")))
+
+    app.cari_file_di_drive("Proposal")
+    second = app.cari_file_di_drive("proposal ")
+    assert "proposal.pdf" in second
+    assert len(service.list_calls) == 1
+    assert app.drive_search_cache.stats()["hits"] == 1
+
+    upload = tmp_path / "baru.pdf"
+    upload.write_bytes(b"%PDF-1.4")
+    assert "File Disimpan" in app.upload_ke_drive(str(upload), "application/pdf")
+
+    app.cari_file_di_drive("proposal")
+    assert len(service.list_calls) == 2
+
+
+def test_duplicate_upload_returns_existing_link_without_transfer(tmp_path, monkeypatch):
+    service = FakeDriveService()
+    monkeypatch.setattr(app, "get_google_service", lambda *args, **kwargs: service)
+    monkeypatch.setattr(app, "drive_index", app.DriveIndex(str(tmp_path / "drive_index.sqlite3")))
+
+    first = tmp_path / "notulen.pdf"
+    first.write_bytes(b"%PDF-1.4 notulen")
+    assert "File Disimpan" in app.upload_ke_drive(str(first), "application/pdf")
+
+    forwarded = tmp_path / "forwarded.pdf"
+    forwarded.write_bytes(b"%PDF-1.4 notulen")
+    reply = app.upload_ke_drive(str(forwarded), "application/pdf")
+    assert "sudah ada di Drive" in reply
+    assert "https://drive.example/new" in reply
+    assert not forwarded.exists()
+    assert len(service.files_in_folder) == 1
+
+    forwarded.write_bytes(b"%PDF-1.4 notulen")
+    assert "File Disimpan" in app.upload_ke_drive(str(forwarded), "application/pdf", force_new=True)
+    assert len(service.files_in_folder) == 2
+
+
+class FakeDriveChanges:
+    def __init__(self, service):
+        self.service = service
+
+    def getStartPageToken(self):
+        return FakeDriveRequest({"startPageToken": str(len(self.service.change_log))})
+
+    def list(self, pageToken=None, **kwargs):
+        changes = self.service.change_log[int(pageToken) :]
+        return FakeDriveRequest({"changes": changes, "newStartPageToken": str(len(self.service.change_log))})
+
+
+class FakeIndexedDriveService(FakeDriveService):
+    def __init__(self, files_in_folder=None):
+        super().__init__(files_in_folder)
+        self.change_log = []
+
+    def changes(self):
+        return FakeDriveChanges(self)
+
+
+def test_drive_index_syncs_folder_and_serves_local_search(tmp_path, monkeypatch):
+    folder = app.PARENT_FOLDER_ID
+    service = FakeIndexedDriveService(
+        [
+            {"id": "1", "name": "Proposal Kegiatan.pdf", "createdTime": "2026-01-01T00:00:00Z", "webViewLink": "https://drive.example/1"},
+            {"id": "2", "name": "Laporan Keuangan.xlsx", "createdTime": "2026-01-02T00:00:00Z", "webViewLink": "https://drive.example/2"},
+        ]
+    )
+    index = app.DriveIndex(str(tmp_path / "drive_index.sqlite3"))
+    assert index.is_warm(folder) is False
+    assert index.sync(service, folder) == 2
+
+    assert [item["name"] for item in index.search("propos", folder)] == ["Proposal Kegiatan.pdf"]
+    assert [item["name"] for item in index.search("uangan", folder)] == ["Laporan Keuangan.xlsx"]
+    assert [item["name"] for item in index.search("laporan keuanagn", folder)] == ["Laporan Keuangan.xlsx"]
+
+    service.change_log.extend(
+        [
+            {"fileId": "1", "removed": False, "file": {"id": "1", "name": "Proposal Kegiatan.pdf", "parents": [folder], "trashed": True}},
+            {"fileId": "3", "removed": False, "file": {"id": "3", "name": "Proposal Revisi.pdf", "parents": [folder], "webViewLink": "https://drive.example/3"}},
+            {"fileId": "4", "removed": False, "file": {"id": "4", "name": "Proposal Lain.pdf", "parents": ["other-folder"]}},
+        ]
+    )
+    assert index.sync(service, folder) == 3
+    assert [item["name"] for item in index.search("proposal", folder)] == ["Proposal Revisi.pdf"]
+
+    monkeypatch.setattr(app, "drive_index", index)
+    monkeypatch.setattr(app, "drive_search_cache", app.TTLCache(16, 60))
+    monkeypatch.setattr(app, "get_google_service", lambda *args, **kwargs: service)
+    assert "Proposal Revisi.pdf" in app.cari_file_di_drive("proposal")
+    assert service.list_calls and all("pageToken" in call for call in service.list_calls)
+
+
+class FlakyChunkStatus:
+    def __init__(self, sent, total):
+        self.resumable_progress = sent
+        self.total_size = total
+
+
+class FlakyUploadRequest:
+    def __init__(self, total, chunk, failures):
+        self.total = total
+        self.chunk = chunk
+        self.failures = set(failures)
+        self.resumable_progress = 0
+        self.calls = 0
+
+    def next_chunk(self, num_retries=0):
+        self.calls += 1
+        if self.calls in self.failures:
+            raise ConnectionResetError("connection reset")
+        self.resumable_progress = min(self.resumable_progress + self.chunk, self.total)
+        if self.resumable_progress == self.total:
+            return None, {"id": "big", "webViewLink": "https://drive.example/big"}
+        return FlakyChunkStatus(self.resumable_progress, self.total), None
+
+
+def test_resumable_upload_retries_chunk_from_last_offset(monkeypatch):
+    monkeypatch.setattr(app.time, "sleep", lambda seconds: None)
+    upload_request = FlakyUploadRequest(total=30, chunk=10, failures=[2])
+    reports = []
+
+    result = app.upload_media_resumable(
+        upload_request, app.get_logger("test"), progress=lambda sent, total, retries: reports.append((sent, retries))
+    )
+
+    assert result["id"] == "big"
+    assert upload_request.calls == 4
+    assert reports == [(10, 0), (10, 1), (20, 1)]
+
+
+def test_resumable_upload_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(app.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(app, "DRIVE_UPLOAD_MAX_RETRIES", 2)
+    upload_request = FlakyUploadRequest(total=30, chunk=10, failures=[1, 2, 3])
+
+    try:
+        app.upload_media_resumable(upload_request, app.get_logger("test"))
+    except ConnectionResetError:
+        pass
+    else:
+        raise AssertionError("expected the upload to give up")
+    assert upload_request.calls == 3
+
+
+def test_ttl_cache_expires_and_evicts_least_recently_used(monkeypatch):
+    clock = {"now": 1000.0}
+    monkeypatch.setattr(app.time, "monotonic", lambda: clock["now"])
+    cache = app.TTLCache(maxsize=2, ttl_seconds=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    clock["now"] += 11
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 2
+
+
+def test_web_search_cache_shares_one_live_search_across_phrasings(monkeypatch):
+    monkeypatch.setattr(app, "web_search_cache", app.TTLCache(16, 600))
+    monkeypatch.setattr(app, "web_search_flight", app.SingleFlight())
+    calls = []
+    release = threading.Event()
+
+    def fake_live(query, corr_id="-"):
+        calls.append(query)
+        release.wait(1)
+        return "- Timnas: menang 2-0"
+
+    monkeypatch.setattr(app, "search_web_live", fake_live)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(app.cari_di_internet("skor timnas"))) for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["skor timnas"]
+    assert results == ["- Timnas: menang 2-0"] * 5
+    assert app.cari_di_internet("tolong cari info skor timnas dong") == "- Timnas: menang 2-0"
+    assert len(calls) == 1
+    assert app.web_search_flight.stats()["shared"] == 4
+
+
+def test_web_search_ttl_is_short_for_realtime_queries(monkeypatch):
+    monkeypatch.setattr(app, "WEB_SEARCH_CACHE_TTL_SECONDS", 1800)
+    monkeypatch.setattr(app, "WEB_SEARCH_CACHE_TTL_REALTIME_SECONDS", 60)
+    assert app.web_search_ttl("hasil pertandingan semalam") == 60
+    assert app.web_search_ttl("sejarah candi borobudur") == 1800
+
+
+def test_web_search_executor_hedges_fallback_and_takes_first_result():
+    executor = app.WebSearchExecutor(max_workers=4, hedge_delay_seconds=0.05, deadline_seconds=2)
+
+    def search(query):
+        if query == "raw query":
+            time.sleep(0.5)
+            return []
+        return [{"title": "hit"}]
+
+    results, timing = executor.search(search, "raw query", "fallback")
+
+    assert results == [{"title": "hit"}]
+    assert timing["winner"] == "fallback"
+    assert timing["primary_ms"] is None
+    assert timing["fallback_started_ms"] >= 50
+    assert timing["total_ms"] < 400
+    assert executor.stats()["fallback_wins"] == 1
+
+
+def test_web_search_executor_launches_fallback_early_when_primary_is_empty():
+    executor = app.WebSearchExecutor(max_workers=2, hedge_delay_seconds=5, deadline_seconds=2)
+
+    results, timing = executor.search(lambda query: [] if query == "a" else [{"title": query}], "a", "b")
+
+    assert results == [{"title": "b"}]
+    assert timing["fallback_started_ms"] < 1000
+
+
+def test_web_search_executor_raises_after_deadline():
+    executor = app.WebSearchExecutor(max_workers=2, hedge_delay_seconds=0, deadline_seconds=0.05)
+
+    try:
+        executor.search(lambda query: time.sleep(0.3) or [], "a", "b")
+    except TimeoutError:
+        pass
+    else:
+        raise AssertionError("expected a timeout")
+    assert executor.stats()["timeouts"] == 1
+
+
+def test_fixture_search_provider_serves_file_and_deterministic_results(tmp_path, monkeypatch):
+    fixture = tmp_path / "search.json"
+    fixture.write_text(
+        json.dumps({"Jadwal Timnas": [{"title": "Timnas", "body": "Main Jumat", "href": "https://x"}]}),
+        encoding="utf-8",
+    )
+    provider = app.FixtureSearchProvider(str(fixture))
+    monkeypatch.setattr(app, "web_search_provider", provider)
+
+    assert "Main Jumat" in app.search_web_live("tolong cari jadwal timnas")
+    assert provider.text("harga emas", 2) == provider.text("harga emas", 2)
+    assert len(provider.text("harga emas", 2)) == 2
+
+
+def test_latency_stub_provider_injects_delay_and_empty_results():
+    stub = app.LatencyStubSearchProvider(latency_ms=30, empty_rate=1.0)
+    started = time.monotonic()
+    assert stub.text("apa saja", 3) == []
+    assert time.monotonic() - started >= 0.03
+
+    try:
+        app.build_search_provider("bing")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected unknown provider to be rejected")
+
+
+class SlowBlackboxResponse:
+    status_code = 200
+
+    def json(self):
+        return {"choices": [{"message": {"content": "halo"}}]}
+
+
+class SlowBlackboxSession:
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+
+    def post(self, url, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        return SlowBlackboxResponse()
+
+
+def test_blackbox_client_limits_in_flight_and_records_queue_wait():
+    client = app.BlackboxClient("http://llm", "key", 5, max_in_flight=2, acquire_timeout_seconds=5)
+    client.session = SlowBlackboxSession(0.05)
+    threads = [threading.Thread(target=client.post, args=({},)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = client.stats()
+    assert stats["requests"] == 6
+    assert stats["peak_in_flight"] == 2
+    assert stats["queue_wait_ms_max"] >= 40
+    assert stats["in_flight"] == 0
+
+
+def test_blackbox_client_rejects_when_queue_wait_exceeds_timeout():
+    client = app.BlackboxClient("http://llm", "key", 5, max_in_flight=1, acquire_timeout_seconds=0.01)
+    client.session = SlowBlackboxSession(0.2)
+    worker = threading.Thread(target=client.post, args=({},))
+    worker.start()
+    time.sleep(0.02)
+    try:
+        client.post({})
+    except TimeoutError:
+        pass
+    else:
+        raise AssertionError("expected the second request to be rejected")
+    worker.join()
+    assert client.stats()["rejected"] == 1
+
+
+def test_tanya_blackbox_async_uses_shared_client(monkeypatch):
+    client = app.BlackboxClient("http://llm", "key", 5, max_in_flight=2, acquire_timeout_seconds=5)
+    client.session = SlowBlackboxSession(0.01)
+    monkeypatch.setattr(app, "blackbox_client", client)
+
+    async def ask_twice():
+        return await asyncio.gather(
+            app.tanya_blackbox_async("hai", "62812@s.whatsapp.net"),
+            app.tanya_blackbox_async("halo", "62812@s.whatsapp.net"),
+        )
+
+    assert asyncio.run(ask_twice()) == ["halo", "halo"]
+    assert client.session.calls == 2
+
+
+class StreamingBlackboxResponse:
+    status_code = 200
+    headers = {"Content-Type": "text/event-stream"}
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.closed = False
+
+    def iter_lines(self, decode_unicode=False):
+        return iter(self.lines)
+
+    def close(self):
+        self.closed = True
+
+
+class StreamingBlackboxSession:
+    def __init__(self, response):
+        self.response = response
+        self.kwargs = None
+
+    def post(self, url, **kwargs):
+        self.kwargs = kwargs
+        return self.response
+
+
+def test_blackbox_stream_parses_sse_and_tracks_ttfb():
+    response = StreamingBlackboxResponse(
+        [
+            'data: {"choices":[{"delta":{"content":"Halo"}}]}',
+            "",
+            ": keep-alive",
+            'data: {"choices":[{"delta":{"content":" dunia."}}]}',
+            "data: [DONE]",
+        ]
+    )
+    client = app.BlackboxClient("http://llm", "key", 5, max_in_flight=1, acquire_timeout_seconds=1)
+    client.session = StreamingBlackboxSession(response)
+
+    assert list(client.stream({"messages": []})) == ["Halo", " dunia."]
+    assert client.session.kwargs["stream"] is True
+    assert client.session.kwargs["json"]["stream"] is True
+    assert response.closed is True
+    stats = client.stats()
+    assert stats["stream_requests"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_iter_sentence_chunks_flushes_on_sentence_boundaries():
+    deltas = ["Rapat ", "dimulai jam 9. ", "Jangan lupa ", "bawa laptop! Sampai ", "jumpa"]
+    assert list(app.iter_sentence_chunks(deltas, min_chars=10)) == [
+        "Rapat dimulai jam 9. ",
+        "Jangan lupa bawa laptop! ",
+        "Sampai jumpa",
+    ]
+
+
+def test_llm_answer_cache_matches_near_duplicates_within_scope(monkeypatch):
+    clock = {"now": 1000.0}
+    monkeypatch.setattr(app.time, "monotonic", lambda: clock["now"])
+    cache = app.LlmAnswerCache(maxsize=2, ttl_seconds=60, min_similarity=0.7)
+    cache.set("model|v1", "apa saja kemampuan hunky sebagai asisten", "jawaban")
+
+    assert cache.get("model|v1", "apa saja kemampuan hunky sebagai asisten") == "jawaban"
+    assert cache.get("model|v1", "apa saja kemampuan hunky sebagai asisten ya") == "jawaban"
+    assert cache.get("model|v2", "apa saja kemampuan hunky sebagai asisten") is None
+    assert cache.get("model|v1", "berapa jarak bumi ke bulan") is None
+    assert cache.stats()["near_hits"] == 1
+
+    cache.set("model|v1", "berapa hasil dari 1234 x 5678 ya kak", "7006652")
+    assert cache.get("model|v1", "berapa hasil dari 1234 x 5679 ya kak") is None
+
+    clock["now"] += 61
+    assert cache.get("model|v1", "apa saja kemampuan hunky sebagai asisten") is None
+
+
+def test_chat_cache_text_skips_time_dependent_questions():
+    for message in ["hunky jam berapa?", "tanggal berapa sekarang", "ini hari apa?", "pukul berapa di tokyo"]:
+        assert app.chat_cache_text(message) == ""
+    assert app.chat_cache_text("hunky apa itu scrum?") == "apa itu scrum"
+
+
+def test_llm_answer_cache_evicts_lru_and_cleans_buckets():
+    cache = app.LlmAnswerCache(maxsize=1, ttl_seconds=60)
+    cache.set("s", "pertanyaan pertama tentang python", "a")
+    cache.set("s", "pertanyaan kedua tentang golang", "b")
+
+    assert cache.get("s", "pertanyaan pertama tentang python") is None
+    assert cache.stats()["evictions"] == 1
+    assert all(("s", "pertanyaan pertama tentang python") not in keys for keys in cache._buckets.values())
+
+
+def test_chat_cache_text_bypasses_group_and_time_sensitive_messages():
+    assert app.chat_cache_text("@hunky  Bisa apa?") == "bisa apa"
+    assert app.chat_cache_text("jadwal meeting besok apa?") == ""
+    assert app.chat_cache_text("harga emas sekarang") == ""
+
+
+def test_is_standalone_chat_detects_messages_that_refer_back():
+    for message in ["hunky apa itu scrum?", "bisa apa", "kenapa langit biru"]:
+        assert app.is_standalone_chat(message)
+    for message in ["rangkum dong", "terjemahkan ke inggris", "contohnya?", "maksudnya itu?", "kenapa?", "jelaskan lagi"]:
+        assert not app.is_standalone_chat(message)
+
+
+def test_repair_action_json_fixes_common_model_mistakes():
+    assert app.repair_action_json("{'action': 'search_file', 'keyword': 'proposal',}") == {
+        "action": "search_file",
+        "keyword": "proposal",
+    }
+    assert app.repair_action_json('Oke: {action: "search_meeting", date: "2026-02-08"') == {
+        "action": "search_meeting",
+        "date": "2026-02-08",
+    }
+    assert app.repair_action_json('{"action": "web_search", "data": {"query": "skor timnas"') == {
+        "action": "web_search",
+        "data": {"query": "skor timnas"},
+    }
+    assert app.repair_action_json("Jawaban biasa {tanpa aksi}") is None
+
+
+def test_strip_json_from_reply_keeps_surrounding_prose():
+    text = 'Siap, ini jawabannya. {"action": "unknown"} Semoga membantu.'
+    assert app.strip_json_from_reply(text) == "Siap, ini jawabannya. Semoga membantu."
+    assert app.strip_json_from_reply('```json\n{"action": "x"}\n```') == ""
+
+
+def test_reply_fallbacks_budget_limits_rewrites(monkeypatch):
+    clock = {"now": 1000.0}
+    monkeypatch.setattr(app.time, "monotonic", lambda: clock["now"])
+    fallbacks = app.ReplyFallbacks(rewrites_per_minute=2)
+
+    assert fallbacks.allow_rewrite("rewrite_plain_text") is True
+    assert fallbacks.allow_rewrite("rewrite_general_answer") is True
+    assert fallbacks.allow_rewrite("rewrite_plain_text") is False
+    clock["now"] += 30
+    assert fallbacks.allow_rewrite("rewrite_plain_text") is True
+    stats = fallbacks.stats()
+    assert stats["rewrite_plain_text"] == 2
+    assert stats["rewrite_skipped_budget"] == 1
+    assert app.ReplyFallbacks(rewrites_per_minute=0).allow_rewrite("rewrite_plain_text") is False
+
+
+def test_structured_output_flag_adds_response_schema(monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "meeting_repo", make_repo(tmp_path))
+    monkeypatch.setattr(app, "BLACKBOX_STRUCTURED_OUTPUT", True)
+    payload = app.build_blackbox_payload("halo", "62812@s.whatsapp.net")
+    assert payload["response_format"]["json_schema"]["name"] == "hunky_reply"
+    monkeypatch.setattr(app, "BLACKBOX_STRUCTURED_OUTPUT", False)
+    assert "response_format" not in app.build_blackbox_payload("halo", "62812@s.whatsapp.net")
+
+
+def test_prompt_builder_caches_schedule_block_until_repo_write(tmp_path, monkeypatch):
+    repo = make_repo(tmp_path, auto_delete_after_hours=0)
+    monkeypatch.setattr(app, "meeting_repo", repo)
+    builder = app.SystemPromptBuilder()
+    starts_at = app.now_wib_naive() + timedelta(days=1)
+    repo.add(make_meeting("A@g.us", starts_at, "Kickoff"))
+
+    first = builder.build("A@g.us")
+    assert f"- {starts_at:%Y-%m-%d %H:%M} | Kickoff | lokasi: Online" in first
+    builder.build("A@g.us")
+    assert builder.stats()["block_renders"] == 1
+    assert builder.stats()["block_hits"] == 1
+
+    repo.add(make_meeting("A@g.us", starts_at + timedelta(hours=1), "Review"))
+    assert "Review" in builder.build("A@g.us")
+    assert builder.stats()["block_renders"] == 2
+
+    without = builder.build("A@g.us", include_schedule=False)
+    assert "DATABASE MEETING GROUP" not in without
+    assert len(without) < len(first)
+    assert builder.stats()["with_schedule"] == 3
+
+
+def test_needs_schedule_context_only_for_meeting_talk():
+    assert app.needs_schedule_context("hunky ada rapat apa minggu ini?") is True
+    assert app.needs_schedule_context("catat", {"intent": "meeting_flow"}) is True
+    assert app.needs_schedule_context("hunky bisa apa?", {"intent": "chat"}) is False
+
+
+def test_shared_ttl_cache_is_visible_across_instances(tmp_path, monkeypatch):
+    clock = {"now": 1000.0}
+    monkeypatch.setattr(app.time, "time", lambda: clock["now"])
+    path = str(tmp_path / "shared.sqlite3")
+    worker_a = app.SharedTTLCache(app.SharedStateStore(path), "drive_search", maxsize=2, ttl_seconds=10)
+    worker_b = app.SharedTTLCache(app.SharedStateStore(path), "drive_search", maxsize=2, ttl_seconds=10)
+
+    worker_a.set(("folder", "proposal"), [{"name": "Proposal.pdf"}])
+    assert worker_b.get(("folder", "proposal")) == [{"name": "Proposal.pdf"}]
+
+    clock["now"] += 1
+    worker_b.set(("folder", "laporan"), [])
+    clock["now"] += 1
+    worker_a.get(("folder", "proposal"))
+    clock["now"] += 1
+    worker_a.set(("other", "memo"), [])
+    assert worker_b.get(("folder", "laporan")) is None
+    assert worker_a.stats()["evictions"] == 1
+
+    assert worker_b.invalidate(lambda key: key[0] == "folder") == 1
+    assert worker_a.get(("folder", "proposal")) is None
+    clock["now"] += 11
+    assert worker_b.get(("other", "memo")) is None
+
+
+def test_shared_ttl_cache_reads_do_not_write_until_touch_is_stale(tmp_path, monkeypatch):
+    clock = {"now": 1000.0}
+    monkeypatch.setattr(app.time, "time", lambda: clock["now"])
+    store = app.SharedStateStore(str(tmp_path / "shared.sqlite3"))
+    cache = app.SharedTTLCache(store, "web_search", maxsize=8, ttl_seconds=100)
+    cache.set("q", "hasil")
+    writes = store._conn.total_changes
+
+    for _ in range(5):
+        clock["now"] += 1
+        assert cache.get("q") == "hasil"
+    assert store._conn.total_changes == writes
+
+    clock["now"] += 10
+    assert cache.get("q") == "hasil"
+    assert store._conn.total_changes == writes + 1
+
+
+def test_leader_election_allows_one_holder_and_hands_over(tmp_path):
+    lock_path = str(tmp_path / "leader.lock")
+    first = app.LeaderElection(lock_path, retry_seconds=0.01)
+    second = app.LeaderElection(lock_path, retry_seconds=0.01)
+    elected = threading.Event()
+
+    assert first.start(lambda: None) is True
+    assert second.start(elected.set) is False
+    assert second.is_leader is False
+
+    first.release()
+    assert elected.wait(1)
+    assert second.is_leader is True
+    second.release()
+
+
+def test_conversation_context_is_bounded_per_sender_and_in_sender_count():
+    store = app.ConversationContextStore(app.TTLCache(100, 600), max_turns=4, max_bytes=300, turn_max_chars=80)
+    for index in range(50000):
+        store.record(f"{index}@s.whatsapp.net", ("user", "halo"), ("assistant", "hai"))
+    assert store.stats()["size"] == 100
+    assert store.history("0@s.whatsapp.net") == []
+
+    sender = "62812@s.whatsapp.net"
+    store.remember_web_query(sender, "jadwal final futsal")
+    for index in range(10):
+        store.record(sender, ("user", f"pertanyaan {index} " + "x" * 200), ("assistant", f"jawaban {index}"))
+    history = store.history(sender)
+    assert len(history) <= 4
+    assert history[-1] == {"role": "assistant", "content": "jawaban 9"}
+    assert all(len(turn["content"]) <= 80 for turn in history)
+    assert len(store.cache.get(sender).encode("utf-8")) <= 300
+    assert store.last_web_query(sender) == "jadwal final futsal"
+    assert store.stats()["trimmed_turns"] > 0
+
+
+def test_conversation_context_updates_are_atomic_across_shared_workers(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+    workers = [
+        app.ConversationContextStore(
+            app.SharedTTLCache(app.SharedStateStore(path), "conversation", 100, 600),
+            max_turns=200,
+            max_bytes=65536,
+            turn_max_chars=80,
+        )
+        for _ in range(2)
+    ]
+
+    def chat(worker, prefix):
+        for index in range(20):
+            worker.record("A@g.us", ("user", f"{prefix}-{index}"))
+
+    threads = [threading.Thread(target=chat, args=(worker, f"w{n}")) for n, worker in enumerate(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    workers[1].remember_web_query("A@g.us", "final futsal")
+
+    history = workers[0].history("A@g.us")
+    assert len(history) == 40
+    assert workers[0].last_web_query("A@g.us") == "final futsal"
+
+
+def test_blackbox_payload_places_history_between_system_and_user(monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "meeting_repo", make_repo(tmp_path))
+    history = [{"role": "user", "content": "apa itu scrum?"}, {"role": "assistant", "content": "Kerangka kerja."}]
+    payload = app.build_blackbox_payload("contohnya?", "62812@s.whatsapp.net", history=history)
+    assert [message["role"] for message in payload["messages"]] == ["system", "user", "assistant", "user"]
+    assert payload["messages"][-1]["content"] == "contohnya?"
@@ -1,3 +1,7 @@
+import json
+import threading
+import time
+
 import app
 from pathlib import Path
 
@@ -5,6 +9,12 @@ from pathlib import Path
 def setup_repo(tmp_path, monkeypatch):
     repo = app.MeetingRepository(str(tmp_path / "jadwal_test.json"), retention_days=30)
     monkeypatch.setattr(app, "meeting_repo", repo)
+    monkeypatch.setattr(app, "llm_answer_cache", app.LlmAnswerCache(16, 600))
+    monkeypatch.setattr(
+        app,
+        "conversation_context",
+        app.ConversationContextStore(app.TTLCache(64, 600), max_turns=6, max_bytes=2048, turn_max_chars=400),
+    )
     return repo
 
 
@@ -181,7 +191,7 @@ def test_group_file_with_bot_hit_is_uploaded(tmp_path, monkeypatch):
     temp_file = tmp_path / "doc2.txt"
     temp_file.write_text("dummy")
 
-    def fake_upload(file_path, mime_type, custom_name=None, corr_id="-"):
+    def fake_upload(file_path, mime_type, custom_name=None, corr_id="-", force_new=False):
         Path(file_path).unlink(missing_ok=True)
         return "✅ File Disimpan!"
 
@@ -203,6 +213,45 @@ def test_group_file_with_bot_hit_is_uploaded(tmp_path, monkeypatch):
     assert resp.get_json()["reply"] == "✅ File Disimpan!"
 
 
+def test_large_file_upload_is_acknowledged_and_link_pushed_later(tmp_path, monkeypatch):
+    setup_repo(tmp_path, monkeypatch)
+    outbox = app.WaOutbox(str(tmp_path / "outbox.sqlite3"))
+    monkeypatch.setattr(app, "wa_outbox", outbox)
+    monkeypatch.setattr(app, "drive_uploader", app.DriveUploadWorker(max_workers=1))
+    monkeypatch.setattr(app, "DRIVE_UPLOAD_ASYNC_THRESHOLD_MB", 0)
+    client = app.app.test_client()
+
+    temp_file = tmp_path / "video.mp4"
+    temp_file.write_bytes(b"x" * 2048)
+
+    def fake_upload(file_path, mime_type, custom_name=None, corr_id="-", progress=None, **kwargs):
+        progress(2048, 2048, 0)
+        Path(file_path).unlink(missing_ok=True)
+        return "✅ File Disimpan!\n🔗 https://drive.example/big"
+
+    monkeypatch.setattr(app, "upload_ke_drive", fake_upload)
+
+    resp = client.post(
+        "/chat",
+        json={
+            "sender": "120363@g.us",
+            "message": "@hunky simpan video rapat",
+            "file_path": str(temp_file),
+            "mime_type": "video/mp4",
+            "bot_hit": True,
+            "message_id": "m-big",
+        },
+    )
+
+    body = resp.get_json()
+    assert body["status"] == "upload_queued"
+    app.drive_uploader._executor.shutdown(wait=True)
+    assert outbox.stats()["pending"] == 1
+    stats = app.drive_uploader.stats()
+    assert stats["completed"] == 1
+    assert stats["bytes_uploaded"] == 2048
+
+
 def test_chat_drive_no_access_reply_fallbacks_to_direct_drive_search(tmp_path, monkeypatch):
     setup_repo(tmp_path, monkeypatch)
 
@@ -447,3 +496,412 @@ def test_chat_general_question_rewrites_no_data_template_reply(tmp_path, monkeyp
 
     assert resp.status_code == 200
     assert "tetapkan 3 prioritas harian" in resp.get_json()["reply"]
+
+
+def test_chat_repeated_general_question_is_served_from_answer_cache(tmp_path, monkeypatch):
+    setup_repo(tmp_path, monkeypatch)
+    calls = []
+
+    def fake_ai(*args, **kwargs):
+        calls.append(args)
+        return "Hunky bisa mencatat meeting, mencari file Drive, dan mencari info di internet."
+
+    monkeypatch.setattr(app, "tanya_blackbox", fake_ai)
+    client = app.app.test_client()
+
+    for message in ["hunky bisa apa?", "Hunky, bisa apa", "@hunky bisa apa??"]:
+        resp = client.post("/chat", json={"sender": "62812@s.whatsapp.net", "message": message})
+        assert resp.get_json()["reply"].startswith("Hunky bisa mencatat meeting")
+
+    assert len(calls) == 1
+    assert app.llm_answer_cache.stats()["hits"] == 2
+
+
+def test_chat_action_replies_are_not_cached(tmp_path, monkeypatch):
+    setup_repo(tmp_path, monkeypatch)
+    calls = []
+
+    def fake_ai(*args, **kwargs):
+        calls.append(args)
+        return '{"action":"reset_schedule"}'
+
+    monkeypatch.setattr(app, "tanya_blackbox", fake_ai)
+    client = app.app.test_client()
+
+    for _ in range(2):
+        client.post("/chat", json={"sender": "62812@s.whatsapp.net", "message": "hunky hapus semua"})
+
+    assert len(calls) == 2
+
+
+def test_chat_schedule_questions_are_not_shared_between_groups(tmp_path, monkeypatch):
+    setup_repo(tmp_path, monkeypatch)
+    calls = []
+
+    def fake_ai(*args, **kwargs):
+        calls.append((kwargs.get("group_id"), kwargs.get("include_schedule")))
+        return f"Agenda untuk {kwargs.get('group_id')}"
+
+    monkeypatch.setattr(app, "tanya_blackbox", fake_ai)
+    client = app.app.test_client()
+
+    first = client.post("/chat", json={"sender": "A@g.us", "message": "hunky agenda kita apa saja?"})
+    second = client.post("/chat", json={"sender": "B@g.us", "message": "hunky agenda kita apa saja?"})
+
+    assert first.get_json()["reply"] == "Agenda untuk A@g.us"
+    assert second.get_json()["reply"] == "Agenda untuk B@g.us"
+    assert calls == [("A@g.us", True), ("B@g.us", True)]
+    assert app.llm_answer_cache.stats()["size"] == 0
+
+
+def test_chat_malformed_action_json_is_repaired_without_second_call(tmp_path, monkeypatch):
+    setup_repo(tmp_path, monkeypatch)
+    monkeypatch.setattr(app, "reply_fallbacks", app.ReplyFallbacks(rewrites_per_minute=0))
+    calls = []
+
+    def fake_ai(*args, **kwargs):
+        calls.append(args)
+        return "```json\n{'action': 'reset_schedule',}\n```"
+
+    monkeypatch.setattr(app, "tanya_blackbox", fake_ai)
+    client = app.app.test_client()
+
+    resp = client.post("/chat", json={"sender": "62812@s.whatsapp.net", "message": "hunky kosongkan semua"})
+
+    assert resp.get_json()["reply"] == "🗑️ Jadwal meeting grup ini telah direset."
+    assert len(calls) == 1
+    assert app.reply_fallbacks.stats()["json_repaired"] == 1
+
+
+def test_chat_skips_general_rewrite_when_budget_is_exhausted(tmp_path, monkeypatch):
+    setup_repo(tmp_path, monkeypatch)
+    monkeypatch.setattr(app, "reply_fallbacks", app.ReplyFallbacks(rewrites_per_minute=0))
+    calls = []
+
+    def fake_ai(*args, **kwargs):
+        calls.append(args)
+        return "Maaf, belum ada data terbaru tentang itu."
+
+    monkeypatch.setattr(app, "tanya_blackbox", fake_ai)
+    client = app.app.test_client()
+
+    resp = client.post("/chat", json={"sender": "62812@s.whatsapp.net", "message": "bagaimana cara fokus?"})
+
+    assert resp.get_json()["reply"] == "Maaf, belum ada data terbaru tentang itu."
+    assert len(calls) == 1
+    assert app.reply_fallbacks.stats()["rewrite_skipped_budget"] == 1
+
+
+def test_chat_web_lookup_prompt_skips_schedule_block(tmp_path, monkeypatch):
+    setup_repo(tmp_path, monkeypatch)
+    monkeypatch.setattr(app, "cari_di_internet", lambda query, corr_id="-": "- Final: Sabtu")
+    seen = []
+
+    def fake_ai(*args, **kwargs):
+        seen.append(kwargs.get("include_schedule", True))
+        return "Finalnya hari Sabtu."
+
+    monkeypatch.setattr(app, "tanya_blackbox", fake_ai)
+    client = app.app.test_client()
+
+    client.post("/chat", json={"sender": "62812@s.whatsapp.net", "message": "cari info final futsal di internet"})
+
+    assert seen == [False]
+
+
+def wait_for_job(client, job_id, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/chat/jobs/{job_id}").get_json()
+        if job["state"] not in {"queued", "running"}:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_async_chat_returns_job_id_and_pushes_reply_through_outbox(tmp_path, monkeypatch):
+    setup_repo(tmp_path, monkeypatch)
+    outbox = app.WaOutbox(str(tmp_path / "outbox.sqlite3"))
+    monkeypatch.setattr(app, "wa_outbox", outbox)
+    monkeypatch.setattr(app, "chat_jobs", app.ChatJobQueue(max_workers=2, max_queued=4))
+    monkeypatch.setattr(app, "tanya_blackbox", lambda *args, **kwargs: "Halo, ada yang bisa dibantu?")
+    client = app.app.test_client()
+
+    resp = client.post(
+        "/chat",
+        json={"sender": "62812@s.whatsapp.net", "message": "hunky halo", "message_id": "a-1", "async": True},
+    )
+
+    assert resp.status_code == 202
+    job = wait_for_job(client, resp.get_json()["job_id"])
+    assert job["state"] == "done"
+    assert job["result_status"] == "replied"
+    rows = outbox._claim_due(10)
+    assert [(row["target_id"], row["message"], row["idempotency_key"]) for row in rows] == [
+        ("62812@s.whatsapp.net", "Halo, ada yang bisa dibantu?", "chat:a-1")
+    ]
+
+
+def test_async_chat_runs_a_retried_message_id_once(tmp_path, monkeypatch):
+    setup_repo(tmp_path, monkeypatch)
+    outbox = app.WaOutbox(str(tmp_path / "outbox.sqlite3"))
+    monkeypatch.setattr(app, "wa_outbox", outbox)
+    monkeypatch.setattr(app, "chat_jobs", app.ChatJobQueue(max_workers=2, max_queued=4))
+    release = threading.Event()
+    calls = []
+    monkeypatch.setattr(app, "tanya_blackbox", lambda *args, **kwargs: calls.append(args) or release.wait(2) and "ok")
+    client = app.app.test_client()
+    payload = {"sender": "62812@s.whatsapp.net", "message": "hunky halo", "message_id": "dup-1", "async": True}
+
+    first = client.post("/chat", json=payload)
+    second = client.post("/chat", json=payload)
+    release.set()
+
+    assert second.status_code == 202
+    assert second.get_json() == {"status": "duplicate", "job_id": first.get_json()["job_id"]}
+    wait_for_job(client, first.get_json()["job_id"])
+
+    # Setelah riwayat job hilang (mis. proses restart), outbox_sent tetap mencegah job kedua.
+    monkeypatch.setattr(app, "chat_jobs", app.ChatJobQueue(max_workers=2, max_queued=4))
+    third = client.post("/chat", json=payload)
+
+    assert third.get_json()["status"] == "duplicate"
+    assert len(calls) == 1
+    assert app.chat_jobs.stats()["duplicates"] == 1
+
+
+def test_async_chat_job_and_dedup_are_shared_across_workers(tmp_path, monkeypatch):
+    setup_repo(tmp_path, monkeypatch)
+    monkeypatch.setattr(app, "wa_outbox", app.WaOutbox(str(tmp_path / "outbox.sqlite3")))
+    path = str(tmp_path / "shared.sqlite3")
+    worker_a = app.ChatJobQueue(2, 4, registry=app.SharedTTLCache(app.SharedStateStore(path), "chat_jobs", 100, 600))
+    worker_b = app.ChatJobQueue(2, 4, registry=app.SharedTTLCache(app.SharedStateStore(path), "chat_jobs", 100, 600))
+    release = threading.Event()
+    calls = []
+    monkeypatch.setattr(app, "tanya_blackbox", lambda *args, **kwargs: calls.append(args) or release.wait(2) and "ok")
+    client = app.app.test_client()
+    payload = {"sender": "62812@s.whatsapp.net", "message": "hunky halo", "message_id": "dup-2", "async": True}
+
+    monkeypatch.setattr(app, "chat_jobs", worker_a)
+    first = client.post("/chat", json=payload)
+    # Retry event WA mendarat di worker lain selagi job pertama masih berjalan.
+    monkeypatch.setattr(app, "chat_jobs", worker_b)
+    second = client.post("/chat", json=payload)
+    job_id = first.get_json()["job_id"]
+
+    assert second.get_json() == {"status": "duplicate", "job_id": job_id}
+    assert [job["id"] for job in client.get("/chat/jobs").get_json()["jobs"]] == [job_id]
+    release.set()
+    assert wait_for_job(client, job_id)["state"] == "done"
+    assert len(calls) == 1
+    assert worker_b.active() == []
+
+
+def test_async_chat_without_message_id_dedupes_in_flight_repeats(tmp_path, monkeypatch):
+    setup_repo(tmp_path, monkeypatch)
+    monkeypatch.setattr(app, "wa_outbox", app.WaOutbox(str(tmp_path / "outbox.sqlite3")))
+    monkeypatch.setattr(app, "chat_jobs", app.ChatJobQueue(max_workers=2, max_queued=4))
+    release = threading.Event()
+    monkeypatch.setattr(app, "tanya_blackbox", lambda *args, **kwargs: release.wait(2) and "ok")
+    client = app.app.test_client()
+    payload = {"sender": "62812@s.whatsapp.net", "message": "hunky halo", "async": True}
+
+    first = client.post("/chat", json=payload)
+    second = client.post("/chat", json=payload)
+    release.set()
+    wait_for_job(client, first.get_json()["job_id"])
+    third = client.post("/chat", json=payload)
+
+    assert second.get_json() == {"status": "duplicate", "job_id": first.get_json()["job_id"]}
+    assert third.get_json()["status"] == "queued"
+    wait_for_job(client, third.get_json()["job_id"])
+
+
+def test_async_chat_rejects_when_queue_is_full(tmp_path, monkeypatch):
+    setup_repo(tmp_path, monkeypatch)
+    monkeypatch.setattr(app, "wa_outbox", app.WaOutbox(str(tmp_path / "outbox.sqlite3")))
+    monkeypatch.setattr(app, "chat_jobs", app.ChatJobQueue(max_workers=1, max_queued=0))
+    release = threading.Event()
+    monkeypatch.setattr(app, "tanya_blackbox", lambda *args, **kwargs: release.wait(2) and "ok")
+    client = app.app.test_client()
+    payload = {"sender": "62812@s.whatsapp.net", "message": "hunky halo", "async": True}
+
+    first = client.post("/chat", json=payload)
+    second = client.post("/chat", json={**payload, "message": "hunky apa kabar"})
+    assert client.get("/chat/jobs").get_json()["jobs"][0]["id"] == first.get_json()["job_id"]
+    release.set()
+
+    assert first.status_code == 202
+    assert second.status_code == 503
+    assert second.get_json()["error_code"] == "QUEUE_FULL"
+    wait_for_job(client, first.get_json()["job_id"])
+    assert app.chat_jobs.stats()["rejected"] == 1
+
+
+def test_async_chat_answers_untriggered_group_message_inline(tmp_path, monkeypatch):
+    setup_repo(tmp_path, monkeypatch)
+    client = app.app.test_client()
+
+    resp = client.post("/chat", json={"sender": "120363@g.us", "message": "makan siang dimana", "async": True})
+
+    assert resp.status_code == 200
+    assert resp.get_json() == {"status": "ignored_text"}
+
+
+def test_metrics_endpoint_reports_wa_push_stats(tmp_path, monkeypatch):
+    setup_repo(tmp_path, monkeypatch)
+    client = app.app.test_client()
+
+    resp = client.get("/metrics")
+
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert "batches" in body["wa_push"]
+    assert "pending" in body["wa_outbox"]
+
+
+def test_outbox_dead_letters_endpoint(tmp_path, monkeypatch):
+    setup_repo(tmp_path, monkeypatch)
+    outbox = app.WaOutbox(str(tmp_path / "outbox.sqlite3"), max_attempts=1)
+    monkeypatch.setattr(app, "wa_outbox", outbox)
+    monkeypatch.setattr(app, "post_wa_message", lambda target_id, message: (False, "HTTP 500: boom"))
+    outbox.enqueue("120363@g.us", "Reminder gagal", idempotency_key="reminder:x")
+    outbox.drain_once()
+    client = app.app.test_client()
+
+    resp = client.get("/outbox/dead-letters")
+
+    assert resp.status_code == 200
+    assert resp.get_json()["dead_letters"][0]["message"] == "Reminder gagal"
+
+
+def parse_sse(body):
+    events = []
+    for raw in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in raw.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_chat_stream_relays_sentence_chunks(tmp_path, monkeypatch):
+    setup_repo(tmp_path, monkeypatch)
+    monkeypatch.setattr(app, "CHAT_STREAM_MIN_CHUNK_CHARS", 5)
+
+    def fake_stream(*args, **kwargs):
+        yield from ["Halo! ", "Saya Hunky. ", "Ada yang bisa dibantu?"]
+
+    monkeypatch.setattr(app, "tanya_blackbox_stream", fake_stream)
+    client = app.app.test_client()
+
+    resp = client.post("/chat/stream", json={"sender": "62812@s.whatsapp.net", "message": "halo", "message_id": "s-1"})
+
+    assert resp.mimetype == "text/event-stream"
+    events = parse_sse(resp.get_data(as_text=True))
+    assert [data["text"] for event, data in events if event == "chunk"] == [
+        "Halo! ",
+        "Saya Hunky. ",
+        "Ada yang bisa dibantu?",
+    ]
+    assert events[-1][0] == "done"
+    assert events[-1][1]["reply"] == "Halo! Saya Hunky. Ada yang bisa dibantu?"
+
+
+def test_chat_stream_buffers_json_actions_through_regular_pipeline(tmp_path, monkeypatch):
+    setup_repo(tmp_path, monkeypatch)
+
+    def fake_stream(*args, **kwargs):
+        yield from ["  ", '{"action":', '"reset_schedule"}']
+
+    monkeypatch.setattr(app, "tanya_blackbox_stream", fake_stream)
+    client = app.app.test_client()
+
+    resp = client.post("/chat/stream", json={"sender": "62812@s.whatsapp.net", "message": "halo", "message_id": "s-2"})
+
+    events = parse_sse(resp.get_data(as_text=True))
+    assert [event for event, _ in events] == ["chunk", "done"]
+    assert events[0][1]["text"] == "🗑️ Jadwal meeting grup ini telah direset."
+
+
+def test_chat_stream_runs_final_checks_and_does_not_cache_corrected_prose(tmp_path, monkeypatch):
+    setup_repo(tmp_path, monkeypatch)
+
+    def fake_stream(*args, **kwargs):
+        yield from ["Maaf, belum ada data terbaru soal itu."]
+
+    monkeypatch.setattr(app, "tanya_blackbox_stream", fake_stream)
+    monkeypatch.setattr(app, "rewrite_as_general_assistant_answer", lambda *args, **kwargs: "Jawaban umum yang lebih baik.")
+    client = app.app.test_client()
+
+    resp = client.post("/chat/stream", json={"sender": "62812@s.whatsapp.net", "message": "halo", "message_id": "s-3"})
+
+    events = parse_sse(resp.get_data(as_text=True))
+    assert events[-1] == (
+        "done",
+        {**events[-1][1], "reply": "Jawaban umum yang lebih baik.", "corrected": True},
+    )
+    assert app.llm_answer_cache.stats()["size"] == 0
+
+
+def test_chat_stream_failure_is_reported_and_partial_reply_not_cached(tmp_path, monkeypatch):
+    setup_repo(tmp_path, monkeypatch)
+    monkeypatch.setattr(app, "CHAT_STREAM_MIN_CHUNK_CHARS", 5)
+
+    def broken_stream(*args, **kwargs):
+        yield "Scrum adalah kerangka kerja agile. "
+        yield "Ia memakai sprint"
+        raise ConnectionError("reset by peer")
+
+    monkeypatch.setattr(app, "tanya_blackbox_stream", broken_stream)
+    monkeypatch.setattr(app, "tanya_blackbox", lambda *args, **kwargs: "Jawaban lengkap.")
+    client = app.app.test_client()
+
+    resp = client.post("/chat/stream", json={"sender": "62812@s.whatsapp.net", "message": "hunky apa itu scrum"})
+
+    done = parse_sse(resp.get_data(as_text=True))[-1][1]
+    assert done["reply"] == "Scrum adalah kerangka kerja agile. Ia memakai sprint"
+    assert done["error"] == "reset by peer"
+    assert app.llm_answer_cache.stats()["size"] == 0
+    other = client.post("/chat", json={"sender": "62899@s.whatsapp.net", "message": "hunky apa itu scrum"})
+    assert other.get_json()["reply"] == "Jawaban lengkap."
+
+
+def test_chat_stream_delegates_non_chat_intents_to_regular_pipeline(tmp_path, monkeypatch):
+    setup_repo(tmp_path, monkeypatch)
+    client = app.app.test_client()
+
+    resp = client.post("/chat/stream", json={"message": "halo"})
+
+    events = parse_sse(resp.get_data(as_text=True))
+    assert events == [("done", {"error_code": "BAD_REQUEST", "error": "sender wajib diisi", "status_code": 400})]
+
+
+def test_chat_sends_history_only_for_messages_that_refer_back(tmp_path, monkeypatch):
+    setup_repo(tmp_path, monkeypatch)
+    calls = []
+
+    def fake_ai(*args, **kwargs):
+        calls.append(kwargs.get("history"))
+        return f"Jawaban ke-{len(calls)}"
+
+    monkeypatch.setattr(app, "tanya_blackbox", fake_ai)
+    client = app.app.test_client()
+    sender = "62812@s.whatsapp.net"
+
+    client.post("/chat", json={"sender": sender, "message": "apa itu scrum?"})
+    resp = client.post("/chat", json={"sender": sender, "message": "hunky rangkum dong"})
+    # Sender lain dengan pesan sama tidak boleh menerima rangkuman percakapan sender pertama.
+    other = client.post("/chat", json={"sender": "62899@s.whatsapp.net", "message": "hunky rangkum dong"})
+    # Pertanyaan mandiri dari sender yang sedang bercakap tetap dijawab dari cache, tanpa riwayat.
+    repeat = client.post("/chat", json={"sender": sender, "message": "apa itu scrum"})
+
+    assert resp.get_json()["reply"] == "Jawaban ke-2"
+    assert other.get_json()["reply"] == "Jawaban ke-3"
+    assert repeat.get_json()["reply"] == "Jawaban ke-1"
+    assert calls[0] == []
+    assert calls[1] == [
+        {"role": "user", "content": "apa itu scrum?"},
+        {"role": "assistant", "content": "Jawaban ke-1"},
+    ]
+    assert calls[2] == []
+    assert len(calls) == 3
+    assert app.llm_answer_cache.stats()["size"] == 1
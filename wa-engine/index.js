@@ -24,6 +24,11 @@ const PYTHON_CHAT_URL = process.env.PYTHON_CHAT_URL || 'http://127.0.0.1:5000/ch
 const WA_AUTH_DIR = process.env.WA_AUTH_DIR || 'auth_session';
 const WA_PORT = Number(process.env.WA_PORT || 3000);
 const PYTHON_TIMEOUT_MS = Number(process.env.PYTHON_TIMEOUT_MS || 60000); // Naikkan timeout biar aman
+// Mode stream: kalimat pertama dikirim begitu siap, sisanya menyusul saat jawaban selesai
+const PYTHON_CHAT_STREAM = String(process.env.PYTHON_CHAT_STREAM || 'false').toLowerCase() === 'true';
+const PYTHON_CHAT_STREAM_URL = process.env.PYTHON_CHAT_STREAM_URL || `${PYTHON_CHAT_URL}/stream`;
+// Mode async: Python langsung balas 202 + job_id, jawaban dikirim belakangan lewat /send-message
+const PYTHON_CHAT_ASYNC = String(process.env.PYTHON_CHAT_ASYNC || 'false').toLowerCase() === 'true';
 
 let currentSocket = null;
 let isWaConnected = false;
@@ -100,6 +105,65 @@ async function downloadAndSave(msgObject, type) {
     }
 }
 
+function parseSseEvent(raw) {
+    const event = (raw.match(/^event: (.*)$/m) || [])[1];
+    const data = (raw.match(/^data: (.*)$/m) || [])[1];
+    if (!event || !data) return null;
+    return { event, data: JSON.parse(data) };
+}
+
+async function relayStreamedReply(sock, sender, payload) {
+    // Presence "mengetik" baru dikirim setelah chunk pertama: sebelum itu Python belum tentu menjawab
+    // (pesan grup tanpa trigger), dan bot tidak boleh terlihat mengetik di grup untuk pesan yang diabaikan.
+    const response = await axios.post(PYTHON_CHAT_STREAM_URL, payload, {
+        timeout: PYTHON_TIMEOUT_MS,
+        responseType: 'stream',
+    });
+
+    let buffer = '';
+    let firstSent = false;
+    let firstText = '';
+    let rest = '';
+    let done = null;
+    for await (const piece of response.data) {
+        buffer += piece.toString('utf8');
+        let sep;
+        while ((sep = buffer.indexOf('\n\n')) !== -1) {
+            const parsed = parseSseEvent(buffer.slice(0, sep));
+            buffer = buffer.slice(sep + 2);
+            if (!parsed) continue;
+            if (parsed.event === 'done') {
+                done = parsed.data;
+            } else if (!firstSent && parsed.data.text.trim()) {
+                firstText = parsed.data.text.trim();
+                await sock.sendMessage(sender, { text: firstText });
+                firstSent = true;
+                logger.info('✅ Kalimat pertama terkirim ke WA');
+                await sock.sendPresenceUpdate('composing', sender).catch(() => {});
+            } else {
+                rest += parsed.data.text;
+            }
+        }
+    }
+
+    if (firstSent) {
+        await sock.sendPresenceUpdate('paused', sender).catch(() => {});
+    }
+    if (!firstSent && done?.reply) {
+        await sock.sendMessage(sender, { text: done.reply });
+    } else if (done?.corrected && done.reply) {
+        // Pemeriksaan akhir di Python mengganti jawaban: kirim versi koreksi, bukan sisa stream lama.
+        const corrected = done.reply.trim();
+        const remainder = corrected.startsWith(firstText) ? corrected.slice(firstText.length).trim() : corrected;
+        if (remainder) {
+            await sock.sendMessage(sender, { text: remainder });
+        }
+    } else if (rest.trim()) {
+        await sock.sendMessage(sender, { text: rest.trim() });
+    }
+    return done;
+}
+
 app.get('/health', (_req, res) => {
     return res.status(isWaConnected ? 200 : 503).json({
         status: isWaConnected ? 'ok' : 'degraded',
@@ -236,25 +300,32 @@ async function connectToWhatsApp() {
             botHit: botHit 
         });
 
+        const payload = {
+            sender,
+            message: textMessage || '',
+            file_path: targetFile ? targetFile.path : null,
+            mime_type: targetFile ? targetFile.mime : null,
+            file_source: fileSource,
+            bot_hit: botHit, // Ini kunci agar Python memproses di grup
+            message_id: messageId,
+            async: PYTHON_CHAT_ASYNC,
+        };
+
         try {
-            const response = await axios.post(
-                PYTHON_CHAT_URL,
-                {
-                    sender,
-                    message: textMessage || '',
-                    file_path: targetFile ? targetFile.path : null,
-                    mime_type: targetFile ? targetFile.mime : null,
-                    file_source: fileSource,
-                    bot_hit: botHit, // Ini kunci agar Python memproses di grup
-                    message_id: messageId,
-                },
-                { timeout: PYTHON_TIMEOUT_MS },
-            );
+            if (PYTHON_CHAT_STREAM && !targetFile) {
+                const done = await relayStreamedReply(sock, sender, payload);
+                logger.info({ first_chunk_ms: done?.first_chunk_ms, total_ms: done?.total_ms }, '✅ Balasan stream selesai');
+                return;
+            }
+
+            const response = await axios.post(PYTHON_CHAT_URL, payload, { timeout: PYTHON_TIMEOUT_MS });
 
             // Jika Python membalas ada reply, kirim ke WA
             if (response.data?.reply) {
                 await sock.sendMessage(sender, { text: response.data.reply });
                 logger.info("✅ Balasan terkirim ke WA");
+            } else if (response.status === 202) {
+                logger.info({ job_id: response.data?.job_id }, "⏳ Pesan diantrekan, balasan menyusul via /send-message");
             } else if (response.data?.status === 'ignored_file') {
                 logger.warn("⚠️ Python mengabaikan file (Trigger/Keyword tidak cocok)");
             }
@@ -0,0 +1,6 @@
+# Entry point produksi: gunicorn -c gunicorn.conf.py wsgi:application
+# Tiap worker memanggil bootstrap(); hanya pemegang leader lock yang menjalankan scheduler & index Drive.
+from app import app as application
+from app import bootstrap
+
+bootstrap()